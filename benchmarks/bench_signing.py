@@ -0,0 +1,185 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+"""Benchmark of the VNPay signing engine against the former string concatenation loops.
+
+The engine only depends on the standard library, so this script runs without Odoo:
+
+    python benchmarks/bench_signing.py --messages 10000 --json bench_output.json
+"""
+
+import argparse
+import hashlib
+import hmac
+import importlib.util
+import json
+import os
+import time
+import urllib.parse
+
+UTILS_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), os.pardir, "payment_vnpay", "utils.py"
+)
+SECRET = "ZXCVBNMASDFGHJKLQWERTYUIOP123456"
+
+
+def _load_utils():
+    spec = importlib.util.spec_from_file_location("vnpay_utils", UTILS_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+_UTILS = _load_utils()
+
+
+def _legacy_hmacsha512(key, data):
+    byteKey = key.encode("utf-8")
+    byteData = data.encode("utf-8")
+    return hmac.new(byteKey, byteData, hashlib.sha512).hexdigest()
+
+
+def legacy_sign(params, secret_key):
+    """The loop formerly used by `PaymentProviderVNPay._get_payment_url`."""
+    inputData = sorted(params.items())
+    queryString = ""
+    seq = 0
+    for key, val in inputData:
+        if seq == 1:
+            queryString = (
+                queryString + "&" + key + "=" + urllib.parse.quote_plus(str(val))
+            )
+        else:
+            seq = 1
+            queryString = key + "=" + urllib.parse.quote_plus(str(val))
+    return queryString, _legacy_hmacsha512(secret_key, queryString)
+
+
+def legacy_verify(data, secret_key):
+    """The loop formerly used by `VNPayController._verify_notification_signature`."""
+    data = dict(data)
+    receive_signature = data.pop("vnp_SecureHash", None)
+    data.pop("vnp_SecureHashType", None)
+    inputData = sorted(data.items())
+    hasData = ""
+    seq = 0
+    for key, val in inputData:
+        if str(key).startswith("vnp_"):
+            if seq == 1:
+                hasData = (
+                    hasData + "&" + str(key) + "=" + urllib.parse.quote_plus(str(val))
+                )
+            else:
+                seq = 1
+                hasData = str(key) + "=" + urllib.parse.quote_plus(str(val))
+    return hmac.compare_digest(receive_signature, _legacy_hmacsha512(secret_key, hasData))
+
+
+def _make_payment_params(index):
+    return {
+        "vnp_Version": "2.1.1",
+        "vnp_Command": "pay",
+        "vnp_TmnCode": "DEMOV210",
+        "vnp_Amount": 1000000 + index * 100,
+        "vnp_CreateDate": "20241017120000",
+        "vnp_CurrCode": "VND",
+        "vnp_IpAddr": "127.0.0.1",
+        "vnp_Locale": "vn",
+        "vnp_OrderInfo": f"Thanh toan don hang S{index:05d} voi so tien la {10000 + index} VND",
+        "vnp_OrderType": "billpayment",
+        "vnp_ReturnUrl": "https://shop.example.com/payment/vnpay/return",
+        "vnp_ExpireDate": "20241017123000",
+        "vnp_TxnRef": f"S{index:05d}",
+    }
+
+
+def _make_notification(index, signer):
+    data = {
+        "vnp_Amount": str(1000000 + index * 100),
+        "vnp_BankCode": "NCB",
+        "vnp_BankTranNo": f"VNP{14000000 + index}",
+        "vnp_CardType": "ATM",
+        "vnp_OrderInfo": f"Thanh toan don hang S{index:05d}",
+        "vnp_PayDate": "20241017120512",
+        "vnp_ResponseCode": "00",
+        "vnp_TmnCode": "DEMOV210",
+        "vnp_TransactionNo": str(14000000 + index),
+        "vnp_TransactionStatus": "00",
+        "vnp_TxnRef": f"S{index:05d}",
+        "vnp_SecureHashType": "HmacSHA512",
+    }
+    data["vnp_SecureHash"] = signer.sign(_UTILS.canonicalize(data, prefix="vnp_"))
+    return data
+
+
+def _measure(label, func, items, repeat):
+    best = None
+    for _run in range(repeat):
+        start = time.perf_counter()
+        func(items)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return {
+        "name": label,
+        "messages": len(items),
+        "total_s": best,
+        "per_message_us": best / len(items) * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="Write the results to this file as JSON.")
+    args = parser.parse_args()
+
+    signer = _UTILS.get_signer(SECRET)
+    payment_params = [_make_payment_params(i) for i in range(args.messages)]
+    notifications = [_make_notification(i, signer) for i in range(args.messages)]
+
+    # The engine must produce exactly what the former loops produced.
+    for params, data in zip(payment_params[:100], notifications[:100]):
+        assert signer.sign_params(params) == legacy_sign(params, SECRET)
+        assert signer.verify(data) and legacy_verify(data, SECRET)
+
+    results = [
+        _measure(
+            "sign/legacy",
+            lambda items: [legacy_sign(p, SECRET) for p in items],
+            payment_params,
+            args.repeat,
+        ),
+        _measure(
+            "sign/engine",
+            lambda items: [_UTILS.get_signer(SECRET).sign_params(p) for p in items],
+            payment_params,
+            args.repeat,
+        ),
+        _measure("sign/engine_batch", signer.sign_many, payment_params, args.repeat),
+        _measure(
+            "verify/legacy",
+            lambda items: [legacy_verify(d, SECRET) for d in items],
+            notifications,
+            args.repeat,
+        ),
+        _measure(
+            "verify/engine",
+            lambda items: [_UTILS.get_signer(SECRET).verify(d) for d in items],
+            notifications,
+            args.repeat,
+        ),
+        _measure("verify/engine_batch", signer.verify_many, notifications, args.repeat),
+    ]
+
+    for result in results:
+        print(
+            f"{result['name']:<22} {result['per_message_us']:8.2f} us/message"
+            f"  ({result['messages']} messages in {result['total_s']:.3f}s)"
+        )
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
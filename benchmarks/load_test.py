@@ -0,0 +1,320 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+"""Load-testing tools: a local stand-in for VNPay and a replayer of signed IPNs.
+
+The tools only depend on the standard library, so they run next to any Odoo server:
+
+    # Serve the VNPay payment page, VNPay-QR create and querydr APIs on port 8070, answering in
+    # 200ms and failing 1% of the requests; set the URLs of the providers to this server.
+    python benchmarks/load_test.py gateway --port 8070 --latency 0.2 --error-rate 0.01
+
+    # Send 5000 e-commerce and POS IPNs to Odoo from 32 threads, 10% of them twice and 20% of them
+    # out of order, and report the latency per endpoint and response code.
+    python benchmarks/load_test.py replay --odoo-url http://localhost:8069 --count 5000 \\
+        --concurrency 32 --duplicate-rate 0.1 --out-of-order-rate 0.2 --json load_output.json
+
+The replayer signs the e-commerce IPNs with the hash secret (`vnp_SecureHash`) and the POS IPNs
+with the VNPay-QR secret key (`checksum`), as VNPay does. The references and txnIds are read from
+files, one `reference,amount` per line, or generated, in which case Odoo answers that the order is
+not found after checking the signature.
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+ROOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+UTILS_PATH = os.path.join(ROOT_PATH, "payment_vnpay", "utils.py")
+STUB_PATH = os.path.join(ROOT_PATH, "payment_vnpay", "tests", "vnpay_stub.py")
+
+PAYMENT_PAGE_PATH = "/paymentv2/vpcpay.html"
+ECOMMERCE_IPN_PATH = "/payment/vnpay/webhook"
+POS_IPN_PATH = "/pos/vnpay/webhook"
+
+
+def _load_module(name, path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+_UTILS = _load_module("vnpay_utils", UTILS_PATH)
+_STUB = _load_module("vnpay_stub", STUB_PATH)
+
+
+# Gateway
+
+
+def run_gateway(args):
+    """Serve the stand-in for VNPay until interrupted."""
+    stub = _STUB.VNPayStubServer(
+        qr_secret=args.qr_secret,
+        hash_secret=args.hash_secret,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        host=args.host,
+        port=args.port,
+    )
+    signer = _UTILS.get_signer(args.hash_secret)
+
+    def handle_payment_page(params):
+        """Check the signature of a payment URL, as the payment page of VNPay does."""
+        if not signer.verify(params):
+            return 400, {"RspCode": "97", "Message": "Invalid Checksum"}
+        return 200, {"RspCode": "00", "Message": "Confirm Success"}
+
+    stub.route("GET", PAYMENT_PAGE_PATH, handle_payment_page)
+    stub.start()
+    print(f"Payment page:    {stub.url}{PAYMENT_PAGE_PATH}")
+    print(f"VNPay-QR create: {stub.url}{_STUB.QR_CREATE_PATH}")
+    print(f"Querydr:         {stub.url}{_STUB.QUERYDR_PATH}")
+    try:
+        while True:
+            time.sleep(60)
+            print(f"{len(stub.requests)} requests served.")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub.stop()
+
+
+# IPN replayer
+
+
+def _read_references(path, prefix, count, amount):
+    """Return the (reference, amount) pairs of the file, or `count` generated ones."""
+    if path:
+        with open(path) as references_file:
+            rows = [line.strip().split(",") for line in references_file if line.strip()]
+        return [(row[0], int(float(row[1])) if len(row) > 1 else amount) for row in rows]
+    return [(f"{prefix}{index}", amount) for index in range(count)]
+
+
+def make_ecommerce_ipn(reference, amount, transaction_no, args):
+    """Return the query string of an e-commerce IPN, signed with the hash secret."""
+    data = {
+        "vnp_Amount": str(amount * 100),
+        "vnp_BankCode": "NCB",
+        "vnp_BankTranNo": f"VNP{transaction_no}",
+        "vnp_CardType": "ATM",
+        "vnp_OrderInfo": f"Thanh toan don hang {reference}",
+        "vnp_PayDate": datetime.now().strftime("%Y%m%d%H%M%S"),
+        "vnp_ResponseCode": "00",
+        "vnp_TmnCode": args.tmn_code,
+        "vnp_TransactionNo": str(transaction_no),
+        "vnp_TransactionStatus": "00",
+        "vnp_TxnRef": reference,
+    }
+    data["vnp_SecureHash"] = _UTILS.get_signer(args.hash_secret).sign(
+        _UTILS.canonicalize(data, prefix="vnp_")
+    )
+    return urllib.parse.urlencode(data)
+
+
+def make_pos_ipn(txn_id, amount, qr_trace, args):
+    """Return the JSON body of a POS IPN, signed with the VNPay-QR secret key."""
+    data = {
+        "code": "00",
+        "message": "Tru tien thanh cong",
+        "msgType": "1",
+        "txnId": txn_id,
+        "qrTrace": str(qr_trace),
+        "bankCode": "NCB",
+        "mobile": "0912345678",
+        "accountNo": "",
+        "amount": str(amount),
+        "payDate": datetime.now().strftime("%Y%m%d%H%M%S"),
+        "merchantCode": args.merchant_code,
+        "terminalId": args.terminal_id,
+    }
+    data["checksum"] = _STUB.md5_checksum(
+        data["code"],
+        data["msgType"],
+        data["txnId"],
+        data["qrTrace"],
+        data["bankCode"],
+        data["mobile"],
+        data["accountNo"],
+        data["amount"],
+        data["payDate"],
+        data["merchantCode"],
+        args.qr_secret,
+    )
+    return json.dumps(data)
+
+
+def build_requests(args):
+    """Return the IPN requests to send, as (endpoint, method, url, body) tuples, in sending order.
+
+    The IPNs of both endpoints are interleaved in the order of the files. The duplicates are
+    VNPay's retries of the same IPN, sent again later; the requests are then swapped with a random
+    later one at the out-of-order rate.
+    """
+    requests = []
+    if args.ecommerce:
+        references = _read_references(
+            args.references, "LOADTEST-", args.count, args.amount
+        )
+        for index, (reference, amount) in enumerate(references):
+            query = make_ecommerce_ipn(reference, amount, 20000000 + index, args)
+            url = f"{args.odoo_url}{ECOMMERCE_IPN_PATH}?{query}"
+            requests.append((index, ("ecommerce", "GET", url, None)))
+    if args.pos:
+        txn_ids = _read_references(args.txn_ids, "", args.count, args.amount)
+        for index, (txn_id, amount) in enumerate(txn_ids):
+            body = make_pos_ipn(txn_id, amount, 30000000 + index, args)
+            requests.append((index, ("pos", "POST", f"{args.odoo_url}{POS_IPN_PATH}", body)))
+    requests = [request for _index, request in sorted(requests, key=lambda item: item[0])]
+
+    rng = random.Random(args.seed)
+    requests += [request for request in requests if rng.random() < args.duplicate_rate]
+    for index in range(len(requests)):
+        if rng.random() < args.out_of_order_rate:
+            other = rng.randrange(index, len(requests))
+            requests[index], requests[other] = requests[other], requests[index]
+    return requests
+
+
+def send_request(endpoint, method, url, body, timeout):
+    """Send an IPN and return (endpoint, response code, duration in seconds)."""
+    headers = {"Content-Type": "application/json"} if body else {}
+    request = urllib.request.Request(
+        url, data=body.encode() if body else None, method=method, headers=headers
+    )
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            payload = response.read()
+            status = response.status
+    except urllib.error.HTTPError as error:
+        return endpoint, f"HTTP {error.code}", time.perf_counter() - start
+    except (urllib.error.URLError, OSError) as error:
+        return endpoint, type(error).__name__, time.perf_counter() - start
+    duration = time.perf_counter() - start
+    try:
+        result = json.loads(payload or b"{}")
+        code = result.get("RspCode") or result.get("code")
+    except (ValueError, AttributeError):
+        code = None
+    return endpoint, code or f"HTTP {status}", duration
+
+
+def percentile(durations, rank):
+    """Return the nearest-rank percentile of the sorted durations."""
+    index = max(0, min(len(durations) - 1, round(rank / 100 * len(durations) + 0.5) - 1))
+    return durations[index]
+
+
+def summarize(results, elapsed):
+    """Return the throughput and latency percentiles per endpoint and response code."""
+    groups = defaultdict(list)
+    for endpoint, code, duration in results:
+        groups[(endpoint, "all")].append(duration)
+        groups[(endpoint, code)].append(duration)
+    summary = []
+    for (endpoint, code), durations in sorted(groups.items()):
+        durations.sort()
+        summary.append(
+            {
+                "endpoint": endpoint,
+                "code": code,
+                "requests": len(durations),
+                "throughput_rps": len(durations) / elapsed if elapsed else 0.0,
+                "p50_ms": percentile(durations, 50) * 1000,
+                "p95_ms": percentile(durations, 95) * 1000,
+                "p99_ms": percentile(durations, 99) * 1000,
+                "max_ms": durations[-1] * 1000,
+            }
+        )
+    return summary
+
+
+def run_replay(args):
+    """Send the IPNs to Odoo and report the latencies."""
+    if not (args.ecommerce or args.pos):
+        args.ecommerce = args.pos = True
+    requests = build_requests(args)
+    print(f"Sending {len(requests)} IPNs from {args.concurrency} threads.")
+
+    results = []
+    lock = threading.Lock()
+
+    def send(request):
+        result = send_request(*request, timeout=args.timeout)
+        with lock:
+            results.append(result)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(send, requests))
+    elapsed = time.perf_counter() - start
+
+    summary = summarize(results, elapsed)
+    print(f"{len(results)} IPNs in {elapsed:.2f}s ({len(results) / elapsed:.1f} IPN/s)")
+    print(
+        f"{'endpoint':<10} {'code':<16} {'requests':>8} {'req/s':>8}"
+        f" {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}"
+    )
+    for row in summary:
+        print(
+            f"{row['endpoint']:<10} {row['code']:<16} {row['requests']:>8}"
+            f" {row['throughput_rps']:>8.1f} {row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f}"
+            f" {row['p99_ms']:>8.1f} {row['max_ms']:>8.1f}"
+        )
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(summary, output, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    secrets = argparse.ArgumentParser(add_help=False)
+    secrets.add_argument("--hash-secret", default="ZXCVBNMASDFGHJKLQWERTYUIOP123456")
+    secrets.add_argument("--qr-secret", default="vnpayqrsecret")
+
+    gateway = subparsers.add_parser(
+        "gateway", parents=[secrets], help="Serve the stand-in for VNPay."
+    )
+    gateway.add_argument("--host", default="127.0.0.1")
+    gateway.add_argument("--port", type=int, default=8070)
+    gateway.add_argument("--latency", type=float, default=0.0, help="In seconds.")
+    gateway.add_argument("--error-rate", type=float, default=0.0)
+    gateway.set_defaults(func=run_gateway)
+
+    replay = subparsers.add_parser("replay", parents=[secrets], help="Send signed IPNs to Odoo.")
+    replay.add_argument("--odoo-url", default="http://localhost:8069")
+    replay.add_argument("--ecommerce", action="store_true", help="Send e-commerce IPNs.")
+    replay.add_argument("--pos", action="store_true", help="Send POS IPNs.")
+    replay.add_argument("--count", type=int, default=1000, help="IPNs per endpoint.")
+    replay.add_argument("--references", help="File of the e-commerce references and amounts.")
+    replay.add_argument("--txn-ids", help="File of the POS txnIds and amounts.")
+    replay.add_argument("--amount", type=int, default=100000)
+    replay.add_argument("--tmn-code", default="DEMOV210")
+    replay.add_argument("--merchant-code", default="MERCHANT")
+    replay.add_argument("--terminal-id", default="TERMINAL")
+    replay.add_argument("--concurrency", type=int, default=16)
+    replay.add_argument("--duplicate-rate", type=float, default=0.0)
+    replay.add_argument("--out-of-order-rate", type=float, default=0.0)
+    replay.add_argument("--timeout", type=float, default=30.0, help="In seconds.")
+    replay.add_argument("--seed", type=int, default=0)
+    replay.add_argument("--json", help="Write the results to this file as JSON.")
+    replay.set_defaults(func=run_replay)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,7 @@
 
 {
     "name": "Payment Provider: VNPay",
-    "version": "1.0",
+    "version": "1.2",
     "category": "Accounting/Payment Providers",
     "sequence": 0,
     "summary": "A Vietnam payment provider.",
@@ -10,10 +10,14 @@
     "author": "Nguyen Phuc Huy",
     "depends": ["base", "payment"],
     "data": [  # Do no change the order
+        "security/ir.model.access.csv",
         "views/payment_vnpay_view.xml",
+        "views/payment_vnpay_settlement_import_views.xml",
+        "views/payment_transaction_views.xml",
         "views/payment_vnpay_template.xml",
         "data/payment_method_data.xml",
         "data/payment_provider_data.xml",
+        "data/ir_cron_data.xml",
     ],
     "post_init_hook": "post_init_hook",
     "uninstall_hook": "uninstall_hook",
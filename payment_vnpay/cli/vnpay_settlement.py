@@ -0,0 +1,112 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import json
+import logging
+import optparse
+import sys
+from contextlib import nullcontext
+from pathlib import Path
+
+import odoo
+from odoo.cli import Command
+from odoo.exceptions import UserError
+
+from odoo.addons.payment_vnpay import const
+
+_logger = logging.getLogger(__name__)
+
+
+class VNPaySettlement(Command):
+    """Compare a VNPay settlement file with the payment transactions"""
+
+    name = "vnpay_settlement"
+
+    def run(self, cmdargs):
+        """Write the discrepancies between the settlement file and the transactions of a provider.
+
+        The command is found once the addons path is given, e.g.
+        `odoo-bin --addons-path=... vnpay_settlement -d db --settlement-file=settlement.csv`.
+
+        :param list cmdargs: The arguments of the command, along with the ones of the server.
+        :return: None
+        """
+        parser = odoo.tools.config.parser
+        parser.prog = f"{Path(sys.argv[0]).name} {self.name}"
+        group = optparse.OptionGroup(
+            parser,
+            "VNPay Settlement",
+            "Compare a settlement file with the transactions of the database given by `-d`, and "
+            "write the rows that don't match as CSV.",
+        )
+        group.add_option(
+            "--settlement-file",
+            dest="settlement_file",
+            help="The settlement file, as CSV or Excel (xlsx).",
+        )
+        group.add_option(
+            "--provider",
+            dest="provider",
+            help="The id or the TmnCode of the VNPay provider, if there are several of them.",
+        )
+        group.add_option(
+            "--report",
+            dest="report",
+            default="-",
+            help="The file the discrepancy report is written to, - for the standard output.",
+        )
+        group.add_option(
+            "--chunk-size",
+            dest="chunk_size",
+            type="int",
+            default=const.SETTLEMENT_CHUNK_SIZE,
+            help="The number of rows compared with the transactions at once.",
+        )
+        parser.add_option_group(group)
+        opt = odoo.tools.config.parse_config(cmdargs)
+
+        dbname = odoo.tools.config["db_name"]
+        if not dbname:
+            _logger.error('The vnpay_settlement command needs a database name, use "-d".')
+            sys.exit(1)
+        if not opt.settlement_file:
+            _logger.error('The vnpay_settlement command needs a file, use "--settlement-file".')
+            sys.exit(1)
+
+        registry = odoo.modules.registry.Registry(dbname.split(",")[0])
+        with registry.cursor() as cr:
+            env = odoo.api.Environment(cr, odoo.SUPERUSER_ID, {})
+            provider = self._get_provider(env, opt.provider)
+            try:
+                report_context = (
+                    nullcontext(sys.stdout)
+                    if opt.report == "-"
+                    else open(opt.report, "w", newline="", encoding="utf-8")
+                )
+                with open(opt.settlement_file, "rb") as fileobj, report_context as report:
+                    summary = env["payment.transaction"]._vnpay_reconcile_settlement(
+                        provider, fileobj, opt.settlement_file, report, opt.chunk_size
+                    )
+            except (OSError, UserError) as error:
+                _logger.error("%s", error)
+                sys.exit(1)
+            # The comparison only reads the transactions.
+            cr.rollback()
+        print(json.dumps(summary), file=sys.stderr)
+
+    @staticmethod
+    def _get_provider(env, provider):
+        """Return the VNPay provider with the given id or TmnCode, or the only one if not given."""
+        domain = [("code", "=", "vnpay")]
+        if provider and provider.isdigit():
+            domain.append(("id", "=", int(provider)))
+        elif provider:
+            domain.append(("vnpay_tmn_code", "=", provider))
+        providers = env["payment.provider"].search(domain)
+        if len(providers) != 1:
+            _logger.error(
+                "Found %s VNPay providers matching %r, use --provider with an id or a TmnCode.",
+                len(providers),
+                provider or "",
+            )
+            sys.exit(1)
+        return providers
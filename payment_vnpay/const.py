@@ -9,3 +9,87 @@ DEFAULT_PAYMENT_METHODS_CODES = [
     # Primary payment methods.
     "vnpay",
 ]
+
+# The number of minutes during which a payment URL can be used.
+PAYMENT_URL_VALIDITY_MINUTES = 30
+
+# The minimum number of minutes left before its expiry for a payment URL to be served again.
+PAYMENT_URL_REUSE_MARGIN_MINUTES = 5
+
+# The number of payment URLs signed for a transaction whose creation date is kept, to query the
+# payment made with any of them.
+PAYMENT_URL_DATES_LIMIT = 5
+
+# The fields signed, in this order, in the requests to the transaction query (querydr) API.
+QUERYDR_REQUEST_SIGNED_FIELDS = [
+    "vnp_RequestId",
+    "vnp_Version",
+    "vnp_Command",
+    "vnp_TmnCode",
+    "vnp_TxnRef",
+    "vnp_TransactionDate",
+    "vnp_CreateDate",
+    "vnp_IpAddr",
+    "vnp_OrderInfo",
+]
+
+# The fields signed, in this order, in the responses of the transaction query (querydr) API.
+QUERYDR_RESPONSE_SIGNED_FIELDS = [
+    "vnp_ResponseId",
+    "vnp_Command",
+    "vnp_ResponseCode",
+    "vnp_Message",
+    "vnp_TmnCode",
+    "vnp_TxnRef",
+    "vnp_Amount",
+    "vnp_BankCode",
+    "vnp_PayDate",
+    "vnp_TransactionNo",
+    "vnp_TransactionType",
+    "vnp_TransactionStatus",
+    "vnp_OrderInfo",
+    "vnp_PromotionCode",
+    "vnp_PromotionAmount",
+]
+
+# The response code of the transaction query API when VNPay has no payment for the reference.
+QUERYDR_TRANSACTION_NOT_FOUND = "91"
+
+# The transaction statuses returned by the transaction query API, mapped to the response code of
+# the notification leading to the same state transition. The other statuses lead to an error,
+# except the ones of the payments still processed by VNPay.
+QUERYDR_STATUS_MAPPING = {
+    "00": "00",  # The payment succeeded.
+    "01": "24",  # The payment was never completed, before the payment URL expired.
+}
+
+# The transaction statuses returned by the transaction query API while VNPay still processes the
+# payment: the transaction is left as is, and queried again by the next reconciliation.
+QUERYDR_PROCESSING_STATUSES = (
+    "05",  # VNPay is processing the transaction.
+    "06",  # VNPay sent the request to the bank.
+    "07",  # The transaction is suspected of fraud, and is being reviewed.
+)
+
+# The number of days during which the processed notifications are kept in the inbox.
+INBOX_RETENTION_DAYS = 30
+
+# The number of days during which the responses given to the notifications are kept in the ledger,
+# well beyond the period during which VNPay sends a notification again.
+IPN_LEDGER_RETENTION_DAYS = 30
+
+# The number of rows of a settlement file compared with the transactions at once.
+SETTLEMENT_CHUNK_SIZE = 1000
+
+# The columns of the discrepancy report of a settlement file.
+SETTLEMENT_REPORT_HEADER = [
+    "line",
+    "reference",
+    "provider_reference",
+    "file_amount",
+    "file_status",
+    "transaction_reference",
+    "transaction_amount",
+    "transaction_state",
+    "discrepancy",
+]
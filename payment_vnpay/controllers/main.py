@@ -1,16 +1,15 @@
 # Part of Odoo. See LICENSE file for full copyright and licensing details.
 
-import hashlib
-import hmac
 import logging
 import pprint
-import urllib.parse
 
 from werkzeug.exceptions import Forbidden
 from odoo import _, http
 from odoo.exceptions import ValidationError
 from odoo.http import request
 
+from odoo.addons.payment_vnpay import utils
+
 
 _logger = logging.getLogger(__name__)
 
@@ -53,41 +52,106 @@ class VNPayController(http.Controller):
         :param dict data: The notification data
         :return: The response to give to VNPay and acknowledge the notification
         """
+        timer = utils.StageTimer("vnpay_webhook")
+        result = self._process_notification(data, timer)
+        if result is None:
+            # Not handling the unauthorized notification data.
+            timer.log(_logger, result="unauthorized")
+            return
 
+        response = timer.add_server_timing(request.make_json_response(result))
+        timer.log(_logger, reference=data.get("vnp_TxnRef"), result=result["RspCode"])
+        return response
+
+    def _process_notification(self, data, timer):
+        """Process the notification data and return the response to give to VNPay.
+
+        :param dict data: The notification data.
+        :param utils.StageTimer timer: The timer of the request.
+        :return: The response to give to VNPay, or None if the notification is not authorized.
+        :rtype: dict
+        """
         ip_address = request.httprequest.environ.get("REMOTE_ADDR")
-        _logger.info(
+        _logger.debug(
             "notification received from VNPay with data:\n%s\nFrom IP: %s",
-            pprint.pformat(data),
+            utils.LazyFormat(pprint.pformat, data),
             ip_address,
         )
 
-        white_list_ip = (
-            http.request.env["payment_provider"]
-            .search([("code", "=", "vnpay")], limit=1)
-            .vnpay_white_list_ip
-        )
+        # Route the notification to the provider of the merchant account it was sent for.
+        with timer.stage("provider_lookup"):
+            config = (
+                request.env["payment.provider"]
+                .sudo()
+                ._vnpay_get_cached_config_for_notification("vnpay", data)
+            )
 
-        # Convert the white list IP to a list of IPs.
-        white_list_ip = white_list_ip = white_list_ip.replace(" ", "").split(";")
+        if not config:
+            _logger.warning(
+                "Received notification for an unknown TmnCode: %s", data.get("vnp_TmnCode")
+            )
+            return None
 
-        if ip_address not in white_list_ip:
+        if ip_address not in config["vnpay_white_list_ip"]:
             _logger.warning(
                 "Received notification from an unauthorized IP address: %s", ip_address
             )
-            # Not handling the unauthorized notification data.
-            return
+            return None
+
+        # Answer VNPay's retries from the ledger of the notifications already handled.
+        ipn_ledger_sudo = request.env["payment.vnpay.ipn"].sudo()
+        dedup_key = self._get_notification_dedup_key(data)
+        if dedup_key:
+            with timer.stage("ledger_lookup"):
+                response = ipn_ledger_sudo._get_response("vnpay", dedup_key)
+            if response:
+                # Only replay the response to the notifications signed by VNPay: the key is made
+                # of identifiers that are not secret.
+                secret = config["vnpay_hash_secret"]
+                with timer.stage("checksum"):
+                    is_valid = bool(secret) and utils.get_signer(secret).verify(data)
+                if not is_valid:
+                    _logger.warning("Received notification with invalid signature.")
+                    # Return VNPAY: Invalid Signature
+                    return {"RspCode": "97", "Message": "Invalid Checksum"}
+                _logger.info(
+                    "Received already handled notification %s, replaying the response.",
+                    dedup_key,
+                )
+                return response
+
+        if config["vnpay_ipn_mode"] == "inbox":
+            response = self._enqueue_notification(data, config, timer)
+            if dedup_key and response["RspCode"] == "00":
+                with timer.stage("db_write"):
+                    ipn_ledger_sudo._record_response("vnpay", dedup_key, response)
+            return response
 
         try:
-            tx_sudo = (
-                request.env["payment.transaction"]
-                .sudo()
-                ._get_tx_from_notification_data("vnpay", data)
-            )
+            with timer.stage("tx_lookup"):
+                tx_sudo = (
+                    request.env["payment.transaction"]
+                    .sudo()
+                    ._get_tx_from_notification_data("vnpay", data)
+                )
             # Verify the signature of the notification data.
-            self._verify_notification_signature(data, tx_sudo)
-
-            # Handle the notification data
-            tx_sudo._handle_notification_data("vnpay", data)
+            with timer.stage("checksum"):
+                self._verify_notification_signature(data, tx_sudo)
+
+            # Check if the transaction has already been processed.
+            if tx_sudo.state in ["done", "cancel", "error"]:
+                _logger.warning(
+                    "Received notification for already processed transaction. Aborting."
+                )
+                # Return VNPAY: Already update
+                response = {"RspCode": "02", "Message": "Order already confirmed"}
+            else:
+                with timer.stage("state_transition"):
+                    # Handle the notification data
+                    tx_sudo._handle_notification_data("vnpay", data)
+                    tx_sudo._vnpay_apply_response_code(data.get("vnp_ResponseCode"))
+                # Return VNPAY: Merchant update success
+                response = {"RspCode": "00", "Message": "Confirm Success"}
         except Forbidden:
             _logger.warning(
                 "Forbidden error during signature verification. Aborting.",
@@ -95,9 +159,7 @@ class VNPayController(http.Controller):
             )
             tx_sudo._set_error("VNPay: " + _("Received data with invalid signature."))
             # Return VNPAY: Invalid Signature
-            return request.make_json_response(
-                {"RspCode": "97", "Message": "Invalid Checksum"}
-            )
+            return {"RspCode": "97", "Message": "Invalid Checksum"}
 
         except AssertionError:
             _logger.warning(
@@ -106,9 +168,7 @@ class VNPayController(http.Controller):
             )
             tx_sudo._set_error("VNPay: " + _("Received data with invalid amount."))
             # Return VNPAY: Invalid amount
-            return request.make_json_response(
-                {"RspCode": "04", "Message": "invalid amount"}
-            )
+            response = {"RspCode": "04", "Message": "invalid amount"}
 
         except ValidationError:
             _logger.warning(
@@ -116,49 +176,58 @@ class VNPayController(http.Controller):
                 exc_info=True,
             )
             # Return VNPAY: Order Not Found
-            return request.make_json_response(
-                {"RspCode": "01", "Message": "Order Not Found"}
-            )
+            return {"RspCode": "01", "Message": "Order Not Found"}
 
-        # Check if the transaction has already been processed.
-        if tx_sudo.state in ["done", "cancel", "error"]:
-            _logger.warning(
-                "Received notification for already processed transaction. Aborting."
-            )
-            # Return VNPAY: Already update
-            return request.make_json_response(
-                {"RspCode": "02", "Message": "Order already confirmed"}
-            )
+        # The signature is valid: the response is final for this notification.
+        if dedup_key:
+            with timer.stage("db_write"):
+                ipn_ledger_sudo._record_response("vnpay", dedup_key, response)
+        return response
 
-        responseCode = data.get("vnp_ResponseCode")
+    @staticmethod
+    def _get_notification_dedup_key(data):
+        """Return the key identifying the notification across VNPay's retries.
 
-        if responseCode == "00":
-            # Confirm the transaction if the payment was successful.
-            _logger.info("Received successful payment notification from VNPay, saving.")
-            tx_sudo._set_done()
-            _logger.info("Payment transaction completed.")
-        elif responseCode == "24":
-            # Cancel the transaction if the payment was canceled by the user.
-            _logger.warning(
-                "Received canceled payment notification from VNPay, canceling."
-            )
-            tx_sudo._set_canceled(state_message=_("The customer canceled the payment."))
-            _logger.info("Payment transaction canceled.")
-        else:
-            # Notify the user that the payment failed.
-            _logger.warning(
-                "Received payment notification from VNPay with invalid response code: %s",
-                responseCode,
-            )
-            tx_sudo._set_error(
-                "VNPay: "
-                + _("Received data with invalid response code: %s", responseCode)
-            )
-            _logger.info("Payment transaction failed.")
+        :param dict data: The notification data.
+        :return: The key, or None if the data lack the identifiers.
+        :rtype: str
+        """
+        reference = data.get("vnp_TxnRef")
+        transaction_no = data.get("vnp_TransactionNo")
+        if not reference or not transaction_no:
+            return None
+        return f"{reference}/{transaction_no}"
+
+    @staticmethod
+    def _enqueue_notification(data, config, timer):
+        """Verify the signature of the notification data and append them to the inbox.
+
+        The notification is acknowledged without waiting for the transaction to be updated; the
+        inbox is processed by a scheduled action.
+
+        :param dict data: The notification data.
+        :param dict config: The cached configuration of the provider.
+        :param utils.StageTimer timer: The timer of the request.
+        :return: The response to give to VNPay.
+        :rtype: dict
+        """
+        secret = config["vnpay_hash_secret"]
+        with timer.stage("checksum"):
+            is_valid = bool(secret) and utils.get_signer(secret).verify(data)
+        if not is_valid:
+            _logger.warning("Received notification with invalid signature.")
+            # Return VNPAY: Invalid Signature
+            return {"RspCode": "97", "Message": "Invalid Checksum"}
+
+        if not data.get("vnp_TxnRef"):
+            _logger.warning("Received notification with missing reference.")
+            # Return VNPAY: Order Not Found
+            return {"RspCode": "01", "Message": "Order Not Found"}
+
+        with timer.stage("db_write"):
+            request.env["payment.vnpay.inbox"].sudo()._enqueue(data)
         # Return VNPAY: Merchant update success
-        return request.make_json_response(
-            {"RspCode": "00", "Message": "Confirm Success"}
-        )
+        return {"RspCode": "00", "Message": "Confirm Success"}
 
     @staticmethod
     def _verify_notification_signature(data, tx_sudo):
@@ -177,46 +246,7 @@ class VNPayController(http.Controller):
             _logger.warning("Received notification with missing data.")
             raise Forbidden()
 
-        receive_signature = data.get("vnp_SecureHash")
-
-        # Remove the signature from the data to verify.
-        if data.get("vnp_SecureHash"):
-            data.pop("vnp_SecureHash")
-        if data.get("vnp_SecureHashType"):
-            data.pop("vnp_SecureHashType")
-
-        # Sort the data by key to generate the expected signature.
-        inputData = sorted(data.items())
-        hasData = ""
-        seq = 0
-        for key, val in inputData:
-            if str(key).startswith("vnp_"):
-                if seq == 1:
-                    hasData = (
-                        hasData
-                        + "&"
-                        + str(key)
-                        + "="
-                        + urllib.parse.quote_plus(str(val))
-                    )
-                else:
-                    seq = 1
-                    hasData = str(key) + "=" + urllib.parse.quote_plus(str(val))
-
-        # Generate the expected signature.
-        expected_signature = VNPayController.__hmacsha512(
-            tx_sudo.provider_id.vnpay_hash_secret, hasData
-        )
-
         # Compare the received signature with the expected signature.
-        if not hmac.compare_digest(receive_signature, expected_signature):
+        if not tx_sudo.provider_id._vnpay_get_signer().verify(data):
             _logger.warning("Received notification with invalid signature.")
             raise Forbidden()
-
-    @staticmethod
-    def __hmacsha512(key, data):
-        """Generate a HMAC SHA512 hash"""
-
-        byteKey = key.encode("utf-8")
-        byteData = data.encode("utf-8")
-        return hmac.new(byteKey, byteData, hashlib.sha512).hexdigest()
@@ -0,0 +1,295 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import json
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+_logger = logging.getLogger(__name__)
+
+# The default (connect, read) timeouts of the requests, in seconds.
+DEFAULT_TIMEOUT = (5, 20)
+
+# The HTTP statuses of the responses sent by a gateway in front of an API that did not process
+# the request, which are safe to retry.
+RETRYABLE_STATUSES = frozenset({502, 503, 504})
+
+# The maximum number of seconds waited between two attempts.
+MAX_BACKOFF = 5.0
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised instead of sending a request while the circuit breaker of the client is open."""
+
+
+class CircuitBreaker:
+    """Stop sending requests to an API after consecutive failures, for a cooldown period.
+
+    Once the cooldown has elapsed, a single trial request is let through: the circuit closes again
+    if it succeeds and stays open for another cooldown period otherwise.
+
+    :param int threshold: The number of consecutive failures opening the circuit; 0 disables it.
+    :param float cooldown: The number of seconds during which the circuit stays open.
+    """
+
+    def __init__(self, threshold=0, cooldown=30.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Return whether a request can be sent."""
+        if not self.threshold:
+            return True
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at >= self.cooldown:
+                # Let a trial request through; the others keep failing fast until it returns.
+                self._opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        if not self.threshold:
+            return
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.threshold:
+                if self._opened_at is None:
+                    _logger.warning(
+                        "Opening the circuit after %s consecutive failures.", self._failures
+                    )
+                self._opened_at = time.monotonic()
+
+
+class VNPayHttpClient:
+    """HTTP client of the VNPay APIs, reusing a pool of keep-alive connections.
+
+    A client is meant to be shared by all the requests of a worker, see :func:`get_client`; the
+    underlying session is safe to use from the threads of :meth:`map`.
+
+    :param int pool_size: The maximum number of connections kept open.
+    :param tuple timeout: The (connect, read) timeouts of the requests, in seconds.
+    :param int retries: The number of times a failed request is sent again, if safe.
+    :param float backoff: The base number of seconds waited before sending a request again; the
+                          actual delay is drawn at random up to an exponentially growing bound.
+    :param int breaker_threshold: The number of consecutive failed calls after which the requests
+                                  fail fast, see :class:`CircuitBreaker`; 0 disables it.
+    :param float breaker_cooldown: The number of seconds during which the requests fail fast.
+    """
+
+    def __init__(
+        self,
+        pool_size=10,
+        timeout=DEFAULT_TIMEOUT,
+        retries=0,
+        backoff=0.2,
+        breaker_threshold=0,
+        breaker_cooldown=30.0,
+    ):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def post_json(
+        self, url, payload, timeout=None, idempotent=False, content_type="application/json"
+    ):
+        """Send the payload as JSON and return the decoded JSON response.
+
+        The requests that never reached the API (connection errors and gateway errors) are sent
+        again up to `retries` times; the ones that timed out while waiting for the response are only
+        sent again if the request is idempotent.
+
+        :param str url: The URL of the endpoint.
+        :param dict payload: The payload of the request.
+        :param tuple timeout: The (connect, read) timeouts, if different from the client's ones.
+        :param bool idempotent: Whether the request can safely be processed twice by the API.
+        :param str content_type: The content type announced for the JSON body.
+        :return: The response of the endpoint.
+        :rtype: dict
+        :raise CircuitOpenError: If the API is considered unavailable.
+        :raise requests.exceptions.RequestException: If the request fails or times out.
+        :raise ValueError: If the response is not valid JSON.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"The circuit of {url} is open.")
+
+        data = json.dumps(payload)
+        attempt = 0
+        while True:
+            try:
+                response = self.session.post(
+                    url,
+                    data=data,
+                    headers={"Content-Type": content_type},
+                    timeout=timeout or self.timeout,
+                )
+                response.raise_for_status()
+                result = response.json()
+            except requests.exceptions.RequestException as error:
+                if attempt >= self.retries or not self._is_retryable(error, idempotent):
+                    self.breaker.record_failure()
+                    raise
+            except ValueError:
+                self.breaker.record_failure()
+                raise
+            else:
+                self.breaker.record_success()
+                return result
+
+            attempt += 1
+            delay = random.uniform(0, min(MAX_BACKOFF, self.backoff * 2**attempt))
+            _logger.info(
+                "Request to %s failed, sending it again in %.2fs (attempt %s of %s).",
+                url,
+                delay,
+                attempt,
+                self.retries,
+            )
+            time.sleep(delay)
+
+    @staticmethod
+    def _is_retryable(error, idempotent):
+        """Return whether the request that failed with the given error can be sent again."""
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            return True
+        if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+            # The request may have been processed, unless the connection was never established.
+            reason = getattr(error.args[0], "reason", None) if error.args else None
+            return idempotent or isinstance(reason, NewConnectionError)
+        if isinstance(error, requests.exceptions.HTTPError):
+            return error.response is not None and error.response.status_code in RETRYABLE_STATUSES
+        return False
+
+    def map(self, func, items, concurrency):
+        """Apply `func` to the items from at most `concurrency` threads, and return the results.
+
+        `func` must not use the ORM: the threads have no access to the environment.
+
+        :param callable func: The function sending the request for an item.
+        :param list items: The items.
+        :param int concurrency: The maximum number of requests in flight.
+        :return: The results, in the order of the items.
+        :rtype: list
+        """
+        concurrency = max(1, min(concurrency, self.pool_size, len(items)))
+        if concurrency == 1:
+            return [func(item) for item in items]
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return list(executor.map(func, items))
+
+    def close(self):
+        """Close the idle connections of the pool; the requests in flight end normally."""
+        self.session.close()
+
+
+class BoundedExecutor:
+    """Run functions in background threads, with a bounded number of pending functions.
+
+    A slot must be reserved with :meth:`reserve` before a function is submitted, so that the
+    callers can give up while too many functions are pending instead of queueing more of them.
+
+    :param int max_workers: The number of threads.
+    :param int max_pending: The maximum number of functions reserved, queued or running.
+    """
+
+    def __init__(self, max_workers=4, max_pending=32):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="vnpay_executor"
+        )
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def reserve(self):
+        """Reserve a slot for a function, and return whether one was available."""
+        return self._slots.acquire(blocking=False)
+
+    def release(self):
+        """Release a slot reserved for a function that will not be submitted."""
+        self._slots.release()
+
+    def submit(self, func, *args):
+        """Run `func(*args)` in a background thread, in a slot reserved with :meth:`reserve`.
+
+        `func` must manage its own cursor if it uses the ORM.
+        """
+
+        def run():
+            try:
+                func(*args)
+            except Exception:
+                _logger.exception("Background function %s failed.", func)
+            finally:
+                self.release()
+
+        self._executor.submit(run)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+_clients = {}
+_executors = {}
+_instances_lock = threading.Lock()
+
+
+def _get_instance(instances, factory, name, kwargs):
+    """Return the instance of the worker for the given name and settings, creating it if needed."""
+    settings = tuple(sorted(kwargs.items()))
+    instance, instance_settings = instances.get(name, (None, None))
+    if instance is None or instance_settings != settings:
+        with _instances_lock:
+            instance, instance_settings = instances.get(name, (None, None))
+            if instance is None or instance_settings != settings:
+                if instance is not None:
+                    # Release the connections of the client, and let the pending functions of the
+                    # executor finish but stop its threads afterwards.
+                    instance.close()
+                instance = factory(**kwargs)
+                instances[name] = (instance, settings)
+    return instance
+
+
+def get_client(name, **kwargs):
+    """Return the client of the worker for the given name and settings, creating it if needed.
+
+    A new client is created when the settings change, e.g. after the provider was reconfigured.
+
+    :param str name: The name of the client, e.g. the API it is used for.
+    :param dict kwargs: The arguments of :class:`VNPayHttpClient`.
+    :return: The client.
+    :rtype: VNPayHttpClient
+    """
+    return _get_instance(_clients, VNPayHttpClient, name, kwargs)
+
+
+def get_executor(name, **kwargs):
+    """Return the executor of the worker for the given name and settings, creating it if needed.
+
+    :param str name: The name of the executor, e.g. the API it is used for.
+    :param dict kwargs: The arguments of :class:`BoundedExecutor`.
+    :return: The executor.
+    :rtype: BoundedExecutor
+    """
+    return _get_instance(_executors, BoundedExecutor, name, kwargs)
@@ -0,0 +1,36 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from odoo.addons.payment_vnpay.models.payment_vnpay_reference_counter import MAX_SEQUENCE_NUMBER
+
+
+def migrate(cr, version):
+    """Backfill the reference counters from the existing transactions in a single pass.
+
+    The references are split on their last separator followed by digits only, which is how
+    `_compute_reference` builds them, and only kept if their prefix is itself a reference: a
+    sequence starts once its prefix is taken, whereas e.g. `abc5` is not in the sequence of `ab`
+    if there is no `ab` reference. The numbers that don't fit in the counters are left out: they
+    are not sequence numbers but parts of the prefix, e.g. the timestamp of `tx-20241017120512`.
+    The counters that this misses are seeded on their first use.
+    """
+    cr.execute(
+        r"""
+        INSERT INTO payment_vnpay_reference_counter AS counter (
+            prefix, separator, last_value, create_date, write_date
+        )
+        SELECT parts[1], parts[2],
+               max(parts[3]::bigint) FILTER (WHERE parts[3]::bigint <= %(max)s),
+               NOW() AT TIME ZONE 'UTC', NOW() AT TIME ZONE 'UTC'
+          FROM (
+              SELECT regexp_match(reference, '^(.+)(c|-)(\d{1,10})$') AS parts
+                FROM payment_transaction
+          ) AS refs
+         WHERE parts IS NOT NULL
+           AND EXISTS (SELECT 1 FROM payment_transaction AS base WHERE base.reference = parts[1])
+      GROUP BY parts[1], parts[2]
+        HAVING max(parts[3]::bigint) FILTER (WHERE parts[3]::bigint <= %(max)s) IS NOT NULL
+        ON CONFLICT (prefix, separator)
+        DO UPDATE SET last_value = GREATEST(counter.last_value, EXCLUDED.last_value)
+        """,
+        {"max": MAX_SEQUENCE_NUMBER},
+    )
@@ -1,4 +1,9 @@
 # Part of Odoo. See LICENSE file for full copyright and licensing details.
 
+from . import payment_method
 from . import payment_provider
 from . import payment_transaction
+from . import payment_vnpay_inbox
+from . import payment_vnpay_ipn
+from . import payment_vnpay_reference_counter
+from . import payment_vnpay_settlement_import
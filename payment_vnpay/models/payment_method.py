@@ -0,0 +1,42 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from odoo import api, models
+
+# The fields of the payment methods read by the cached provider configurations.
+CACHED_FIELDS = ("code", "active", "sequence")
+
+
+class PaymentMethod(models.Model):
+    _inherit = "payment.method"
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        methods = super().create(vals_list)
+        if methods._vnpay_is_cached():
+            # Invalidate the cached provider configurations, in all the workers.
+            self.env.registry.clear_cache()
+        return methods
+
+    def write(self, vals):
+        res = super().write(vals)
+        if any(field in vals for field in CACHED_FIELDS):
+            # Invalidate the cached provider configurations, in all the workers.
+            self.env.registry.clear_cache()
+        return res
+
+    def unlink(self):
+        is_cached = self._vnpay_is_cached()
+        res = super().unlink()
+        if is_cached:
+            # Invalidate the cached provider configurations, in all the workers.
+            self.env.registry.clear_cache()
+        return res
+
+    def _vnpay_is_cached(self):
+        """Check whether one of the payment methods is read by the cached provider configurations.
+
+        :return: Whether the cache must be invalidated when the payment methods change.
+        :rtype: bool
+        """
+        cached_codes = self.env["payment.provider"]._vnpay_get_cached_codes()
+        return any(method.code in cached_codes for method in self)
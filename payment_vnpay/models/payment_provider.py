@@ -1,11 +1,8 @@
 import logging
 
-import hmac
-import hashlib
-import urllib.parse
-
-from odoo import _, api, fields, models
-from odoo.addons.payment_vnpay import const
+from odoo import _, api, fields, models, tools
+from odoo.exceptions import UserError
+from odoo.addons.payment_vnpay import const, utils
 from odoo.addons.payment_vnpay.controllers.main import VNPayController
 
 _logger = logging.getLogger(__name__)
@@ -49,6 +46,55 @@ class PaymentProviderVNPay(models.Model):
         default=_get_default_vnpay_ipn_url,
     )
 
+    vnpay_ipn_mode = fields.Selection(
+        string="VNPay IPN Processing",
+        help="In inbox mode, the notifications are acknowledged as soon as their signature is "
+        "verified and processed shortly after by a scheduled action.",
+        selection=[("sync", "Synchronous"), ("inbox", "Asynchronous (inbox)")],
+        default="sync",
+    )
+
+    vnpay_query_url = fields.Char(
+        string="VNPay Transaction API URL",
+        help="The URL of the API used to query the status of the transactions whose notification "
+        "was never received.",
+        default="https://sandbox.vnpayment.vn/merchant_webapi/api/transaction",
+    )
+    vnpay_reconcile_delay = fields.Integer(
+        string="VNPay Reconciliation Delay",
+        help="The number of minutes after which the status of a transaction still waiting for its "
+        "notification is queried from VNPay.",
+        default=45,
+    )
+    vnpay_reconcile_concurrency = fields.Integer(
+        string="VNPay Reconciliation Concurrency",
+        help="The maximum number of simultaneous queries sent to VNPay during a reconciliation.",
+        default=4,
+    )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        providers = super().create(vals_list)
+        if any(provider.code in self._vnpay_get_cached_codes() for provider in providers):
+            # Invalidate the cached configurations, in all the workers.
+            self.env.registry.clear_cache()
+        return providers
+
+    def write(self, vals):
+        res = super().write(vals)
+        if not self._vnpay_get_cached_fields().isdisjoint(vals):
+            # Invalidate the cached configurations, in all the workers.
+            self.env.registry.clear_cache()
+        return res
+
+    def unlink(self):
+        is_cached = any(provider.code in self._vnpay_get_cached_codes() for provider in self)
+        res = super().unlink()
+        if is_cached:
+            # Invalidate the cached configurations, in all the workers.
+            self.env.registry.clear_cache()
+        return res
+
     @api.model
     def _get_compatible_providers(
         self, *args, currency_id=None, is_validation=False, **kwargs
@@ -81,37 +127,152 @@ class PaymentProviderVNPay(models.Model):
     def _get_payment_url(self, params, secret_key):
         """Generate the payment URL for VNPay"""
 
-        # Determine the base URL based on the state
-        inputData = sorted(params.items())
-        queryString = ""
-        seq = 0
-        for key, val in inputData:
-            if seq == 1:
-                queryString = (
-                    queryString + "&" + key + "=" + urllib.parse.quote_plus(str(val))
-                )
-            else:
-                seq = 1
-                queryString = key + "=" + urllib.parse.quote_plus(str(val))
-
-        hashValue = self.__hmacsha512(secret_key, queryString)
+        queryString, hashValue = utils.get_signer(secret_key).sign_params(params)
         # The final URL will be like this:
         # base_url?param1=value1&param2=value2...&vnp_SecureHash=hashValue
         return (
             self.vnpay_payment_link + "?" + queryString + "&vnp_SecureHash=" + hashValue
         )
 
+    def _vnpay_get_signer(self):
+        """Return the signing engine keyed with the hash secret of the provider.
+
+        Note: self.ensure_one()
+
+        :return: The signer shared by all the requests using the same secret.
+        :rtype: utils.VNPaySigner
+        """
+        self.ensure_one()
+        return utils.get_signer(self.vnpay_hash_secret)
+
+    @api.model
+    def _vnpay_get_cached_codes(self):
+        """Return the codes of the providers whose configuration is cached.
+
+        :return: The provider codes.
+        :rtype: set
+        """
+        return {"vnpay"}
+
+    @api.model
+    def _vnpay_get_cached_fields(self):
+        """Return the fields of the providers read by :meth:`_vnpay_prepare_cached_config`, or
+        deciding which provider is cached.
+
+        :return: The field names.
+        :rtype: set
+        """
+        return {
+            "code",
+            "state",
+            "sequence",
+            "vnpay_tmn_code",
+            "vnpay_hash_secret",
+            "vnpay_white_list_ip",
+            "vnpay_ipn_mode",
+        }
+
+    @api.model
+    @tools.ormcache("provider_code")
+    def _vnpay_get_cached_config(self, provider_code):
+        """Return the configuration of the provider with the given code, resolved once per worker.
+
+        The webhooks and the QR routes read the configuration from this cache instead of searching
+        the provider on each request. The cache is cleared when a cached field of a provider or a
+        payment method is written, and the registry signaling propagates the invalidation to the
+        other workers.
+
+        Note: the result is shared between requests and must not be modified.
+
+        :param str provider_code: The code of the provider.
+        :return: The configuration values, see :meth:`_vnpay_prepare_cached_config`.
+        :rtype: dict
+        """
+        provider = self.sudo().search([("code", "=", provider_code)], limit=1)
+        return provider._vnpay_prepare_cached_config(provider_code)
+
+    @api.model
+    @tools.ormcache("provider_code")
+    def _vnpay_get_cached_configs_by_tmn_code(self, provider_code):
+        """Return the configurations of the providers with the given code, by TmnCode.
+
+        The notifications are routed to the provider of the merchant account they were sent for,
+        so that several VNPay merchant accounts, e.g. one per company or website, can share the
+        same database. If several providers share a TmnCode, the oldest one is used.
+
+        Note: the result is shared between requests and must not be modified.
+
+        :param str provider_code: The code of the providers.
+        :return: The configuration values, see :meth:`_vnpay_prepare_cached_config`, by TmnCode.
+        :rtype: dict
+        """
+        providers = self.sudo().search([("code", "=", provider_code)], order="id desc")
+        return {
+            provider.vnpay_tmn_code: provider._vnpay_prepare_cached_config(provider_code)
+            for provider in providers
+            if provider.vnpay_tmn_code
+        }
+
+    @api.model
+    def _vnpay_get_cached_config_for_notification(self, provider_code, notification_data):
+        """Return the configuration of the provider the notification data were sent for.
+
+        :param str provider_code: The code of the provider.
+        :param dict notification_data: The notification data sent by VNPay.
+        :return: The configuration values, or None if no provider has the TmnCode of the data.
+        :rtype: dict
+        """
+        tmn_code = notification_data.get("vnp_TmnCode")
+        return self._vnpay_get_cached_configs_by_tmn_code(provider_code).get(tmn_code)
+
+    def _vnpay_prepare_cached_config(self, provider_code):
+        """Prepare the configuration values cached by :meth:`_vnpay_get_cached_config`.
+
+        The values only contain primitive types, so they can outlive the current environment.
+
+        :param str provider_code: The code of the provider, in case `self` is empty.
+        :return: The configuration values.
+        :rtype: dict
+        """
+        payment_method = (
+            self.env["payment.method"]
+            .sudo()
+            .search([("code", "=", provider_code)], limit=1)
+        )
+        white_list_ip = (self.vnpay_white_list_ip or "").replace(" ", "").split(";")
+        return {
+            "provider_id": self.id,
+            "payment_method_id": payment_method.id,
+            "vnpay_tmn_code": self.vnpay_tmn_code,
+            "vnpay_hash_secret": self.vnpay_hash_secret,
+            "vnpay_white_list_ip": frozenset(filter(None, white_list_ip)),
+            "vnpay_ipn_mode": self.vnpay_ipn_mode or "sync",
+        }
+
+    def _vnpay_action_import_settlement(self):
+        """Open the wizard comparing a settlement file of the provider with its transactions.
+
+        Note: self.ensure_one()
+
+        :return: The action of the wizard.
+        :rtype: dict
+        :raise UserError: If the provider is not a VNPay provider.
+        """
+        self.ensure_one()
+        if self.code != "vnpay":
+            raise UserError(_("Only the settlement files of the VNPay providers can be imported."))
+        return {
+            "name": _("Import VNPay Settlement File"),
+            "type": "ir.actions.act_window",
+            "res_model": "payment.vnpay.settlement.import",
+            "view_mode": "form",
+            "target": "new",
+            "context": {"default_provider_id": self.id},
+        }
+
     def _get_default_payment_method_codes(self):
         """Override of `payment` to return the default payment method codes."""
         default_codes = super()._get_default_payment_method_codes()
         if self.code != "vnpay":
             return default_codes
         return const.DEFAULT_PAYMENT_METHODS_CODES
-
-    @staticmethod
-    def __hmacsha512(key, data):
-        """Generate a HMAC SHA512 hash"""
-
-        byteKey = key.encode("utf-8")
-        byteData = data.encode("utf-8")
-        return hmac.new(byteKey, byteData, hashlib.sha512).hexdigest()
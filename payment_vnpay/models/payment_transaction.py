@@ -1,17 +1,25 @@
 # Part of Odoo. See LICENSE file for full copyright and licensing details.
 
+import csv
+import hmac
 import logging
 import pytz
-import re
+import socket
+import threading
+import time
 import unicodedata
+import uuid
 
+import requests
 from werkzeug import urls
 from datetime import datetime, timedelta
 
-from odoo import _, api, models
-from odoo.exceptions import ValidationError
+from odoo import _, api, fields, models, tools
+from odoo.exceptions import UserError, ValidationError
+from odoo.tools.misc import hmac as hmac_tool
 
 from odoo.addons.payment import utils as payment_utils
+from odoo.addons.payment_vnpay import const, http_client, settlement, utils
 from odoo.addons.payment_vnpay.controllers.main import VNPayController
 
 _logger = logging.getLogger(__name__)
@@ -20,6 +28,75 @@ _logger = logging.getLogger(__name__)
 class PaymentTransaction(models.Model):
     _inherit = "payment.transaction"
 
+    vnpay_payment_url = fields.Char(
+        string="VNPay Payment URL", readonly=True, copy=False
+    )
+    vnpay_payment_url_fingerprint = fields.Char(
+        string="VNPay Payment URL Fingerprint",
+        help="The merchant, amount, language and provider configuration the payment URL was "
+        "signed for.",
+        readonly=True,
+        copy=False,
+    )
+    vnpay_payment_url_create_date = fields.Datetime(
+        string="VNPay Payment URL Creation Date", readonly=True, copy=False
+    )
+    vnpay_payment_url_expire_date = fields.Datetime(
+        string="VNPay Payment URL Expiry Date", readonly=True, copy=False
+    )
+    vnpay_payment_url_dates = fields.Char(
+        string="VNPay Payment URL Dates",
+        help="The creation dates of the last payment URLs signed for the transaction, as sent to "
+        "VNPay (vnp_CreateDate), the latest first.",
+        readonly=True,
+        copy=False,
+    )
+    vnpay_transaction_no = fields.Char(
+        string="VNPay Transaction No.",
+        help="The number of the transaction at VNPay (vnp_TransactionNo, or qrTrace for VNPay-QR).",
+        readonly=True,
+        copy=False,
+        index="btree_not_null",
+    )
+    vnpay_bank_code = fields.Char(string="VNPay Bank Code", readonly=True, copy=False)
+    vnpay_bank_tran_no = fields.Char(
+        string="VNPay Bank Transaction No.",
+        help="The number of the transaction at the bank (vnp_BankTranNo).",
+        readonly=True,
+        copy=False,
+        index="btree_not_null",
+    )
+    vnpay_card_type = fields.Char(string="VNPay Card Type", readonly=True, copy=False)
+    vnpay_pay_date = fields.Datetime(string="VNPay Payment Date", readonly=True, copy=False)
+
+    def init(self):
+        super().init()
+        # Let the reconciliation find the transactions still waiting for their notification,
+        # including the ones whose payment URL was signed before its creation date was kept.
+        tools.drop_index(
+            self.env.cr, "payment_transaction_vnpay_reconcile_index", self._table
+        )
+        tools.create_index(
+            self.env.cr,
+            "payment_transaction_vnpay_waiting_index",
+            self._table,
+            ["provider_id", "id"],
+            where="state IN ('draft', 'pending')",
+        )
+        # The unique index of the references already lets the notifications fetch their
+        # transaction.
+        tools.drop_index(
+            self.env.cr, "payment_transaction_provider_id_reference_index", self._table
+        )
+        # Let the settlement import fetch the transactions by provider reference.
+        tools.create_index(
+            self.env.cr,
+            "payment_transaction_provider_reference_index",
+            self._table,
+            ["provider_id", "provider_reference"],
+            where="provider_reference IS NOT NULL",
+        )
+
     def _get_specific_rendering_values(self, processing_values):
         """Override of payment to return VNPay-specific rendering values.
 
@@ -33,9 +110,6 @@ class PaymentTransaction(models.Model):
         if self.provider_code != "vnpay":
             return res
 
-        # Initiate the payment and retrieve the payment link data.
-        base_url = self.provider_id.get_base_url()
-
         # Determine the language of the payment page.
         language = (
             "vn"
@@ -44,23 +118,50 @@ class PaymentTransaction(models.Model):
         )
         float_amount = round(float(self.amount), 2)
 
+        # Serve the payment URL signed for a previous rendering again if it is still valid for the
+        # same amount and language, e.g. when the customer reloads the page or clicks "Pay" twice.
+        # The digest of the secret and the URL of the payment page lets a reconfiguration of the
+        # provider invalidate the URLs signed before it. It is keyed with the database secret, so
+        # that the stored fingerprint reveals nothing of the hash secret.
+        provider_digest = hmac_tool(
+            self.env,
+            "payment_vnpay_url_fingerprint",
+            f"{self.provider_id.vnpay_hash_secret}|{self.provider_id.vnpay_payment_link}",
+        )[:16]
+        fingerprint = (
+            f"{self.provider_id.vnpay_tmn_code}|{float_amount}|{language}|{provider_digest}"
+        )
+        reuse_limit = fields.Datetime.now() + timedelta(
+            minutes=const.PAYMENT_URL_REUSE_MARGIN_MINUTES
+        )
+        if (
+            self.vnpay_payment_url
+            and self.vnpay_payment_url_fingerprint == fingerprint
+            and self.vnpay_payment_url_expire_date
+            and self.vnpay_payment_url_expire_date > reuse_limit
+        ):
+            return {"api_url": self.vnpay_payment_url}
+
+        # Initiate the payment and retrieve the payment link data.
+        base_url = self.provider_id.get_base_url()
+
+        create_date = datetime.now(pytz.timezone("Etc/GMT-7"))
+        expire_date = create_date + timedelta(
+            minutes=const.PAYMENT_URL_VALIDITY_MINUTES
+        )
         params = {
             "vnp_Version": "2.1.1",
             "vnp_Command": "pay",
             "vnp_TmnCode": self.provider_id.vnpay_tmn_code,
             "vnp_Amount": int(float_amount * 100),
-            "vnp_CreateDate": datetime.now(pytz.timezone("Etc/GMT-7")).strftime(
-                "%Y%m%d%H%M%S"
-            ),
+            "vnp_CreateDate": create_date.strftime("%Y%m%d%H%M%S"),
             "vnp_CurrCode": "VND",
             "vnp_IpAddr": payment_utils.get_customer_ip_address(),
             "vnp_Locale": language,
             "vnp_OrderInfo": f"Thanh toan don hang {self.reference} voi so tien la {float_amount} VND",
             "vnp_OrderType": "billpayment",
             "vnp_ReturnUrl": urls.url_join(base_url, VNPayController._return_url),
-            "vnp_ExpireDate": (
-                datetime.now(pytz.timezone("Etc/GMT-7")) + timedelta(minutes=30)
-            ).strftime("%Y%m%d%H%M%S"),
+            "vnp_ExpireDate": expire_date.strftime("%Y%m%d%H%M%S"),
             "vnp_TxnRef": self.reference,
         }
 
@@ -68,6 +169,27 @@ class PaymentTransaction(models.Model):
             params=params, secret_key=self.provider_id.vnpay_hash_secret
         )
 
+        # Keep the signed URL to serve it again while it is valid, and the dates of the previous
+        # ones, which may have been paid anyway.
+        previous_dates = self._vnpay_get_payment_url_dates() if self.vnpay_payment_url else []
+        url_dates = list(dict.fromkeys([params["vnp_CreateDate"], *previous_dates]))
+        self.write(
+            {
+                "vnpay_payment_url": payment_link_data,
+                "vnpay_payment_url_fingerprint": fingerprint,
+                "vnpay_payment_url_dates": ",".join(
+                    url_dates[: const.PAYMENT_URL_DATES_LIMIT]
+                ),
+                # Datetime fields are naive and in UTC.
+                "vnpay_payment_url_create_date": create_date.astimezone(pytz.utc).replace(
+                    tzinfo=None
+                ),
+                "vnpay_payment_url_expire_date": expire_date.astimezone(pytz.utc).replace(
+                    tzinfo=None
+                ),
+            }
+        )
+
         # Extract the payment link URL and embed it in the redirect form.
         rendering_values = {
             "api_url": payment_link_data,
@@ -94,9 +216,15 @@ class PaymentTransaction(models.Model):
                 "VNPay: " + _("Received data with missing reference.")
             )
 
-        tx = self.search(
-            [("reference", "=", reference), ("provider_code", "=", "vnpay")]
+        # Only look for the transactions of the provider the notification was sent for.
+        config = self.env["payment.provider"]._vnpay_get_cached_config_for_notification(
+            "vnpay", notification_data
         )
+        if config:
+            provider_domain = [("provider_id", "=", config["provider_id"])]
+        else:
+            provider_domain = [("provider_code", "=", "vnpay")]
+        tx = self.search([("reference", "=", reference), *provider_domain])
         if not tx:
             raise ValidationError(
                 "VNPay: " + _("No transaction found matching reference %s.", reference)
@@ -132,7 +260,427 @@ class PaymentTransaction(models.Model):
             raise ValidationError(
                 "VNPay: " + _("Received data with missing reference.")
             )
-        self.provider_reference = vnp_txn_ref
+        self.write(
+            {
+                "provider_reference": vnp_txn_ref,
+                "vnpay_transaction_no": notification_data.get("vnp_TransactionNo") or False,
+                "vnpay_bank_code": notification_data.get("vnp_BankCode") or False,
+                "vnpay_bank_tran_no": notification_data.get("vnp_BankTranNo") or False,
+                "vnpay_card_type": notification_data.get("vnp_CardType") or False,
+                "vnpay_pay_date": utils.parse_pay_date(notification_data.get("vnp_PayDate"))
+                or False,
+            }
+        )
+
+    def _vnpay_apply_response_code(self, response_code):
+        """Update the state of the transaction according to the response code sent by VNPay.
+
+        Note: self.ensure_one()
+
+        :param str response_code: The `vnp_ResponseCode` of the notification data.
+        :return: None
+        """
+        self.ensure_one()
+
+        if response_code == "00":
+            # Confirm the transaction if the payment was successful.
+            _logger.debug("Received successful payment notification from VNPay, saving.")
+            self._set_done()
+            _logger.debug("Payment transaction completed.")
+        elif response_code == "24":
+            # Cancel the transaction if the payment was canceled by the user.
+            _logger.warning(
+                "Received canceled payment notification from VNPay, canceling."
+            )
+            self._set_canceled(state_message=_("The customer canceled the payment."))
+            _logger.debug("Payment transaction canceled.")
+        else:
+            # Notify the user that the payment failed.
+            _logger.warning(
+                "Received payment notification from VNPay with invalid response code: %s",
+                response_code,
+            )
+            self._set_error(
+                "VNPay: "
+                + _("Received data with invalid response code: %s", response_code)
+            )
+            _logger.debug("Payment transaction failed.")
+
+    @api.model
+    def _cron_vnpay_reconcile_transactions(self, batch_size=100, time_limit=240):
+        """Query the status of the VNPay transactions still waiting for their notification.
+
+        A transaction is queried once its payment URL, or the transaction itself if its URL was
+        signed before its date was kept, is older than the reconciliation delay of the provider, in
+        case the notification was lost. The transactions are selected in batches of increasing ids,
+        and each batch is committed on its own.
+
+        :param int batch_size: The maximum number of transactions queried per transaction.
+        :param int time_limit: The number of seconds after which the remaining transactions are
+                               left to the next run.
+        :return: None
+        """
+        auto_commit = not getattr(threading.current_thread(), "testing", False)
+        start_time = time.monotonic()
+        providers = (
+            self.env["payment.provider"]
+            .sudo()
+            .search([("code", "=", "vnpay"), ("state", "!=", "disabled")])
+        )
+        for provider in providers:
+            if not provider.vnpay_query_url:
+                continue
+            limit_date = fields.Datetime.now() - timedelta(
+                minutes=provider.vnpay_reconcile_delay
+            )
+            last_id = 0
+            while True:
+                self.env.cr.execute(
+                    """
+                    SELECT id
+                      FROM payment_transaction
+                     WHERE provider_id = %s
+                       AND state IN ('draft', 'pending')
+                       AND COALESCE(vnpay_payment_url_create_date, create_date) < %s
+                       AND id > %s
+                  ORDER BY id
+                     LIMIT %s
+                    """,
+                    [provider.id, limit_date, last_id, batch_size],
+                )
+                ids = [row[0] for row in self.env.cr.fetchall()]
+                if not ids:
+                    break
+                last_id = ids[-1]
+
+                self.sudo().browse(ids)._vnpay_reconcile(provider)
+                if not auto_commit:
+                    # A single batch is enough when the transaction can't be committed.
+                    return
+                self.env.cr.commit()
+
+                if time.monotonic() - start_time > time_limit:
+                    # Leave the remaining transactions to the next run, as soon as possible.
+                    self.env.ref("payment_vnpay.cron_reconcile_vnpay_transactions")._trigger()
+                    return
+
+    def _vnpay_reconcile(self, provider):
+        """Query the status of the transactions from VNPay and update them accordingly.
+
+        The payment made with any of the payment URLs signed for a transaction is queried, as
+        VNPay finds a payment by the date of its URL. The queries are sent concurrently through the
+        pooled HTTP client, then the responses are applied one transaction at a time.
+
+        :param recordset provider: The provider of the transactions, as a `payment.provider` record.
+        :return: None
+        """
+        queries = [
+            (tx, tx._vnpay_prepare_querydr_payload(transaction_date))
+            for tx in self
+            for transaction_date in tx._vnpay_get_payment_url_dates()
+        ]
+        client = http_client.get_client("vnpay_querydr", retries=1)
+        url = provider.vnpay_query_url
+
+        def query(payload):
+            try:
+                # A query only reads the status of the payment: it can be sent again safely.
+                return client.post_json(url, payload, idempotent=True)
+            except (requests.exceptions.RequestException, ValueError):
+                _logger.warning(
+                    "Unable to query the status of %s from VNPay.",
+                    payload["vnp_TxnRef"],
+                    exc_info=True,
+                )
+                return None
+
+        responses = client.map(
+            query, [payload for _tx, payload in queries], provider.vnpay_reconcile_concurrency
+        )
+        responses_by_tx = {tx: [] for tx in self}
+        for (tx, _payload), response in zip(queries, responses):
+            responses_by_tx[tx].append(response)
+        for tx in self:
+            response = self._vnpay_select_querydr_response(responses_by_tx[tx])
+            if response is None:
+                continue
+            try:
+                with self.env.cr.savepoint():
+                    tx._vnpay_apply_querydr_response(response)
+            except Exception:
+                _logger.exception("Unable to reconcile the transaction %s.", tx.reference)
+
+    def _vnpay_get_payment_url_dates(self):
+        """Return the creation dates of the payment URLs signed for the transaction.
+
+        The transactions whose URLs were signed before their dates were kept fall back on the date
+        of the last URL, or on the date of the transaction.
+
+        Note: self.ensure_one()
+
+        :return: The dates as sent to VNPay (vnp_CreateDate), the latest first.
+        :rtype: list
+        """
+        self.ensure_one()
+        if self.vnpay_payment_url_dates:
+            return self.vnpay_payment_url_dates.split(",")
+        create_date = self.vnpay_payment_url_create_date or self.create_date
+        if not create_date:
+            return []
+        vn_timezone = pytz.timezone("Etc/GMT-7")
+        return [pytz.utc.localize(create_date).astimezone(vn_timezone).strftime("%Y%m%d%H%M%S")]
+
+    @api.model
+    def _vnpay_select_querydr_response(self, responses):
+        """Select the response of the payment URL that was paid, among the responses to the queries
+        of the URLs of a transaction.
+
+        :param list responses: The responses, None for the queries that failed.
+        :return: The response of the paid URL, the one of any URL if VNPay has no payment for any of
+                 them, or None if the payment can't be known until the next reconciliation.
+        :rtype: dict
+        """
+        found = [
+            response
+            for response in responses
+            if response and response.get("vnp_ResponseCode") != const.QUERYDR_TRANSACTION_NOT_FOUND
+        ]
+        if found:
+            # A successful payment prevails over the failed attempts with the other URLs.
+            return next(
+                (response for response in found if response.get("vnp_TransactionStatus") == "00"),
+                found[0],
+            )
+        if not responses or None in responses:
+            return None
+        return responses[0]
+
+    def _vnpay_prepare_querydr_payload(self, transaction_date):
+        """Prepare the signed request of the transaction query (querydr) API.
+
+        Note: self.ensure_one()
+
+        :param str transaction_date: The creation date of the queried payment URL, see
+                                     :meth:`_vnpay_get_payment_url_dates`.
+        :return: The payload of the request.
+        :rtype: dict
+        """
+        self.ensure_one()
+        vn_timezone = pytz.timezone("Etc/GMT-7")
+        payload = {
+            "vnp_RequestId": uuid.uuid4().hex,
+            "vnp_Version": "2.1.0",
+            "vnp_Command": "querydr",
+            "vnp_TmnCode": self.provider_id.vnpay_tmn_code,
+            "vnp_TxnRef": self.reference,
+            "vnp_OrderInfo": f"Truy van giao dich {self.reference}",
+            "vnp_TransactionDate": transaction_date,
+            "vnp_CreateDate": datetime.now(vn_timezone).strftime("%Y%m%d%H%M%S"),
+            "vnp_IpAddr": _get_server_ip_address(),
+        }
+        payload["vnp_SecureHash"] = self.provider_id._vnpay_get_signer().sign_fields(
+            payload, const.QUERYDR_REQUEST_SIGNED_FIELDS
+        )
+        return payload
+
+    def _vnpay_apply_querydr_response(self, response):
+        """Update the transaction from the response of the transaction query API.
+
+        The transaction goes through the same state transitions as with the notification of the
+        payment.
+
+        Note: self.ensure_one()
+
+        :param dict response: The response of the transaction query API.
+        :return: None
+        """
+        self.ensure_one()
+        signature = self.provider_id._vnpay_get_signer().sign_fields(
+            response, const.QUERYDR_RESPONSE_SIGNED_FIELDS
+        )
+        if not hmac.compare_digest(signature, str(response.get("vnp_SecureHash") or "")):
+            _logger.warning(
+                "Received query response with invalid signature for %s.", self.reference
+            )
+            return
+
+        response_code = response.get("vnp_ResponseCode")
+        if response_code == const.QUERYDR_TRANSACTION_NOT_FOUND:
+            # The customer never paid before the payment URL expired.
+            self._vnpay_apply_response_code("24")
+            return
+        if response_code != "00":
+            _logger.warning(
+                "Unable to query the status of %s from VNPay, response code: %s",
+                self.reference,
+                response_code,
+            )
+            return
+
+        status = response.get("vnp_TransactionStatus")
+        if status in const.QUERYDR_PROCESSING_STATUSES:
+            _logger.info(
+                "The payment of %s is still processed by VNPay, status: %s", self.reference, status
+            )
+            return
+        notification_data = {
+            "vnp_TxnRef": response.get("vnp_TxnRef"),
+            "vnp_Amount": response.get("vnp_Amount"),
+            "vnp_TransactionNo": response.get("vnp_TransactionNo"),
+            "vnp_BankCode": response.get("vnp_BankCode"),
+            "vnp_PayDate": response.get("vnp_PayDate"),
+            "vnp_ResponseCode": const.QUERYDR_STATUS_MAPPING.get(status, status),
+        }
+        if notification_data["vnp_ResponseCode"] != "00":
+            self._vnpay_apply_response_code(notification_data["vnp_ResponseCode"])
+            return
+        try:
+            self._handle_notification_data("vnpay", notification_data)
+        except AssertionError:
+            _logger.warning(
+                "Received query response with invalid amount for %s.", self.reference
+            )
+            self._set_error("VNPay: " + _("Received data with invalid amount."))
+            return
+        self._vnpay_apply_response_code("00")
+
+    @api.model
+    def _vnpay_reconcile_settlement(
+        self, provider, fileobj, filename, report, chunk_size=const.SETTLEMENT_CHUNK_SIZE
+    ):
+        """Compare a VNPay settlement file with the transactions of the provider.
+
+        The file is streamed in chunks of rows, and the transactions of a chunk are fetched by
+        reference, provider reference or VNPay transaction number with a single query, so that
+        files of any size are compared in bounded memory. A row is written to the discrepancy
+        report when:
+
+        - `invalid_row`: it has no reference or no valid amount;
+        - `not_found`: it matches no transaction of the provider;
+        - `amount_mismatch`: its amount differs from the one of the transaction;
+        - `state_mismatch`: the payment is settled but the transaction is not done, or the reverse.
+
+        The transactions are left untouched.
+
+        :param recordset provider: The provider of the file, as a `payment.provider` record.
+        :param fileobj: The binary file object of the settlement file.
+        :param str filename: The name of the file, whose extension gives its format.
+        :param report: The text file object the discrepancy report is written to, as CSV.
+        :param int chunk_size: The number of rows compared at once.
+        :return: The number of rows read, of rows matching a transaction, and of discrepancies.
+        :rtype: dict
+        :raise UserError: If the file can't be read.
+        """
+        writer = csv.writer(report)
+        writer.writerow(const.SETTLEMENT_REPORT_HEADER)
+        summary = {"rows": 0, "matched": 0, "discrepancies": 0}
+        rows = settlement.iter_settlement_rows(fileobj, filename)
+        try:
+            for chunk in settlement.chunked(rows, chunk_size):
+                matched, discrepancies = self._vnpay_compare_settlement_chunk(provider, chunk)
+                writer.writerows(discrepancies)
+                summary["rows"] += len(chunk)
+                summary["matched"] += matched
+                summary["discrepancies"] += len(discrepancies)
+        except settlement.SettlementFileError as error:
+            raise UserError(_("Unable to read the settlement file: %s", error))
+        return summary
+
+    @api.model
+    def _vnpay_compare_settlement_chunk(self, provider, chunk):
+        """Compare a chunk of settlement rows with the transactions of the provider.
+
+        :param recordset provider: The provider of the file, as a `payment.provider` record.
+        :param list chunk: The line numbers and values of the rows, see
+                           :func:`settlement.iter_settlement_rows`.
+        :return: The number of rows matching a transaction, and the rows of the discrepancy report.
+        :rtype: tuple
+        """
+        rows = []
+        for line, values in chunk:
+            try:
+                amount = settlement.parse_amount(values["amount"])
+            except ValueError:
+                amount = None
+            rows.append(
+                (
+                    line,
+                    settlement.normalize_text(values["reference"]),
+                    settlement.normalize_text(values["provider_reference"]),
+                    amount,
+                    settlement.normalize_text(values["status"]),
+                )
+            )
+
+        self.flush_model(
+            [
+                "provider_id",
+                "reference",
+                "provider_reference",
+                "vnpay_transaction_no",
+                "amount",
+                "state",
+            ]
+        )
+        provider_references = [row[2] for row in rows if row[2]]
+        self.env.cr.execute(
+            """
+            SELECT reference, provider_reference, vnpay_transaction_no, amount, currency_id, state
+              FROM payment_transaction
+             WHERE provider_id = %s
+               AND (
+                       reference = ANY(%s)
+                    OR provider_reference = ANY(%s)
+                    OR vnpay_transaction_no = ANY(%s)
+               )
+            """,
+            [
+                provider.id,
+                [row[1] for row in rows if row[1]],
+                provider_references,
+                provider_references,
+            ],
+        )
+        by_reference, by_provider_reference = {}, {}
+        for tx in self.env.cr.dictfetchall():
+            by_reference[tx["reference"]] = tx
+            for provider_reference in (tx["vnpay_transaction_no"], tx["provider_reference"]):
+                if provider_reference:
+                    by_provider_reference.setdefault(provider_reference, tx)
+
+        matched = 0
+        discrepancies = []
+        for line, reference, provider_reference, amount, status in rows:
+            tx = None
+            if not (reference or provider_reference) or amount is None:
+                discrepancy = "invalid_row"
+            else:
+                tx = by_reference.get(reference) or by_provider_reference.get(provider_reference)
+                if not tx:
+                    discrepancy = "not_found"
+                else:
+                    matched += 1
+                    currency = self.env["res.currency"].browse(tx["currency_id"])
+                    if currency.compare_amounts(amount, float(tx["amount"])) != 0:
+                        discrepancy = "amount_mismatch"
+                    elif settlement.is_settled(status) != (tx["state"] == "done"):
+                        discrepancy = "state_mismatch"
+                    else:
+                        continue
+            discrepancies.append(
+                [
+                    line,
+                    reference,
+                    provider_reference,
+                    amount,
+                    status,
+                    tx and tx["reference"],
+                    tx and tx["amount"],
+                    tx and tx["state"],
+                    discrepancy,
+                ]
+            )
+        return matched, discrepancies
 
     # Override the _compute_reference and replace the separator with 'c'
     @api.model
@@ -152,7 +700,8 @@ class PaymentTransaction(models.Model):
 
         - `{separator}` is the string that separates the prefix from the sequence number.
         - `{sequence_number}` is the next integer in the sequence of references sharing the same
-        prefix. The sequence starts with `1` if there is only one matching reference.
+        prefix. The sequence starts with `1` if there is only one matching reference. It is
+        allocated by the `payment.vnpay.reference.counter` of the prefix and separator.
 
         .. example::
 
@@ -192,45 +741,23 @@ class PaymentTransaction(models.Model):
         ):  # Prefix not computed from the kwargs, fallback on time-based value
             prefix = payment_utils.singularize_reference_prefix()
 
-        # Compute the sequence number.
-        reference = prefix  # The first reference of a sequence has no sequence number.
-        if self.sudo().search(
-            [("reference", "=", prefix)]
-        ):  # The reference already has a match
-            # We now execute a second search on `payment.transaction` to fetch all the references
-            # starting with the given prefix. The load of these two searches is mitigated by the
-            # index on `reference`. Although not ideal, this solution allows for quickly knowing
-            # whether the sequence for a given prefix is already started or not, usually not. An SQL
-            # query wouldn't help either as the selector is arbitrary and doing that would be an
-            # open-door to SQL injections.
-            same_prefix_references = (
-                self.sudo()
-                .search([("reference", "=like", f"{prefix}{separator}%")])
-                .with_context(prefetch_fields=False)
-                .mapped("reference")
-            )
-
-            # A final regex search is necessary to figure out the next sequence number. The previous
-            # search could not rely on alphabetically sorting the reference to infer the largest
-            # sequence number because both the prefix and the separator are arbitrary. A given
-            # prefix could happen to be a substring of the reference from a different sequence.
-            # For instance, the prefix 'example' is a valid match for the existing references
-            # 'example', 'example-1' and 'example-ref', in that order. Trusting the order to infer
-            # the sequence number would lead to a collision with 'example-1'.
-            search_pattern = re.compile(rf"^{re.escape(prefix)}{separator}(\d+)$")
-            max_sequence_number = (
-                0  # If no match is found, start the sequence with this reference.
-            )
-            for existing_reference in same_prefix_references:
-                search_result = re.search(search_pattern, existing_reference)
-                if (
-                    search_result
-                ):  # The reference has the same prefix and is from the same sequence
-                    # Find the largest sequence number, if any.
-                    current_sequence = int(search_result.group(1))
-                    if current_sequence > max_sequence_number:
-                        max_sequence_number = current_sequence
-
-            # Compute the full reference.
-            reference = f"{prefix}{separator}{max_sequence_number + 1}"
+        # Compute the sequence number. The prefix alone is used while it is free; once it collides,
+        # the counters allocate the number with a single row update instead of scanning all the
+        # references sharing the prefix, and serialize concurrent allocations.
+        sequence_number = (
+            self.env["payment.vnpay.reference.counter"]
+            .sudo()
+            ._next_value(prefix, separator)
+        )
+        if not sequence_number:  # The first reference of a sequence has no sequence number.
+            return prefix
+        reference = f"{prefix}{separator}{sequence_number}"
         return reference
+
+
+def _get_server_ip_address():
+    """Return the IP address of the server, sent with the queries to the VNPay APIs."""
+    try:
+        return socket.gethostbyname(socket.gethostname())
+    except OSError:
+        return "127.0.0.1"
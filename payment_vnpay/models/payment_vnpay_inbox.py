@@ -0,0 +1,200 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from psycopg2.errors import SerializationFailure
+
+from odoo import _, api, fields, models
+
+from odoo.addons.payment_vnpay import const, utils
+
+_logger = logging.getLogger(__name__)
+
+
+class PaymentVNPayInbox(models.Model):
+    """Inbox of the notifications (IPN) acknowledged by the webhook and processed later by a cron.
+
+    When the provider is in inbox mode, the webhook only checks the origin and the signature of the
+    notification, appends it to this table and acknowledges it. The cron then drains the inbox in
+    batches, the notifications of the same reference being processed in their order of arrival.
+    """
+
+    _name = "payment.vnpay.inbox"
+    _description = "VNPay IPN Inbox"
+    _order = "id"
+
+    reference = fields.Char(string="Reference", required=True, readonly=True, index=True)
+    payload = fields.Json(string="Notification Data", required=True, readonly=True)
+    state = fields.Selection(
+        string="Status",
+        selection=[("pending", "Pending"), ("done", "Processed"), ("failed", "Failed")],
+        default="pending",
+        required=True,
+        readonly=True,
+        index=True,
+    )
+    error = fields.Text(string="Error", readonly=True)
+    processed_date = fields.Datetime(string="Processing Date", readonly=True)
+
+    @api.model
+    def _enqueue(self, data):
+        """Append the notification data to the inbox, and wake up the cron that processes it if
+        the inbox was empty.
+
+        When notifications are already pending, the cron is either running, and picks the new one
+        in its next batch, or scheduled; the new notification waits for the next run at worst.
+
+        :param dict data: The notification data, with a valid signature.
+        :return: The inbox entry.
+        :rtype: recordset of `payment.vnpay.inbox`
+        """
+        was_empty = not self.search_count([("state", "=", "pending")], limit=1)
+        entry = self.create({"reference": data["vnp_TxnRef"], "payload": data})
+        if was_empty:
+            self.env.ref("payment_vnpay.cron_process_vnpay_inbox")._trigger()
+        return entry
+
+    @api.model
+    def _cron_process_inbox(self, batch_size=50, time_limit=50):
+        """Process the pending notifications in batches.
+
+        Each batch is claimed with :meth:`_claim_batch` and committed on its own to keep the
+        transactions short, so that several runs, e.g. a manual one, never pick the same
+        notifications nor two notifications of the same reference. The cron triggers itself again
+        when notifications are left once time is up.
+
+        :param int batch_size: The maximum number of notifications processed per transaction.
+        :param int time_limit: The number of seconds after which the remaining notifications are
+                               left to the next run.
+        :return: None
+        """
+        auto_commit = not getattr(threading.current_thread(), "testing", False)
+        deadline = time.monotonic() + time_limit
+        while time.monotonic() <= deadline:
+            entries = self._claim_batch(batch_size)
+            if not entries:
+                break
+            entries._process_notifications()
+            if not auto_commit:
+                # A single batch is enough when the transaction can't be committed.
+                return
+            self.env.cr.commit()
+
+        if self.search_count([("state", "=", "pending")], limit=1):
+            # Leave the remaining notifications to the next run, as soon as possible.
+            self.env.ref("payment_vnpay.cron_process_vnpay_inbox")._trigger()
+
+    @api.model
+    def _claim_batch(self, batch_size):
+        """Lock the next batch of notifications to process.
+
+        The batch only contains the oldest pending notification of each reference, locked with
+        `SKIP LOCKED`: a notification is never processed before an older one of the same reference,
+        and concurrent runs never pick the same notifications. A notification processed by another
+        run since the transaction started can't be locked in REPEATABLE READ: the batch is then
+        empty, and the notifications are left to the next run, with a new snapshot.
+
+        :param int batch_size: The maximum number of notifications in the batch.
+        :return: The locked notifications.
+        :rtype: recordset of `payment.vnpay.inbox`
+        """
+        try:
+            with self.env.cr.savepoint(flush=False):
+                self.env.cr.execute(
+                    """
+                    SELECT id
+                      FROM payment_vnpay_inbox
+                     WHERE id IN (
+                         SELECT min(id)
+                           FROM payment_vnpay_inbox
+                          WHERE state = 'pending'
+                       GROUP BY reference
+                     )
+                  ORDER BY id
+                     LIMIT %s
+                       FOR UPDATE SKIP LOCKED
+                    """,
+                    [batch_size],
+                )
+                ids = [row[0] for row in self.env.cr.fetchall()]
+        except SerializationFailure:
+            _logger.info("The VNPay IPN inbox was processed concurrently, retrying later.")
+            return self.browse()
+        return self.browse(ids)
+
+    @api.model
+    def _cron_gc_processed(self, batch_size=1000, time_limit=50):
+        """Delete the notifications processed for longer than the retention period.
+
+        The rows are deleted in small batches, each committed on its own, so that the table is
+        never locked for long.
+
+        :param int batch_size: The maximum number of rows deleted per transaction.
+        :param int time_limit: The number of seconds after which the remaining rows are left to the
+                               next run.
+        :return: The number of deleted rows.
+        :rtype: int
+        """
+        limit_date = fields.Datetime.now() - timedelta(days=const.INBOX_RETENTION_DAYS)
+        return utils.delete_in_batches(
+            self.env,
+            """
+            DELETE FROM payment_vnpay_inbox
+             WHERE id IN (
+                 SELECT id
+                   FROM payment_vnpay_inbox
+                  WHERE state != 'pending'
+                    AND processed_date < %s
+               ORDER BY id
+                  LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+             )
+            """,
+            [limit_date],
+            batch_size,
+            time_limit,
+            "payment_vnpay.cron_gc_vnpay_inbox",
+        )
+
+    def _process_notifications(self):
+        """Apply the notifications to their transactions, as the webhook does in synchronous mode.
+
+        :return: None
+        """
+        for entry in self:
+            data = entry.payload
+            tx_sudo = self.env["payment.transaction"].sudo()
+            try:
+                with self.env.cr.savepoint():
+                    tx_sudo = tx_sudo._get_tx_from_notification_data("vnpay", data)
+                    if tx_sudo.state not in ("done", "cancel", "error"):
+                        tx_sudo._handle_notification_data("vnpay", data)
+                        tx_sudo._vnpay_apply_response_code(data.get("vnp_ResponseCode"))
+            except AssertionError as error:
+                _logger.warning(
+                    "Invalid amount for the notification of %s.", entry.reference
+                )
+                tx_sudo._set_error("VNPay: " + _("Received data with invalid amount."))
+                entry.write(
+                    {
+                        "state": "failed",
+                        "error": str(error),
+                        "processed_date": fields.Datetime.now(),
+                    }
+                )
+            except Exception as error:
+                _logger.exception(
+                    "Unable to process the notification of %s.", entry.reference
+                )
+                entry.write(
+                    {
+                        "state": "failed",
+                        "error": str(error),
+                        "processed_date": fields.Datetime.now(),
+                    }
+                )
+            else:
+                entry.write({"state": "done", "processed_date": fields.Datetime.now()})
@@ -0,0 +1,100 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import json
+from datetime import timedelta
+
+from odoo import api, fields, models
+
+from odoo.addons.payment_vnpay import const, utils
+
+
+class PaymentVNPayIPN(models.Model):
+    """Ledger of the notifications (IPN) already handled, used to answer VNPay's retries.
+
+    VNPay sends the same notification again until it gets an answer it considers final. The response
+    given to the first delivery is stored under a unique key built from the notification data, so
+    that the following deliveries are answered with a single indexed lookup, without recomputing
+    the signature nor writing anything.
+    """
+
+    _name = "payment.vnpay.ipn"
+    _description = "VNPay IPN Ledger"
+    _order = "id desc"
+
+    provider_code = fields.Char(string="Provider Code", required=True, readonly=True)
+    key = fields.Char(string="Notification Key", required=True, readonly=True)
+    response = fields.Json(string="Response", readonly=True)
+
+    _sql_constraints = [
+        (
+            "provider_code_key_uniq",
+            "unique(provider_code, key)",
+            "A notification can only be recorded once per provider.",
+        ),
+    ]
+
+    @api.model
+    def _get_response(self, provider_code, key):
+        """Return the response stored for the notification with the given key, if any.
+
+        :param str provider_code: The code of the provider that sent the notification.
+        :param str key: The key of the notification.
+        :return: The stored response, or None.
+        :rtype: dict
+        """
+        self.env.cr.execute(
+            "SELECT response FROM payment_vnpay_ipn WHERE provider_code = %s AND key = %s",
+            [provider_code, key],
+        )
+        row = self.env.cr.fetchone()
+        return row and row[0]
+
+    @api.model
+    def _record_response(self, provider_code, key, response):
+        """Store the response given to the notification with the given key.
+
+        A notification that is already recorded, e.g. by a concurrent delivery, is left untouched.
+
+        :param str provider_code: The code of the provider that sent the notification.
+        :param str key: The key of the notification.
+        :param dict response: The response given to VNPay.
+        :return: None
+        """
+        self.env.cr.execute(
+            """
+            INSERT INTO payment_vnpay_ipn (provider_code, key, response, create_uid, create_date)
+                 VALUES (%s, %s, %s, %s, NOW() AT TIME ZONE 'UTC')
+            ON CONFLICT (provider_code, key) DO NOTHING
+            """,
+            [provider_code, key, json.dumps(response), self.env.uid],
+        )
+
+    @api.model
+    def _cron_gc_responses(self, batch_size=1000, time_limit=50):
+        """Delete the responses recorded for longer than the retention period.
+
+        :param int batch_size: The maximum number of rows deleted per transaction.
+        :param int time_limit: The number of seconds after which the remaining rows are left to the
+                               next run.
+        :return: The number of deleted rows.
+        :rtype: int
+        """
+        limit_date = fields.Datetime.now() - timedelta(days=const.IPN_LEDGER_RETENTION_DAYS)
+        return utils.delete_in_batches(
+            self.env,
+            """
+            DELETE FROM payment_vnpay_ipn
+             WHERE id IN (
+                 SELECT id
+                   FROM payment_vnpay_ipn
+                  WHERE create_date < %s
+               ORDER BY id
+                  LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+             )
+            """,
+            [limit_date],
+            batch_size,
+            time_limit,
+            "payment_vnpay.cron_gc_vnpay_ipn_ledger",
+        )
@@ -0,0 +1,149 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import re
+
+from odoo import api, fields, models
+
+# The largest sequence number stored by the counters, whose `last_value` is an integer column.
+MAX_SEQUENCE_NUMBER = 2**31 - 1
+
+
+class PaymentVNPayReferenceCounter(models.Model):
+    """Last sequence number handed out for each transaction reference prefix and separator.
+
+    The counters replace the scan of all the references sharing a prefix: the next sequence number
+    is obtained with a single row update, whose lock serializes the concurrent allocations of the
+    same prefix until their transaction ends. A counter is only created once its prefix collides
+    with an existing reference, the prefixes used once don't need one.
+    """
+
+    _name = "payment.vnpay.reference.counter"
+    _description = "VNPay Transaction Reference Counter"
+
+    prefix = fields.Char(string="Prefix", required=True, readonly=True)
+    separator = fields.Char(string="Separator", required=True, readonly=True)
+    last_value = fields.Integer(string="Last Sequence Number", required=True, readonly=True)
+
+    _sql_constraints = [
+        (
+            "prefix_separator_uniq",
+            "unique(prefix, separator)",
+            "There can only be one counter per prefix and separator.",
+        ),
+    ]
+
+    @api.model
+    def _next_value(self, prefix, separator):
+        """Allocate the next sequence number of the references with the given prefix and separator.
+
+        The prefix alone is used as long as no transaction has it as reference, without any
+        counter. The first collision creates the counter of the prefix, see :meth:`_create_counter`.
+        If the allocated reference exists anyway, e.g. because it was created without the counter,
+        the counter continues after the largest number actually used.
+
+        :param str prefix: The prefix of the reference.
+        :param str separator: The separator between the prefix and the sequence number.
+        :return: The sequence number, `0` meaning that the prefix alone is the reference.
+        :rtype: int
+        """
+        if not self._reference_exists(prefix):
+            return 0
+
+        self.env.cr.execute(
+            """
+               UPDATE payment_vnpay_reference_counter
+                  SET last_value = last_value + 1,
+                      write_uid = %s,
+                      write_date = NOW() AT TIME ZONE 'UTC'
+                WHERE prefix = %s AND separator = %s
+            RETURNING last_value
+            """,
+            [self.env.uid, prefix, separator],
+        )
+        row = self.env.cr.fetchone()
+        if not row:
+            return self._create_counter(prefix, separator)
+
+        value = row[0]
+        if not self._reference_exists(f"{prefix}{separator}{value}"):
+            return value
+        self.env.cr.execute(
+            """
+               UPDATE payment_vnpay_reference_counter
+                  SET last_value = GREATEST(last_value, %s) + 1
+                WHERE prefix = %s AND separator = %s
+            RETURNING last_value
+            """,
+            [self._get_max_sequence_number(prefix, separator), prefix, separator],
+        )
+        return self.env.cr.fetchone()[0]
+
+    @api.model
+    def _create_counter(self, prefix, separator):
+        """Create the counter of a prefix and return its first sequence number.
+
+        The sequence continues after the largest number already used, which only requires a scan
+        for the prefixes used before the counters existed.
+
+        :param str prefix: The prefix of the reference.
+        :param str separator: The separator between the prefix and the sequence number.
+        :return: The sequence number.
+        :rtype: int
+        """
+        # A concurrent allocation may create the counter in the meantime: the conflict makes this
+        # one wait for it and take the next number.
+        self.env.cr.execute(
+            """
+            INSERT INTO payment_vnpay_reference_counter AS counter (
+                prefix, separator, last_value, create_uid, create_date, write_uid, write_date
+            )
+            VALUES (%s, %s, %s, %s, NOW() AT TIME ZONE 'UTC', %s, NOW() AT TIME ZONE 'UTC')
+            ON CONFLICT (prefix, separator)
+            DO UPDATE SET last_value = counter.last_value + 1
+            RETURNING last_value
+            """,
+            [
+                prefix,
+                separator,
+                self._get_max_sequence_number(prefix, separator) + 1,
+                self.env.uid,
+                self.env.uid,
+            ],
+        )
+        return self.env.cr.fetchone()[0]
+
+    @api.model
+    def _reference_exists(self, reference):
+        self.env.cr.execute(
+            "SELECT 1 FROM payment_transaction WHERE reference = %s LIMIT 1", [reference]
+        )
+        return bool(self.env.cr.fetchone())
+
+    @api.model
+    def _get_max_sequence_number(self, prefix, separator):
+        """Return the largest sequence number of the references with the given prefix and separator.
+
+        The numbers that don't fit in the counter are ignored: they are not sequence numbers but
+        parts of the prefix, e.g. the timestamp of `tx-20241017120512`.
+
+        :param str prefix: The prefix of the reference.
+        :param str separator: The separator between the prefix and the sequence number.
+        :return: The sequence number, or 0 if there is none.
+        :rtype: int
+        """
+        offset = len(prefix) + len(separator) + 1
+        self.env.cr.execute(
+            r"""
+            SELECT max(substr(reference, %(offset)s)::bigint)
+                   FILTER (WHERE substr(reference, %(offset)s)::bigint <= %(max_value)s)
+              FROM payment_transaction
+             WHERE reference LIKE %(pattern)s
+               AND substr(reference, %(offset)s) ~ '^\d{1,10}$'
+            """,
+            {
+                "offset": offset,
+                "pattern": re.sub(r"([\\%_])", r"\\\1", prefix + separator) + "%",
+                "max_value": MAX_SEQUENCE_NUMBER,
+            },
+        )
+        return self.env.cr.fetchone()[0] or 0
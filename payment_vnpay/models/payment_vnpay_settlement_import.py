@@ -0,0 +1,92 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import base64
+import io
+from contextlib import contextmanager
+
+from odoo import fields, models
+
+
+class PaymentVNPaySettlementImport(models.TransientModel):
+    """Wizard comparing a VNPay settlement file with the transactions of a provider.
+
+    The uploaded file is streamed from the filestore, see
+    :meth:`payment.transaction._vnpay_reconcile_settlement`. The very large files are better
+    imported with the `vnpay_settlement` command, which is not bound by the request time limit.
+    """
+
+    _name = "payment.vnpay.settlement.import"
+    _description = "VNPay Settlement Import"
+
+    provider_id = fields.Many2one(
+        string="Provider",
+        comodel_name="payment.provider",
+        domain=[("code", "=", "vnpay")],
+        required=True,
+        ondelete="cascade",
+    )
+    settlement_file = fields.Binary(string="Settlement File", required=True, attachment=True)
+    settlement_filename = fields.Char(string="Settlement File Name")
+    state = fields.Selection(
+        selection=[("draft", "Draft"), ("done", "Done")], default="draft", required=True
+    )
+    rows_count = fields.Integer(string="Rows", readonly=True)
+    matched_count = fields.Integer(string="Matched Transactions", readonly=True)
+    discrepancy_count = fields.Integer(string="Discrepancies", readonly=True)
+    report_file = fields.Binary(string="Discrepancy Report", readonly=True, attachment=True)
+    report_filename = fields.Char(string="Discrepancy Report Name", readonly=True)
+
+    def action_import(self):
+        """Compare the settlement file with the transactions and attach the discrepancy report.
+
+        Note: self.ensure_one()
+
+        :return: The action reopening the wizard on its results.
+        :rtype: dict
+        """
+        self.ensure_one()
+        filename = self.settlement_filename or "settlement.csv"
+        report = io.StringIO()
+        with self._open_settlement_file() as fileobj:
+            summary = self.env["payment.transaction"].sudo()._vnpay_reconcile_settlement(
+                self.provider_id, fileobj, filename, report
+            )
+        self.write(
+            {
+                "state": "done",
+                "rows_count": summary["rows"],
+                "matched_count": summary["matched"],
+                "discrepancy_count": summary["discrepancies"],
+                "report_file": base64.b64encode(report.getvalue().encode()),
+                "report_filename": f"{filename.rsplit('.', 1)[0]}-discrepancies.csv",
+            }
+        )
+        return {
+            "name": self.provider_id.display_name,
+            "type": "ir.actions.act_window",
+            "res_model": self._name,
+            "res_id": self.id,
+            "view_mode": "form",
+            "target": "new",
+        }
+
+    @contextmanager
+    def _open_settlement_file(self):
+        """Open the uploaded settlement file for reading, from the filestore if possible."""
+        attachment = (
+            self.env["ir.attachment"]
+            .sudo()
+            .search(
+                [
+                    ("res_model", "=", self._name),
+                    ("res_field", "=", "settlement_file"),
+                    ("res_id", "=", self.id),
+                ],
+                limit=1,
+            )
+        )
+        if attachment.store_fname:
+            with open(attachment._full_path(attachment.store_fname), "rb") as fileobj:
+                yield fileobj
+        else:
+            yield io.BytesIO(attachment.raw or b"")
@@ -0,0 +1,171 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import csv
+import io
+import re
+from itertools import islice
+
+# The headers recognized for each column of a settlement file, compared case-insensitively.
+SETTLEMENT_COLUMNS = {
+    "reference": ("vnp_txnref", "txnref", "txn_ref", "reference", "mã đơn hàng", "ma don hang"),
+    "provider_reference": (
+        "vnp_transactionno",
+        "transactionno",
+        "transaction_no",
+        "qrtrace",
+        "provider_reference",
+        "mã giao dịch vnpay",
+        "ma giao dich vnpay",
+    ),
+    "amount": ("amount", "settlement_amount", "số tiền", "so tien"),
+    "status": ("status", "vnp_transactionstatus", "transaction_status", "trạng thái", "trang thai"),
+}
+
+# The statuses of the settled payments, "0" being the "00" of the Excel files read as a number.
+# The rows of a file without status column are all settled.
+SETTLED_STATUSES = frozenset({"00", "0", "success", "successful", "thành công", "thanh cong"})
+
+# The delimiters of the CSV files, by order of preference.
+CSV_DELIMITERS = (",", ";", "\t")
+
+# The number of rows scanned for the header, below the title rows of some exports.
+HEADER_SCAN_LIMIT = 20
+
+# The amounts written with dots as thousands separators, e.g. "1.500.000".
+_DOTTED_AMOUNT_RE = re.compile(r"^-?\d{1,3}(\.\d{3})+$")
+
+
+class SettlementFileError(ValueError):
+    """Raised when a settlement file can't be read."""
+
+
+def iter_settlement_rows(fileobj, filename):
+    """Stream the rows of a settlement file, without loading it in memory.
+
+    The CSV files are read line by line, the Excel files through the read-only mode of `openpyxl`.
+
+    :param fileobj: The binary file object of the settlement file.
+    :param str filename: The name of the file, whose extension gives its format.
+    :return: The line number and the values of each row, keyed by the names of
+             :data:`SETTLEMENT_COLUMNS`; missing columns are None.
+    :rtype: iterator of (int, dict)
+    :raise SettlementFileError: If the format is not supported or no header is found.
+    """
+    extension = filename.rsplit(".", 1)[-1].lower() if "." in filename else "csv"
+    if extension in ("csv", "txt"):
+        rows = _iter_csv_rows(fileobj)
+    elif extension in ("xlsx", "xlsm"):
+        rows = _iter_xlsx_rows(fileobj)
+    else:
+        raise SettlementFileError(f"Unsupported settlement file format: {extension}.")
+
+    rows = enumerate(rows, start=1)
+    columns = None
+    for line, row in islice(rows, HEADER_SCAN_LIMIT):
+        columns = _match_header(row)
+        if columns:
+            break
+    if not columns:
+        raise SettlementFileError(
+            "No header with a reference and an amount column found in the settlement file."
+        )
+
+    for line, row in rows:
+        if not any(value not in (None, "") for value in row):
+            continue
+        yield line, {
+            name: row[index] if index is not None and index < len(row) else None
+            for name, index in columns.items()
+        }
+
+
+def _iter_csv_rows(fileobj):
+    stream = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    sample = list(islice(stream, HEADER_SCAN_LIMIT))
+    stream.seek(0)
+    # The delimiter is the one splitting a line of the sample into a header; the title rows of
+    # some exports keep the sniffer of the csv module from guessing it.
+    delimiter = next(
+        (
+            delimiter
+            for delimiter in CSV_DELIMITERS
+            if any(_match_header(row) for row in csv.reader(sample, delimiter=delimiter))
+        ),
+        CSV_DELIMITERS[0],
+    )
+    try:
+        yield from csv.reader(stream, delimiter=delimiter)
+    finally:
+        # Don't close the file object of the caller along with the wrapper.
+        stream.detach()
+
+
+def _iter_xlsx_rows(fileobj):
+    try:
+        import openpyxl
+    except ImportError:
+        raise SettlementFileError("Reading Excel files requires the openpyxl library.")
+    workbook = openpyxl.load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def _match_header(row):
+    """Return the index of each column in the given header row, or None if it is not a header."""
+    headers = [str(value).strip().casefold() if value is not None else "" for value in row]
+    columns = {
+        name: next((index for index, header in enumerate(headers) if header in aliases), None)
+        for name, aliases in SETTLEMENT_COLUMNS.items()
+    }
+    has_reference = columns["reference"] is not None or columns["provider_reference"] is not None
+    if not has_reference or columns["amount"] is None:
+        return None
+    return columns
+
+
+def chunked(iterable, size):
+    """Split the iterable into lists of at most `size` items, lazily."""
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def normalize_text(value):
+    """Return the value of a cell as a stripped string, or None if it is empty."""
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        # The numeric references are read as floats from the Excel files.
+        value = int(value)
+    value = str(value).strip()
+    return value or None
+
+
+def parse_amount(value):
+    """Parse the amount of a settlement row.
+
+    VND has no minor unit, so the dots of the amounts written like "1.500.000" are thousands
+    separators, as are the commas and the spaces.
+
+    :param value: The value of the cell.
+    :return: The amount.
+    :rtype: float
+    :raise ValueError: If the value is not an amount.
+    """
+    if isinstance(value, (int, float)):
+        return float(value)
+    value = normalize_text(value)
+    if value is None:
+        raise ValueError("Missing amount.")
+    value = re.sub(r"[\s,]|VND|đ", "", value, flags=re.IGNORECASE)
+    if _DOTTED_AMOUNT_RE.match(value):
+        value = value.replace(".", "")
+    return float(value)
+
+
+def is_settled(status):
+    """Return whether the status of a settlement row is the one of a settled payment."""
+    status = normalize_text(status)
+    return status is None or status.casefold() in SETTLED_STATUSES
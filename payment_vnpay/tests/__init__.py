@@ -0,0 +1,11 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from . import test_vnpay_benchmark
+from . import test_vnpay_http_client
+from . import test_vnpay_inbox
+from . import test_vnpay_reconciliation
+from . import test_vnpay_reference_counter
+from . import test_vnpay_notification_routing
+from . import test_vnpay_payment_url
+from . import test_vnpay_settlement
+from . import test_vnpay_webhook
@@ -0,0 +1,110 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import json
+import logging
+import os
+import statistics
+import time
+
+from odoo.addons.payment.tests.common import PaymentCommon
+from odoo.addons.payment_vnpay import utils
+
+_logger = logging.getLogger(__name__)
+
+
+class VNPayCommon(PaymentCommon):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.vnpay = cls._prepare_provider(
+            "vnpay",
+            update_values={
+                "vnpay_tmn_code": "DEMOV210",
+                "vnpay_hash_secret": "ZXCVBNMASDFGHJKLQWERTYUIOP123456",
+                "vnpay_payment_link": "https://sandbox.vnpayment.vn/paymentv2/vpcpay.html",
+                "vnpay_white_list_ip": "127.0.0.1",
+            },
+        )
+        cls.provider = cls.vnpay
+        cls.currency = cls._prepare_currency("VND")
+        cls.payment_method_id = cls.env.ref("payment_vnpay.payment_method_vnpay").id
+        cls.amount = 100000
+
+    def _make_notification_data(self, reference, transaction_no, response_code="00", **values):
+        """Return the notification data of a payment, signed as VNPay does."""
+        data = {
+            "vnp_Amount": str(int(self.amount * 100)),
+            "vnp_BankCode": "NCB",
+            "vnp_BankTranNo": f"VNP{transaction_no}",
+            "vnp_CardType": "ATM",
+            "vnp_OrderInfo": f"Thanh toan don hang {reference}",
+            "vnp_PayDate": "20241017120512",
+            "vnp_ResponseCode": response_code,
+            "vnp_TmnCode": self.vnpay.vnpay_tmn_code,
+            "vnp_TransactionNo": str(transaction_no),
+            "vnp_TransactionStatus": response_code,
+            "vnp_TxnRef": reference,
+            **values,
+        }
+        data["vnp_SecureHash"] = self.vnpay._vnpay_get_signer().sign(
+            utils.canonicalize(data, prefix="vnp_")
+        )
+        return data
+
+
+class VNPayBenchmarkMixin:
+    """Measure the duration of operations and report them in a machine-readable format.
+
+    The results of a class are written as JSON lines to the file set in the `VNPAY_BENCH_OUTPUT`
+    environment variable, or logged if it is not set.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.bench_results = []
+
+    @classmethod
+    def tearDownClass(cls):
+        output_path = os.environ.get("VNPAY_BENCH_OUTPUT")
+        if output_path:
+            with open(output_path, "a") as output:
+                for result in cls.bench_results:
+                    output.write(json.dumps(result) + "\n")
+        else:
+            for result in cls.bench_results:
+                _logger.info("VNPAY_BENCH %s", json.dumps(result))
+        super().tearDownClass()
+
+    def bench(self, name, func, iterations, **params):
+        """Call `func(i)` for `i` in `range(iterations)` and record the duration of the calls.
+
+        :param str name: The name of the benchmark.
+        :param callable func: The measured operation, called with the iteration number.
+        :param int iterations: The number of calls.
+        :param dict params: The parameters of the benchmark, reported with the results.
+        :return: The recorded result.
+        :rtype: dict
+        """
+        durations = []
+        for i in range(iterations):
+            start = time.perf_counter()
+            func(i)
+            durations.append(time.perf_counter() - start)
+
+        durations.sort()
+        result = {
+            "name": name,
+            "class": type(self).__name__,
+            "iterations": iterations,
+            "params": params,
+            "total_s": sum(durations),
+            "mean_ms": statistics.fmean(durations) * 1000,
+            "p50_ms": durations[len(durations) // 2] * 1000,
+            "p95_ms": durations[min(len(durations) - 1, int(len(durations) * 0.95))] * 1000,
+            "max_ms": durations[-1] * 1000,
+        }
+        self.bench_results.append(result)
+        return result
@@ -0,0 +1,142 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import os
+import random
+from datetime import datetime
+from urllib.parse import urlencode
+
+from odoo.tests import tagged
+
+from odoo.addons.payment.tests.http_common import PaymentHttpCommon
+from odoo.addons.payment_vnpay.controllers.main import VNPayController
+from odoo.addons.payment_vnpay.tests.common import VNPayBenchmarkMixin, VNPayCommon
+
+ITERATIONS = int(os.environ.get("VNPAY_BENCH_ITERATIONS", 1000))
+REFERENCE_COUNTS = [
+    int(count)
+    for count in os.environ.get("VNPAY_BENCH_REFERENCES", "10000,100000,1000000").split(",")
+]
+
+
+@tagged("-standard", "vnpay_bench", "post_install", "-at_install")
+class TestVNPayBenchmark(VNPayBenchmarkMixin, VNPayCommon, PaymentHttpCommon):
+    """Benchmarks of the e-commerce hot paths.
+
+    Run them against a local test database with:
+    `odoo-bin -d <db> -i payment_vnpay --test-tags vnpay_bench --stop-after-init`
+    and set `VNPAY_BENCH_OUTPUT` to collect the results as JSON lines.
+    """
+
+    def _insert_references(self, prefix, start, stop):
+        """Insert the transactions `{prefix}c{n}` for `n` in `[start, stop[`, in one query."""
+        self.env.cr.execute(
+            """
+            INSERT INTO payment_transaction (
+                provider_id, company_id, payment_method_id, reference, amount, currency_id,
+                partner_id, state, operation, create_date, write_date
+            )
+            SELECT %(provider_id)s, %(company_id)s, %(payment_method_id)s,
+                   %(prefix)s || 'c' || n, %(amount)s, %(currency_id)s, %(partner_id)s, 'done',
+                   'online_redirect', NOW() AT TIME ZONE 'UTC', NOW() AT TIME ZONE 'UTC'
+              FROM generate_series(%(start)s, %(stop)s - 1) AS n
+            """,
+            {
+                "provider_id": self.vnpay.id,
+                "company_id": self.vnpay.company_id.id,
+                "payment_method_id": self.payment_method_id,
+                "prefix": prefix,
+                "amount": self.amount,
+                "currency_id": self.currency.id,
+                "partner_id": self.partner.id,
+                "start": start,
+                "stop": stop,
+            },
+        )
+        self.env["payment.transaction"].invalidate_model()
+
+    def _get_payment_params(self, i):
+        return {
+            "vnp_Version": "2.1.1",
+            "vnp_Command": "pay",
+            "vnp_TmnCode": self.vnpay.vnpay_tmn_code,
+            "vnp_Amount": int(self.amount * 100),
+            "vnp_CreateDate": datetime.now().strftime("%Y%m%d%H%M%S"),
+            "vnp_CurrCode": "VND",
+            "vnp_IpAddr": "127.0.0.1",
+            "vnp_Locale": "vn",
+            "vnp_OrderInfo": f"Thanh toan don hang BENCH{i} voi so tien la {self.amount} VND",
+            "vnp_OrderType": "billpayment",
+            "vnp_ReturnUrl": self.base_url() + VNPayController._return_url,
+            "vnp_ExpireDate": datetime.now().strftime("%Y%m%d%H%M%S"),
+            "vnp_TxnRef": f"BENCH{i}",
+        }
+
+    def test_bench_get_payment_url(self):
+        params = [self._get_payment_params(i) for i in range(ITERATIONS)]
+        secret = self.vnpay.vnpay_hash_secret
+        self.bench(
+            "payment_vnpay/_get_payment_url",
+            lambda i: self.vnpay._get_payment_url(params[i], secret),
+            ITERATIONS,
+        )
+
+    def test_bench_verify_notification_signature(self):
+        tx = self._create_transaction("redirect", reference="BENCH-SIGN")
+        notifications = [
+            self._make_notification_data(tx.reference, 14000000 + i) for i in range(ITERATIONS)
+        ]
+        self.bench(
+            "payment_vnpay/_verify_notification_signature",
+            lambda i: VNPayController._verify_notification_signature(notifications[i], tx),
+            ITERATIONS,
+        )
+
+    def test_bench_compute_reference_and_tx_lookup(self):
+        prefix = "BENCHREF"
+        self._create_transaction("redirect", reference=prefix)
+        inserted = 1
+        for count in REFERENCE_COUNTS:
+            self._insert_references(prefix, inserted, count)
+            inserted = count
+            self.bench(
+                "payment_vnpay/_compute_reference",
+                lambda i: self.env["payment.transaction"]._compute_reference(
+                    "vnpay", prefix=prefix
+                ),
+                min(ITERATIONS, 20),
+                existing_references=count,
+            )
+
+            references = [f"{prefix}c{random.randrange(1, count)}" for _i in range(ITERATIONS)]
+            self.bench(
+                "payment_vnpay/_get_tx_from_notification_data",
+                lambda i: self.env["payment.transaction"]._get_tx_from_notification_data(
+                    "vnpay", {"vnp_TxnRef": references[i]}
+                ),
+                ITERATIONS,
+                existing_references=count,
+            )
+
+    def test_bench_webhook_cycle(self):
+        iterations = min(ITERATIONS, 500)
+        notifications = []
+        for i in range(iterations):
+            tx = self._create_transaction(
+                "redirect", reference=f"BENCH-IPN-{i}", state="pending"
+            )
+            notifications.append(self._make_notification_data(tx.reference, 15000000 + i))
+        urls = [
+            f"{VNPayController._ipn_url}?{urlencode(data)}" for data in notifications
+        ]
+
+        self.bench(
+            "payment_vnpay/vnpay_webhook",
+            lambda i: self.url_open(urls[i]),
+            iterations,
+        )
+        # VNPay's retries of the same notifications, answered from the ledger.
+        self.bench(
+            "payment_vnpay/vnpay_webhook_retry",
+            lambda i: self.url_open(urls[i]),
+            iterations,
+        )
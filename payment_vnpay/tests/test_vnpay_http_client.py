@@ -0,0 +1,87 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import time
+from unittest.mock import patch
+
+import requests
+
+from odoo.tests import tagged
+from odoo.tests.common import BaseCase
+
+from odoo.addons.payment_vnpay import http_client
+
+URL = "https://vnpay.test/api"
+
+
+def _make_response(status_code, content=b'{"code": "00"}'):
+    response = requests.Response()
+    response.status_code = status_code
+    response.reason = "Test"
+    response.url = URL
+    response._content = content
+    return response
+
+
+@tagged("post_install", "-at_install")
+class TestVNPayHttpClient(BaseCase):
+
+    def _post(self, client, side_effect, idempotent=False):
+        """Send a request with the given results of the attempts, and return the number of them."""
+        with patch.object(client.session, "post", side_effect=side_effect) as post:
+            try:
+                client.post_json(URL, {}, idempotent=idempotent)
+            finally:
+                self.attempts = post.call_count
+
+    def test_connection_errors_are_retried(self):
+        client = http_client.VNPayHttpClient(retries=2, backoff=0)
+        self._post(client, [requests.exceptions.ConnectTimeout(), _make_response(200)])
+        self.assertEqual(self.attempts, 2)
+
+    def test_gateway_errors_are_retried(self):
+        client = http_client.VNPayHttpClient(retries=3, backoff=0)
+        responses = [_make_response(status) for status in (502, 503, 504)]
+        self._post(client, [*responses, _make_response(200)])
+        self.assertEqual(self.attempts, 4)
+
+        with self.assertRaises(requests.exceptions.HTTPError):
+            self._post(client, [_make_response(500), _make_response(200)])
+        self.assertEqual(self.attempts, 1, "The API may have processed the request.")
+
+    def test_read_timeouts_are_only_retried_if_idempotent(self):
+        client = http_client.VNPayHttpClient(retries=2, backoff=0)
+        with self.assertRaises(requests.exceptions.ReadTimeout):
+            self._post(client, [requests.exceptions.ReadTimeout(), _make_response(200)])
+        self.assertEqual(self.attempts, 1)
+
+        self._post(
+            client, [requests.exceptions.ReadTimeout(), _make_response(200)], idempotent=True
+        )
+        self.assertEqual(self.attempts, 2)
+
+    def test_circuit_opens_and_half_opens(self):
+        client = http_client.VNPayHttpClient(breaker_threshold=2, breaker_cooldown=0.05)
+        for _i in range(2):
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                self._post(client, [requests.exceptions.ConnectionError()])
+
+        with self.assertRaises(http_client.CircuitOpenError):
+            self._post(client, [_make_response(200)])
+        self.assertEqual(self.attempts, 0, "The open circuit must fail fast.")
+
+        # Once the cooldown elapsed, a single trial request is let through.
+        time.sleep(0.06)
+        self.assertTrue(client.breaker.allow())
+        self.assertFalse(client.breaker.allow())
+        client.breaker.record_success()
+        self._post(client, [_make_response(200)])
+        self.assertEqual(self.attempts, 1)
+
+    def test_replaced_client_is_closed(self):
+        self.addCleanup(http_client._clients.pop, "test_replaced", None)
+        client = http_client.get_client("test_replaced", retries=0)
+        self.assertIs(http_client.get_client("test_replaced", retries=0), client)
+
+        with patch.object(client, "close") as close:
+            self.assertIsNot(http_client.get_client("test_replaced", retries=1), client)
+        close.assert_called_once()
@@ -0,0 +1,56 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from datetime import timedelta
+from unittest.mock import patch
+
+from odoo import fields
+from odoo.tests import tagged
+
+from odoo.addons.payment_vnpay import const
+from odoo.addons.payment_vnpay.tests.common import VNPayCommon
+
+
+@tagged("post_install", "-at_install")
+class TestVNPayInbox(VNPayCommon):
+
+    def test_batches_hold_one_notification_per_reference(self):
+        Inbox = self.env["payment.vnpay.inbox"]
+        first = Inbox.create({"reference": "INBOX-1", "payload": {"vnp_TxnRef": "INBOX-1"}})
+        Inbox.create({"reference": "INBOX-1", "payload": {"vnp_TxnRef": "INBOX-1"}})
+        other = Inbox.create({"reference": "INBOX-2", "payload": {"vnp_TxnRef": "INBOX-2"}})
+
+        self.assertEqual(Inbox._claim_batch(10), first + other)
+
+    def test_cron_is_only_triggered_for_an_empty_inbox(self):
+        Inbox = self.env["payment.vnpay.inbox"]
+        Inbox.search([("state", "=", "pending")]).write({"state": "done"})
+        with patch.object(self.registry["ir.cron"], "_trigger") as trigger:
+            Inbox._enqueue({"vnp_TxnRef": "INBOX-3"})
+            Inbox._enqueue({"vnp_TxnRef": "INBOX-4"})
+        trigger.assert_called_once()
+
+    def test_processed_notifications_are_deleted(self):
+        Inbox = self.env["payment.vnpay.inbox"]
+        old_date = fields.Datetime.now() - timedelta(days=const.INBOX_RETENTION_DAYS + 1)
+        old = Inbox.create({"reference": "INBOX-OLD", "payload": {}})
+        old.write({"state": "failed", "processed_date": old_date})
+        recent = Inbox.create({"reference": "INBOX-RECENT", "payload": {}})
+        recent.write({"state": "done", "processed_date": fields.Datetime.now()})
+        pending = Inbox.create({"reference": "INBOX-PENDING", "payload": {}})
+        self.env.flush_all()
+
+        self.assertEqual(Inbox._cron_gc_processed(batch_size=1), 1)
+        self.assertEqual((old + recent + pending).exists(), recent + pending)
+
+    def test_old_ipn_responses_are_deleted(self):
+        Ledger = self.env["payment.vnpay.ipn"]
+        Ledger._record_response("vnpay", "OLD", {"RspCode": "00"})
+        Ledger._record_response("vnpay", "RECENT", {"RspCode": "00"})
+        self.env.cr.execute(
+            "UPDATE payment_vnpay_ipn SET create_date = %s WHERE key = 'OLD'",
+            [fields.Datetime.now() - timedelta(days=const.IPN_LEDGER_RETENTION_DAYS + 1)],
+        )
+
+        self.assertEqual(Ledger._cron_gc_responses(), 1)
+        self.assertIsNone(Ledger._get_response("vnpay", "OLD"))
+        self.assertEqual(Ledger._get_response("vnpay", "RECENT"), {"RspCode": "00"})
@@ -0,0 +1,86 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from datetime import datetime
+from unittest.mock import patch
+
+from odoo.exceptions import ValidationError
+from odoo.tests import tagged
+
+from odoo.addons.payment_vnpay.tests.common import VNPayCommon
+
+
+@tagged("post_install", "-at_install")
+class TestVNPayNotificationRouting(VNPayCommon):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.vnpay_brand = cls.vnpay.copy(
+            {
+                "name": "VNPay Brand",
+                "vnpay_tmn_code": "BRAND210",
+                "vnpay_hash_secret": "QWERTYUIOPASDFGHJKLZXCVBNM654321",
+                "vnpay_white_list_ip": "10.0.0.1",
+            }
+        )
+
+    def test_configs_are_routed_by_tmn_code(self):
+        Provider = self.env["payment.provider"]
+        config = Provider._vnpay_get_cached_config_for_notification(
+            "vnpay", {"vnp_TmnCode": "BRAND210"}
+        )
+        self.assertEqual(config["provider_id"], self.vnpay_brand.id)
+        self.assertEqual(config["vnpay_white_list_ip"], frozenset({"10.0.0.1"}))
+        self.assertIsNone(
+            Provider._vnpay_get_cached_config_for_notification("vnpay", {"vnp_TmnCode": "UNKNOWN"})
+        )
+
+        self.vnpay_brand.vnpay_tmn_code = "BRAND211"
+        config = Provider._vnpay_get_cached_config_for_notification(
+            "vnpay", {"vnp_TmnCode": "BRAND211"}
+        )
+        self.assertEqual(
+            config["provider_id"], self.vnpay_brand.id, "The map must follow the providers."
+        )
+
+    def test_cache_is_only_cleared_by_the_cached_fields(self):
+        with patch.object(self.env.registry, "clear_cache") as clear_cache:
+            self.vnpay_brand.vnpay_reconcile_delay = 30
+            self.env.ref("payment_vnpay.payment_method_vnpay").name = "VNPay ATM"
+            clear_cache.assert_not_called()
+
+            self.vnpay_brand.vnpay_white_list_ip = "10.0.0.2"
+            clear_cache.assert_called_once()
+
+    def test_reference_lookup_is_limited_to_the_provider(self):
+        tx = self._create_transaction("redirect", reference="ROUTING-1")
+        data = self._make_notification_data(tx.reference, 16000001)
+        self.assertEqual(
+            self.env["payment.transaction"]._get_tx_from_notification_data("vnpay", data), tx
+        )
+
+        data["vnp_TmnCode"] = self.vnpay_brand.vnpay_tmn_code
+        with self.assertRaises(ValidationError):
+            self.env["payment.transaction"]._get_tx_from_notification_data("vnpay", data)
+
+    def test_notification_fields_are_stored(self):
+        tx = self._create_transaction("redirect", reference="ROUTING-2")
+        tx._process_notification_data(self._make_notification_data(tx.reference, 16000002))
+
+        self.assertRecordValues(
+            tx,
+            [
+                {
+                    "provider_reference": tx.reference,
+                    "vnpay_transaction_no": "16000002",
+                    "vnpay_bank_code": "NCB",
+                    "vnpay_bank_tran_no": "VNP16000002",
+                    "vnpay_card_type": "ATM",
+                    "vnpay_pay_date": datetime(2024, 10, 17, 5, 5, 12),
+                }
+            ],
+        )
+        self.assertEqual(
+            self.env["payment.transaction"].search([("vnpay_bank_tran_no", "=", "VNP16000002")]),
+            tx,
+        )
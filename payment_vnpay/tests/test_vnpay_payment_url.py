@@ -0,0 +1,40 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from datetime import timedelta
+
+from odoo import fields
+from odoo.tests import tagged
+
+from odoo.addons.payment_vnpay.tests.common import VNPayCommon
+
+
+@tagged("post_install", "-at_install")
+class TestVNPayPaymentUrl(VNPayCommon):
+
+    def test_payment_url_is_signed_again_after_reconfiguration(self):
+        tx = self._create_transaction("redirect", reference="URL-1")
+        url = tx._get_specific_rendering_values({})["api_url"]
+        self.assertEqual(
+            tx._get_specific_rendering_values({})["api_url"], url, "The URL must be reused."
+        )
+
+        self.vnpay.vnpay_hash_secret = "QWERTYUIOPASDFGHJKLZXCVBNM654321"
+        self.assertNotEqual(tx._get_specific_rendering_values({})["api_url"], url)
+
+        url = tx.vnpay_payment_url
+        self.vnpay.vnpay_payment_link = "https://pay.vnpay.vn/vpcpay.html"
+        new_url = tx._get_specific_rendering_values({})["api_url"]
+        self.assertTrue(new_url.startswith("https://pay.vnpay.vn/vpcpay.html?"))
+        self.assertNotEqual(new_url, url)
+
+    def test_payment_url_is_signed_again_once_expired(self):
+        tx = self._create_transaction("redirect", reference="URL-2")
+        tx._get_specific_rendering_values({})
+        self.assertNotIn(self.vnpay.vnpay_hash_secret, tx.vnpay_payment_url_fingerprint)
+
+        # The URL is about to expire, the customer would not have the time to pay.
+        tx.vnpay_payment_url_expire_date = fields.Datetime.now() + timedelta(seconds=30)
+        tx._get_specific_rendering_values({})
+        self.assertGreater(
+            tx.vnpay_payment_url_expire_date, fields.Datetime.now() + timedelta(minutes=10)
+        )
@@ -0,0 +1,121 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from datetime import timedelta
+
+from odoo import fields
+from odoo.tests import tagged
+
+from odoo.addons.payment_vnpay.tests.common import VNPayCommon
+from odoo.addons.payment_vnpay.tests.vnpay_stub import QUERYDR_PATH, VNPayStubServer
+
+
+@tagged("post_install", "-at_install")
+class TestVNPayReconciliation(VNPayCommon):
+
+    def setUp(self):
+        super().setUp()
+        self.stub = VNPayStubServer(hash_secret=self.vnpay.vnpay_hash_secret).start()
+        self.addCleanup(self.stub.stop)
+        self.vnpay.write(
+            {
+                "vnpay_query_url": self.stub.url + QUERYDR_PATH,
+                "vnpay_reconcile_delay": 45,
+            }
+        )
+
+    def _create_waiting_transaction(self, reference, age_minutes=60):
+        """Create a transaction whose payment URL was signed `age_minutes` minutes ago."""
+        create_date = fields.Datetime.now() - timedelta(minutes=age_minutes)
+        return self._create_transaction(
+            "redirect",
+            reference=reference,
+            vnpay_payment_url_create_date=create_date,
+            vnpay_payment_url_expire_date=create_date + timedelta(minutes=30),
+        )
+
+    def test_reconcile_transactions(self):
+        tx_paid = self._create_waiting_transaction("RECONCILE-PAID")
+        tx_unpaid = self._create_waiting_transaction("RECONCILE-UNPAID")
+        tx_mismatch = self._create_waiting_transaction("RECONCILE-MISMATCH")
+        tx_recent = self._create_waiting_transaction("RECONCILE-RECENT", age_minutes=10)
+        self.stub.transactions.update(
+            {
+                tx_paid.reference: {
+                    "vnp_Amount": str(int(self.amount * 100)),
+                    "vnp_TransactionNo": "14000001",
+                },
+                tx_mismatch.reference: {
+                    "vnp_Amount": str(int(self.amount * 100) + 100),
+                    "vnp_TransactionNo": "14000002",
+                },
+                tx_recent.reference: {
+                    "vnp_Amount": str(int(self.amount * 100)),
+                    "vnp_TransactionNo": "14000003",
+                },
+            }
+        )
+
+        self.env["payment.transaction"]._cron_vnpay_reconcile_transactions()
+
+        self.assertEqual(tx_paid.state, "done")
+        self.assertEqual(tx_paid.provider_reference, tx_paid.reference)
+        self.assertEqual(tx_unpaid.state, "cancel")
+        self.assertEqual(tx_mismatch.state, "error")
+        self.assertEqual(tx_recent.state, "draft", "The recent transactions must not be queried.")
+        self.assertEqual(len(self.stub.requests), 3)
+
+    def test_reconcile_ignores_unsigned_responses(self):
+        tx = self._create_waiting_transaction("RECONCILE-UNSIGNED")
+        self.stub.hash_secret = "not the secret of the provider"
+        self.stub.transactions[tx.reference] = {
+            "vnp_Amount": str(int(self.amount * 100)),
+            "vnp_TransactionNo": "14000004",
+        }
+
+        self.env["payment.transaction"]._cron_vnpay_reconcile_transactions()
+
+        self.assertEqual(tx.state, "draft")
+
+    def test_reconcile_queries_every_payment_url(self):
+        # The URL paid by the customer was signed again, e.g. after a reconfiguration.
+        tx = self._create_waiting_transaction("RECONCILE-RESIGNED")
+        tx.vnpay_payment_url_dates = "20241017130000,20241017120000"
+        self.stub.transactions[tx.reference] = {
+            "vnp_Amount": str(int(self.amount * 100)),
+            "vnp_TransactionNo": "14000005",
+            "vnp_TransactionDate": "20241017120000",
+        }
+
+        self.env["payment.transaction"]._cron_vnpay_reconcile_transactions()
+
+        self.assertEqual(tx.state, "done", "The payment is only found with the first URL.")
+        self.assertEqual(len(self.stub.requests), 2)
+
+    def test_reconcile_transactions_signed_before_the_upgrade(self):
+        tx = self._create_transaction("redirect", reference="RECONCILE-LEGACY")
+        self.env.flush_all()
+        self.env.cr.execute(
+            "UPDATE payment_transaction SET create_date = %s WHERE id = %s",
+            [fields.Datetime.now() - timedelta(minutes=60), tx.id],
+        )
+        self.env.invalidate_all()
+        self.stub.transactions[tx.reference] = {
+            "vnp_Amount": str(int(self.amount * 100)),
+            "vnp_TransactionNo": "14000006",
+        }
+
+        self.env["payment.transaction"]._cron_vnpay_reconcile_transactions()
+
+        self.assertEqual(tx.state, "done")
+
+    def test_reconcile_leaves_the_payments_processed_by_vnpay(self):
+        tx = self._create_waiting_transaction("RECONCILE-PROCESSING")
+        self.stub.transactions[tx.reference] = {
+            "vnp_Amount": str(int(self.amount * 100)),
+            "vnp_TransactionNo": "14000007",
+            "vnp_TransactionStatus": "05",
+        }
+
+        self.env["payment.transaction"]._cron_vnpay_reconcile_transactions()
+
+        self.assertEqual(tx.state, "draft")
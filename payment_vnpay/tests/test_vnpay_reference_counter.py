@@ -0,0 +1,36 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from odoo.tests import tagged
+
+from odoo.addons.payment_vnpay.tests.common import VNPayCommon
+
+
+@tagged("post_install", "-at_install")
+class TestVNPayReferenceCounter(VNPayCommon):
+
+    def test_counter_skips_the_references_created_without_it(self):
+        Counter = self.env["payment.vnpay.reference.counter"]
+        self._create_transaction("redirect", reference="COUNTER")
+        self.assertEqual(Counter._next_value("COUNTER", "c"), 1)
+
+        # References created without the counter, e.g. by an import.
+        self._create_transaction("redirect", reference="COUNTERc2")
+        self._create_transaction("redirect", reference="COUNTERc5")
+        self.env.flush_all()
+
+        self.assertEqual(Counter._next_value("COUNTER", "c"), 6)
+        self.assertEqual(Counter._next_value("COUNTER", "c"), 7)
+
+    def test_seed_ignores_the_numbers_too_large_for_the_counter(self):
+        self._create_transaction("redirect", reference="tx")
+        self._create_transaction("redirect", reference="tx-20241017120512")
+        self._create_transaction("redirect", reference="tx-3")
+        self.env.flush_all()
+
+        self.assertEqual(self.env["payment.vnpay.reference.counter"]._next_value("tx", "-"), 4)
+
+    def test_free_prefix_has_no_counter(self):
+        Counter = self.env["payment.vnpay.reference.counter"]
+        with self.assertQueryCount(1):
+            self.assertEqual(Counter._next_value("ONCE", "-"), 0)
+        self.assertFalse(Counter.search([("prefix", "=", "ONCE")]))
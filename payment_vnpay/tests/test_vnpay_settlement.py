@@ -0,0 +1,73 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import csv
+import io
+
+from odoo.exceptions import UserError
+from odoo.tests import tagged
+
+from odoo.addons.payment_vnpay.tests.common import VNPayCommon
+
+
+@tagged("post_install", "-at_install")
+class TestVNPaySettlement(VNPayCommon):
+
+    def _reconcile(self, content, filename="settlement.csv", chunk_size=2):
+        """Compare the settlement file with the given content, and return the summary and report."""
+        report = io.StringIO()
+        summary = self.env["payment.transaction"]._vnpay_reconcile_settlement(
+            self.vnpay, io.BytesIO(content.encode("utf-8-sig")), filename, report, chunk_size
+        )
+        return summary, list(csv.DictReader(io.StringIO(report.getvalue())))
+
+    def test_settlement_discrepancies(self):
+        tx_ok = self._create_transaction("redirect", reference="SETTLE-OK", state="done")
+        tx_amount = self._create_transaction("redirect", reference="SETTLE-AMOUNT", state="done")
+        tx_state = self._create_transaction("redirect", reference="SETTLE-STATE", state="pending")
+        tx_pos = self._create_transaction(
+            "redirect", reference="SETTLE-POS", provider_reference="14000009", state="done"
+        )
+        content = "\n".join(
+            [
+                "Settlement report",
+                "vnp_TxnRef;vnp_TransactionNo;Amount;Status",
+                f"{tx_ok.reference};14000001;100.000;00",
+                f"{tx_amount.reference};14000002;90.000;00",
+                f"{tx_state.reference};14000003;100.000;00",
+                ";14000009;100.000;00",
+                "SETTLE-UNKNOWN;14000004;100.000;00",
+                "SETTLE-INVALID;14000005;abc;00",
+            ]
+        )
+
+        summary, report = self._reconcile(content)
+
+        self.assertEqual(summary, {"rows": 6, "matched": 4, "discrepancies": 4})
+        self.assertEqual(
+            {row["reference"] or row["provider_reference"]: row["discrepancy"] for row in report},
+            {
+                tx_amount.reference: "amount_mismatch",
+                tx_state.reference: "state_mismatch",
+                "SETTLE-UNKNOWN": "not_found",
+                "SETTLE-INVALID": "invalid_row",
+            },
+        )
+        self.assertNotIn(tx_pos.reference, {row["transaction_reference"] for row in report})
+        self.assertEqual(tx_state.state, "pending", "The transactions must be left untouched.")
+
+    def test_settlement_is_queried_per_chunk(self):
+        for i in range(4):
+            self._create_transaction("redirect", reference=f"SETTLE-CHUNK-{i}", state="done")
+        content = "Reference,Amount\n" + "\n".join(f"SETTLE-CHUNK-{i},100000" for i in range(4))
+        self.env.flush_all()
+        self.currency.rounding  # Read the currency before counting the queries.
+
+        with self.assertQueryCount(2):
+            summary, report = self._reconcile(content, chunk_size=2)
+
+        self.assertEqual(summary, {"rows": 4, "matched": 4, "discrepancies": 0})
+        self.assertFalse(report)
+
+    def test_settlement_without_header(self):
+        with self.assertRaises(UserError):
+            self._reconcile("a,b\n1,2\n")
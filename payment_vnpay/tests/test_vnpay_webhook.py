@@ -0,0 +1,57 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from urllib.parse import urlencode
+
+from odoo.tests import tagged
+
+from odoo.addons.payment.tests.http_common import PaymentHttpCommon
+from odoo.addons.payment_vnpay.controllers.main import VNPayController
+from odoo.addons.payment_vnpay.tests.common import VNPayCommon
+
+
+@tagged("post_install", "-at_install")
+class TestVNPayWebhook(VNPayCommon, PaymentHttpCommon):
+
+    def _send_notification(self, data):
+        self.env.flush_all()
+        response = self.url_open(f"{VNPayController._ipn_url}?{urlencode(data)}")
+        self.env.invalidate_all()
+        return response
+
+    def test_retried_notification_is_answered_from_the_ledger(self):
+        tx = self._create_transaction("redirect", reference="WEBHOOK-RETRY", state="pending")
+        data = self._make_notification_data(tx.reference, 17000001)
+
+        self.assertEqual(self._send_notification(data).json()["RspCode"], "00")
+        self.assertEqual(tx.state, "done")
+
+        # The transaction is done, but VNPay gets the response of the notification again.
+        self.assertEqual(self._send_notification(data).json()["RspCode"], "00")
+        self.assertEqual(
+            self.env["payment.vnpay.ipn"]._get_response("vnpay", f"{tx.reference}/17000001"),
+            {"RspCode": "00", "Message": "Confirm Success"},
+        )
+
+    def test_forged_notification_is_not_answered_from_the_ledger(self):
+        tx = self._create_transaction("redirect", reference="WEBHOOK-FORGED", state="pending")
+        data = self._make_notification_data(tx.reference, 17000002)
+        self.assertEqual(self._send_notification(data).json()["RspCode"], "00")
+
+        forged_data = dict(data, vnp_SecureHash="0" * 128)
+        self.assertEqual(self._send_notification(forged_data).json()["RspCode"], "97")
+        self.assertEqual(tx.state, "done")
+
+    def test_notification_stages_are_timed(self):
+        tx = self._create_transaction("redirect", reference="WEBHOOK-TIMING", state="pending")
+        data = self._make_notification_data(tx.reference, 17000003)
+
+        with self.assertLogs("odoo.addons.payment_vnpay.controllers.main", "INFO") as logs:
+            response = self._send_notification(data)
+
+        stages = ["provider_lookup", "ledger_lookup", "tx_lookup", "checksum", "state_transition"]
+        metrics = [metric.split(";")[0] for metric in response.headers["Server-Timing"].split(", ")]
+        self.assertEqual(metrics, [*stages, "db_write", "total"])
+        line = next(output for output in logs.output if "vnpay_webhook " in output)
+        for stage in stages:
+            self.assertIn(f" {stage}_ms=", line)
+        self.assertIn(f"reference={tx.reference} result=00", line)
@@ -0,0 +1,211 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+"""Local stand-in for the VNPay APIs, served from a background thread.
+
+This module only depends on the standard library so that it can also be used outside of Odoo, e.g.
+by the load-testing tools of the repository.
+"""
+
+import hashlib
+import hmac
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+QR_CREATE_PATH = "/qr/create"
+QUERYDR_PATH = "/merchant_webapi/api/transaction"
+
+# The fields of the transaction query (querydr) responses signed with the hash secret, in order.
+QUERYDR_RESPONSE_SIGNED_FIELDS = [
+    "vnp_ResponseId",
+    "vnp_Command",
+    "vnp_ResponseCode",
+    "vnp_Message",
+    "vnp_TmnCode",
+    "vnp_TxnRef",
+    "vnp_Amount",
+    "vnp_BankCode",
+    "vnp_PayDate",
+    "vnp_TransactionNo",
+    "vnp_TransactionType",
+    "vnp_TransactionStatus",
+    "vnp_OrderInfo",
+    "vnp_PromotionCode",
+    "vnp_PromotionAmount",
+]
+
+# An EMVCo merchant-presented payload as returned by VNPay-QR, the transaction id being appended.
+QR_DATA_TEMPLATE = (
+    "00020101021226280010A0000007750110010531451352037011530370454"
+    "0610000005802VN5910VNPAY TEST6005HANOI62{length:02d}{txn_id}6304ABCD"
+)
+
+
+def hmac_sha512_checksum(secret, values, fields):
+    """Return the HMAC-SHA512 of the values of the fields joined by `|`, as the VNPay APIs sign."""
+    data = "|".join(str(values[field]) if values.get(field) is not None else "" for field in fields)
+    return hmac.new(secret.encode(), data.encode(), hashlib.sha512).hexdigest()
+
+
+def md5_checksum(*items):
+    """Return the MD5 checksum of the items joined by `|`, `None` being serialized as `null`."""
+    data = "|".join(str(item) if item is not None else "null" for item in items)
+    return hashlib.md5(data.encode()).hexdigest()
+
+
+class VNPayStubServer:
+    """Stand-in for the VNPay endpoints, with configurable latency and error rate.
+
+    Usage::
+
+        with VNPayStubServer(qr_secret="secret") as stub:
+            provider.vnpayqr_create_url = stub.url + QR_CREATE_PATH
+
+    The statuses answered by the transaction query API are read from `transactions`, which maps the
+    references to the `vnp_*` values of their payment. A payment with a `vnp_TransactionDate` is
+    only found by the queries of the payment URL created at that date.
+    """
+
+    def __init__(
+        self,
+        qr_secret="",
+        hash_secret="",
+        latency=0.0,
+        error_rate=0.0,
+        host="127.0.0.1",
+        port=0,
+    ):
+        self.qr_secret = qr_secret
+        self.hash_secret = hash_secret
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests = []
+        self.transactions = {}
+        self._handlers = {
+            "POST": {
+                QR_CREATE_PATH: self._handle_qr_create,
+                QUERYDR_PATH: self._handle_querydr,
+            },
+        }
+        self._server = ThreadingHTTPServer((host, port), self._make_request_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def route(self, method, path, handler):
+        """Register a handler returning `(status, payload)` for the given method and path.
+
+        :param str method: The HTTP method.
+        :param str path: The path of the endpoint.
+        :param callable handler: The handler, called with the parsed JSON body (or the query
+                                 parameters for `GET`).
+        """
+        self._handlers.setdefault(method, {})[path] = handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _make_request_handler(self):
+        stub = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                stub._dispatch(self, "GET")
+
+            def do_POST(self):
+                stub._dispatch(self, "POST")
+
+            def log_message(self, *args):
+                pass
+
+        return RequestHandler
+
+    def _dispatch(self, request_handler, method):
+        path, _sep, query = request_handler.path.partition("?")
+        handler = self._handlers.get(method, {}).get(path)
+        length = int(request_handler.headers.get("Content-Length") or 0)
+        body = request_handler.rfile.read(length) if length else b""
+        self.requests.append((method, path))
+
+        if self.latency:
+            time.sleep(self.latency)
+        if handler is None:
+            status, payload = 404, {"message": "Not Found"}
+        elif self.error_rate and random.random() < self.error_rate:
+            status, payload = 503, {"message": "Service Unavailable"}
+        else:
+            if method == "GET":
+                params = dict(parse_qsl(query))
+            else:
+                params = json.loads(body or b"{}")
+            status, payload = handler(params)
+
+        response = json.dumps(payload).encode()
+        request_handler.send_response(status)
+        request_handler.send_header("Content-Type", "application/json")
+        request_handler.send_header("Content-Length", str(len(response)))
+        request_handler.end_headers()
+        request_handler.wfile.write(response)
+
+    def _handle_qr_create(self, data):
+        """Answer a VNPay-QR create request with a signed QR payload."""
+        txn_id = str(data.get("txnId", ""))
+        qr_data = QR_DATA_TEMPLATE.format(length=len(txn_id), txn_id=txn_id)
+        payload = {"code": "00", "message": "Success", "data": qr_data, "url": None}
+        payload["checksum"] = md5_checksum(
+            payload["code"], payload["message"], payload["data"], payload["url"], self.qr_secret
+        )
+        return 200, payload
+
+    def _handle_querydr(self, data):
+        """Answer a transaction query with the payment registered in `transactions`, if any."""
+        payment = dict(self.transactions.get(data.get("vnp_TxnRef")) or {}) or None
+        if payment and payment.pop("vnp_TransactionDate", None) not in (
+            None,
+            data.get("vnp_TransactionDate"),
+        ):
+            payment = None
+        payload = {
+            "vnp_ResponseId": data.get("vnp_RequestId"),
+            "vnp_Command": "querydr",
+            "vnp_TmnCode": data.get("vnp_TmnCode"),
+            "vnp_TxnRef": data.get("vnp_TxnRef"),
+        }
+        if payment is None:
+            payload.update(vnp_ResponseCode="91", vnp_Message="Transaction not found")
+        else:
+            payload.update(
+                {
+                    "vnp_ResponseCode": "00",
+                    "vnp_Message": "QueryDR Success",
+                    "vnp_BankCode": "NCB",
+                    "vnp_TransactionType": "01",
+                    "vnp_TransactionStatus": "00",
+                    **payment,
+                }
+            )
+        payload["vnp_SecureHash"] = hmac_sha512_checksum(
+            self.hash_secret, payload, QUERYDR_RESPONSE_SIGNED_FIELDS
+        )
+        return 200, payload
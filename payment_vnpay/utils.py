@@ -0,0 +1,236 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import hmac
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from urllib.parse import quote_plus
+
+# The parameters that carry the signature itself and must never be part of the signed data.
+SIGNATURE_KEYS = frozenset({"vnp_SecureHash", "vnp_SecureHashType"})
+
+# The timezone of the dates sent by VNPay.
+VNPAY_TIMEZONE = timezone(timedelta(hours=7))
+
+
+def canonicalize(params, prefix=None, exclude=SIGNATURE_KEYS):
+    """Build the canonical query string signed by VNPay in a single pass.
+
+    The parameters are sorted by key and joined as `key=value` pairs separated by `&`, the values
+    being form-encoded.
+
+    :param dict params: The parameters to canonicalize.
+    :param str prefix: If set, only the keys starting with this prefix are kept.
+    :param frozenset exclude: The keys to leave out of the canonical string.
+    :return: The canonical query string.
+    :rtype: str
+    """
+    return "&".join(
+        [
+            f"{key}={quote_plus(str(val))}"
+            for key, val in sorted(params.items())
+            if key not in exclude and (prefix is None or key.startswith(prefix))
+        ]
+    )
+
+
+class VNPaySigner:
+    """HMAC-SHA512 signing engine for VNPay payment URLs and notifications.
+
+    The secret is encoded and keyed once; every message is then signed from a copy of the keyed
+    state, which saves the key preparation on each call.
+    """
+
+    def __init__(self, secret):
+        self._keyed_hmac = hmac.new(secret.encode("utf-8"), digestmod="sha512")
+
+    def sign(self, message):
+        """Return the hexadecimal HMAC-SHA512 signature of the message."""
+        signer = self._keyed_hmac.copy()
+        signer.update(message.encode("utf-8"))
+        return signer.hexdigest()
+
+    def sign_fields(self, values, fields):
+        """Return the signature of the values of the given fields, joined by `|`.
+
+        This is the format of the transaction query and refund APIs, the missing values being
+        signed as empty strings.
+
+        :param dict values: The values of the request or the response.
+        :param list fields: The signed fields, in their order.
+        :return: The hexadecimal signature.
+        :rtype: str
+        """
+        return self.sign(
+            "|".join(
+                [str(values[field]) if values.get(field) is not None else "" for field in fields]
+            )
+        )
+
+    def sign_params(self, params):
+        """Canonicalize and sign the parameters of a payment URL.
+
+        :param dict params: The `vnp_*` parameters of the payment URL.
+        :return: The canonical query string and its signature.
+        :rtype: tuple
+        """
+        query_string = canonicalize(params)
+        return query_string, self.sign(query_string)
+
+    def verify(self, data):
+        """Check the `vnp_SecureHash` of the notification data against the expected signature.
+
+        The data are left untouched.
+
+        :param dict data: The notification data, signature included.
+        :return: Whether the signature is valid.
+        :rtype: bool
+        """
+        received_signature = data.get("vnp_SecureHash")
+        if not received_signature:
+            return False
+        expected_signature = self.sign(canonicalize(data, prefix="vnp_"))
+        return hmac.compare_digest(str(received_signature), expected_signature)
+
+    def sign_many(self, params_list):
+        """Batch version of :meth:`sign_params`."""
+        sign_params = self.sign_params
+        return [sign_params(params) for params in params_list]
+
+    def verify_many(self, data_list):
+        """Batch version of :meth:`verify`."""
+        verify = self.verify
+        return [verify(data) for data in data_list]
+
+
+@lru_cache(maxsize=32)
+def get_signer(secret):
+    """Return the signer keyed with the given secret, shared between calls.
+
+    :param str secret: The VNPay hash secret.
+    :return: The signer.
+    :rtype: VNPaySigner
+    """
+    return VNPaySigner(secret)
+
+
+def parse_pay_date(value):
+    """Parse a date sent by VNPay, e.g. the `vnp_PayDate` of a notification.
+
+    :param str value: The date, as `yyyyMMddHHmmss` in the timezone of Vietnam.
+    :return: The naive UTC datetime, as stored by Odoo, or None if the value is not a date.
+    :rtype: datetime.datetime
+    """
+    try:
+        date = datetime.strptime(str(value or ""), "%Y%m%d%H%M%S")
+    except ValueError:
+        return None
+    return date.replace(tzinfo=VNPAY_TIMEZONE).astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def delete_in_batches(env, query, params, batch_size, time_limit, cron_xmlid):
+    """Run a query deleting at most `batch_size` rows until it deletes fewer of them.
+
+    Each batch is committed on its own, so that the table is never locked for long, unless the
+    current thread runs the tests.
+
+    :param env: The environment.
+    :param str query: The DELETE query, taking the `params` followed by the batch size.
+    :param list params: The parameters of the query.
+    :param int batch_size: The maximum number of rows deleted per transaction.
+    :param int time_limit: The number of seconds after which the remaining rows are left to the
+                           next run of the cron.
+    :param str cron_xmlid: The XML id of the cron triggered to delete the remaining rows.
+    :return: The number of deleted rows.
+    :rtype: int
+    """
+    auto_commit = not getattr(threading.current_thread(), "testing", False)
+    start_time = time.monotonic()
+    deleted = 0
+    while True:
+        env.cr.execute(query, [*params, batch_size])
+        count = env.cr.rowcount
+        deleted += count
+        if auto_commit:
+            env.cr.commit()
+        if count < batch_size:
+            return deleted
+        if time.monotonic() - start_time > time_limit:
+            # Leave the remaining rows to the next run, as soon as possible.
+            env.ref(cron_xmlid)._trigger()
+            return deleted
+
+
+class LazyFormat:
+    """Defer a costly formatting of a log argument until the record is actually emitted.
+
+    Usage: `_logger.debug("Data:\n%s", LazyFormat(pprint.pformat, data))`
+    """
+
+    __slots__ = ("func", "args")
+
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = args
+
+    def __str__(self):
+        return self.func(*self.args)
+
+
+class StageTimer:
+    """Measure the duration of the successive stages of a request.
+
+    The durations are exposed as a `Server-Timing` header and as a single structured log line.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.stages = {}
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        """Measure the duration of the wrapped block; the durations of a repeated stage add up."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def total(self):
+        """Return the number of seconds elapsed since the timer was created."""
+        return time.perf_counter() - self._start
+
+    def server_timing(self):
+        """Return the value of the `Server-Timing` header, with the durations in milliseconds."""
+        metrics = [f"{name};dur={duration * 1000:.2f}" for name, duration in self.stages.items()]
+        metrics.append(f"total;dur={self.total() * 1000:.2f}")
+        return ", ".join(metrics)
+
+    def add_server_timing(self, response):
+        """Add the `Server-Timing` header to the response, if any.
+
+        :param response: The response of the route, or the `future_response` of the request for
+                         JSON routes.
+        :return: The response.
+        """
+        if response is not None:
+            response.headers["Server-Timing"] = self.server_timing()
+        return response
+
+    def log(self, logger, level=logging.INFO, **values):
+        """Log the durations and the given values on a single `key=value` line.
+
+        The line is only built if the logger is enabled for the given level.
+        """
+        if logger.isEnabledFor(level):
+            logger.log(level, "%s", LazyFormat(self._format_line, values))
+
+    def _format_line(self, values):
+        items = [f"total_ms={self.total() * 1000:.2f}"]
+        items += [f"{name}_ms={duration * 1000:.2f}" for name, duration in self.stages.items()]
+        items += [f"{key}={value}" for key, value in values.items()]
+        return f"{self.name} " + " ".join(items)
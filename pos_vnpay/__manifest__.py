@@ -2,22 +2,30 @@
 
 {
     "name": "POS Payment: VNPay",
-    "version": "2.3",
+    "version": "2.5",
     "category": "Point of Sale",
     "sequence": 0,
     "summary": "This module integrates the VNPay payment method into the POS system.",
     "description": " ",  # Non-empty string to avoid loading the README file.
     "author": "Nguyen Phuc Huy",
-    "depends": ["point_of_sale", "account_payment"],
+    "depends": ["point_of_sale", "account_payment", "payment_vnpay"],
     "data": [
         "security/ir.model.access.csv",
         "views/pos_vnpay_settings.xml",
+        "views/res_config_settings_views.xml",
+        "data/ir_cron_data.xml",
     ],
     "assets": {
         "point_of_sale.assets_prod": [
+            "pos_vnpay/static/src/js/qr_code/*",
             "pos_vnpay/static/src/js/pos_online_payment/*",
             "pos_vnpay/static/src/xml/*",
         ],
+        "web.qunit_suite_tests": [
+            "pos_vnpay/static/src/js/qr_code/*",
+            "pos_vnpay/static/src/js/pos_online_payment/vnpay_payment_watcher.js",
+            "pos_vnpay/static/tests/unit/*",
+        ],
     },
     "post_init_hook": "post_init_hook",
     "uninstall_hook": "uninstall_hook",
@@ -8,4 +8,25 @@ SUPPORTED_CURRENCIES = [
 DEFAULT_PAYMENT_METHODS_CODES = [
     # Primary payment methods.
     "vnpayqr",
-]
\ No newline at end of file
+]
+
+# The number of minutes during which a payment QR code can be paid.
+QR_VALIDITY_MINUTES = 5
+
+# The minimum number of minutes left before its expiry for a payment QR code to be served again.
+QR_REUSE_MARGIN_MINUTES = 1
+
+# The default number of days during which the expired payment QR codes are kept.
+QR_RETENTION_DAYS = 7
+
+# The separator of the POS order ID and the payment QR code ID in the txnId sent to VNPay.
+QR_TXN_ID_SEPARATOR = "-"
+
+# The number of threads requesting the payment QR codes to VNPay in background, per worker.
+QR_JOB_WORKERS = 4
+
+# The maximum number of payment QR codes requested in background at once, per worker.
+QR_JOB_MAX_PENDING = 32
+
+# The number of seconds during which the POS waits for a payment QR code requested in background.
+QR_JOB_TIMEOUT = 30
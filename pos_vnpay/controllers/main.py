@@ -2,12 +2,13 @@
 
 import hmac
 import hashlib
+import functools
 import logging
+import secrets
 import qrcode
 import pytz
 import base64
 import requests as pyreq
-import json
 
 from io import BytesIO
 from decimal import *
@@ -15,10 +16,12 @@ from werkzeug.urls import url_encode
 from datetime import datetime, timedelta
 from werkzeug.exceptions import Forbidden
 
-from odoo import http, _, tools
+from odoo import SUPERUSER_ID, api, http, registry, _, tools
 from odoo.exceptions import AccessError, ValidationError, UserError
 from odoo.addons.payment.controllers.post_processing import PaymentPostProcessing
 from odoo.addons.payment.controllers import portal as payment_portal
+from odoo.addons.payment_vnpay import http_client, utils
+from odoo.addons.pos_vnpay import const
 from odoo.http import request
 
 
@@ -27,6 +30,9 @@ _logger = logging.getLogger(__name__)
 
 class PaymentVNPayPortal(payment_portal.PaymentPortal):
     _create_qr_url = "/pos/vnpay/get_payment_qr"
+    _create_qr_async_url = "/pos/vnpay/get_payment_qr_async"
+    _qr_job_result_url = "/pos/vnpay/get_payment_qr_result"
+    _prepare_online_payment_url = "/pos/vnpay/prepare_online_payment"
     _pos_ipn_url = "/pos/vnpay/webhook"
 
     # Only override to change the prefix of the reference
@@ -165,10 +171,10 @@ class PaymentVNPayPortal(payment_portal.PaymentPortal):
         access_token = pos_order_sudo.access_token
 
         # Get the VNPay QR payment method
-        vnpay_qr_method = (
-            request.env["payment.method"]
+        vnpay_qr_method_id = (
+            request.env["payment.provider"]
             .sudo()
-            .search([("code", "=", "vnpayqr")], limit=1)
+            ._vnpay_get_cached_config("vnpayqr")["payment_method_id"]
         )
 
         # Get the user and partner of the user
@@ -181,7 +187,7 @@ class PaymentVNPayPortal(payment_portal.PaymentPortal):
         }
         transaction_data = {
             "provider_id": vnpay.id,
-            "payment_method_id": vnpay_qr_method.id,
+            "payment_method_id": vnpay_qr_method_id,
             "partner_id": partner_sudo.id,
             "partner_phone": partner_sudo.phone,
             "token_id": None,
@@ -272,6 +278,49 @@ class PaymentVNPayPortal(payment_portal.PaymentPortal):
 
         return
 
+    @staticmethod
+    def _get_ipn_dedup_key(data):
+        """Return the key identifying the IPN across VNPay's retries.
+        Args:
+            data: data received from the VNPay request
+        Returns:
+            The key, or None if the data lack the identifiers
+        """
+        txn_id = data.get("txnId")
+        qr_trace = data.get("qrTrace")
+        if not txn_id or not qr_trace:
+            return None
+        return f"{txn_id}/{qr_trace}"
+
+    @staticmethod
+    def _check_pos_order_access(pos_order_sudo):
+        """Check that the current user can access the POS session of the order.
+        Args:
+            pos_order_sudo: pos.order record in sudo mode
+        Raises:
+            AccessError: If the order does not exist or the user cannot access its POS session
+        """
+        if not pos_order_sudo.exists():
+            raise AccessError(_("This order does not exist."))
+        session = pos_order_sudo.session_id.with_env(request.env)
+        session.check_access_rights("read")
+        session.check_access_rule("read")
+
+    @staticmethod
+    def _record_final_ipn_response(res, dedup_key):
+        """Record the response given to an IPN with a valid checksum and return it.
+        Args:
+            res: The response to give to VNPay
+            dedup_key: The key of the IPN, see `_get_ipn_dedup_key`
+        Returns:
+            res: The response to give to VNPay
+        """
+        if dedup_key:
+            request.env["payment.vnpay.ipn"].sudo()._record_response(
+                "vnpayqr", dedup_key, res
+            )
+        return res
+
     @http.route(
         _create_qr_url,
         type="json",
@@ -279,56 +328,430 @@ class PaymentVNPayPortal(payment_portal.PaymentPortal):
         auth="public",
         csrf=False,
     )
-    def get_payment_url(self, orderId, amount):
+    def get_payment_url(self, orderId, amount, paymentLineUid=None):
         """Create a VNPay payment QR code and save a copy of the QR code data to the payment.qr model.
         Args:
             orderId: The POS order ID
             amount: The amount of the order
+            paymentLineUid: The identifier of the POS payment line paid by the QR code
         Returns:
-            img_base64: The base64 string of the QR code image
+            The payload of the QR code and its expiry date, to be drawn by the POS, or the base64
+            string of the QR code image if it is rendered on the server
         """
+        timer = utils.StageTimer("pos_vnpay_get_payment_qr")
+        qr_code = self._create_payment_qr(orderId, amount, timer, paymentLineUid)
+        timer.add_server_timing(request.future_response)
+        timer.log(_logger, order=orderId, result="ok" if qr_code else "failed")
+        return qr_code
 
-        _logger.info("Creating VNPay payment QR.")
+    @http.route(
+        _create_qr_async_url,
+        type="json",
+        methods=["POST"],
+        auth="user",
+        csrf=False,
+    )
+    def get_payment_url_async(self, orderId, amount, paymentLineUid=None):
+        """Start the creation of a VNPay payment QR code in background and return at once.
 
+        The POS polls the result with the returned token, see `get_payment_url_result`.
+        Args:
+            orderId: The POS order ID
+            amount: The amount of the order
+            paymentLineUid: The identifier of the POS payment line paid by the QR code
+        Returns:
+            The job as a dict with its `status`, its `token` and the bus channel on which the
+            payment is notified (`bus_channel`), and the QR code (`qr_code`) if a valid one could be
+            served again, or None if it failed
+        """
+        timer = utils.StageTimer("pos_vnpay_get_payment_qr_async")
+        # Check the access before reserving a slot of the executor for the job.
+        self._check_pos_order_access(request.env["pos.order"].sudo().browse(int(orderId)))
+        job = self._start_payment_qr_job(orderId, amount, timer, paymentLineUid)
+        timer.add_server_timing(request.future_response)
+        timer.log(_logger, order=orderId, result=job["status"] if job else "failed")
+        return job
+
+    @http.route(
+        _qr_job_result_url,
+        type="json",
+        methods=["POST"],
+        auth="user",
+        csrf=False,
+    )
+    def get_payment_url_result(self, token):
+        """Get the result of a job started by `get_payment_url_async`.
+        Args:
+            token: The token of the job
+        Returns:
+            The job as a dict with its `status` (pending, done or failed), and the QR code
+            (`qr_code`) once it is done
+        """
+        timer = utils.StageTimer("pos_vnpay_get_payment_qr_result")
+        with timer.stage("cache_lookup"):
+            order_qr = request.env["payment.qr"].sudo()._get_qr_from_job_token(token)
+        if order_qr:
+            self._check_pos_order_access(order_qr.order_id)
+        now = datetime.now(pytz.timezone("Etc/GMT-7")).replace(tzinfo=None)
+        if not order_qr or order_qr.exp_date < now:
+            # The job failed and removed the QR code, or never ended.
+            job = {"status": "failed"}
+        elif order_qr._is_pending():
+            job = {"status": "pending"}
+        elif not order_qr.qr_payload:
+            # The job died without ending, e.g. with its worker.
+            job = {"status": "failed"}
+        else:
+            vnpayqr = (
+                request.env["payment.provider"].sudo()._vnpay_get_cached_config("vnpayqr")
+            )
+            job = {
+                "status": "done",
+                "qr_code": self._get_qr_code(order_qr, vnpayqr, timer),
+            }
+        timer.add_server_timing(request.future_response)
+        timer.log(_logger, level=logging.DEBUG, result=job["status"])
+        return job
+
+    @http.route(
+        _prepare_online_payment_url,
+        type="json",
+        methods=["POST"],
+        auth="user",
+    )
+    def prepare_online_payment(self, orderId, paymentLines, speculative=False):
+        """Update the online payments data of the order and start the creation of the QR code of
+        its next online payment, in a single round-trip.
+        Args:
+            orderId: The POS order ID
+            paymentLines: The remaining online payment lines of the order, as dicts with their
+                          `uid` and `amount`
+            speculative: Whether the order is not validated yet, in which case the QR code is only
+                         created ahead, to be served again once the order is validated with the
+                         same amount, and the online payments data are left untouched
+        Returns:
+            The dict with the online payments data of the order (`online_payments_data`), the
+            payment lines paid by the QR code (`payment_line_uids`) and its amount (`amount`), and
+            the job of the QR code (`job`, see `get_payment_url_async`), which is None if the
+            order is paid, its payment lines were modified or it failed
+        """
+        timer = utils.StageTimer("pos_vnpay_prepare_online_payment")
+
+        # Pay the next payment line: the server books one payment per QR code, which the POS
+        # matches with a payment line by its amount.
+        paymentLines = paymentLines[:1]
+        payment_line_uids = [line["uid"] for line in paymentLines]
+        amount = sum(line["amount"] for line in paymentLines)
+
+        with timer.stage("order_sync"):
+            pos_order = request.env["pos.order"].browse(int(orderId))
+            if speculative:
+                online_payments_data = pos_order.get_and_set_online_payments_data()
+            else:
+                online_payments_data = pos_order.get_and_set_online_payments_data(amount)
+
+        job = None
+        if (
+            online_payments_data
+            and not online_payments_data.get("is_paid")
+            and not online_payments_data.get("modified_payment_lines")
+        ):
+            job = self._start_payment_qr_job(
+                orderId, amount, timer, ",".join(payment_line_uids), speculative
+            )
+
+        timer.add_server_timing(request.future_response)
+        timer.log(_logger, order=orderId, result=job["status"] if job else "none")
+        return {
+            "online_payments_data": online_payments_data,
+            "payment_line_uids": payment_line_uids,
+            "amount": amount,
+            "job": job,
+        }
+
+    def _create_payment_qr(self, orderId, amount, timer, paymentLineUid=None):
+        """Request a payment QR code to VNPay and render it if needed.
+        Args:
+            orderId: The POS order ID
+            amount: The amount of the order
+            timer: The utils.StageTimer of the request
+            paymentLineUid: The identifier of the POS payment line paid by the QR code
+        Returns:
+            The dict with the payload (`qr_data`) and the expiry date (`exp_date`) of the QR code,
+            or the base64 string of the QR code image if it is rendered on the server, or None if
+            it failed
+        """
+
+        _logger.debug("Creating VNPay payment QR.")
+
+        order_qr = data = None
         try:
-            # Get VNPay data
+            vnpayqr, order_qr, data = self._prepare_payment_qr(
+                orderId, amount, timer, paymentLineUid
+            )
+            if data is None:
+                _logger.debug("Serving the VNPay payment QR %s again.", order_qr.id)
+                return self._get_qr_code(order_qr, vnpayqr, timer)
+
+            qrData = self._request_payment_qr(vnpayqr, data, timer)
+            if not qrData:
+                order_qr.unlink()
+                return None
+
+            # Save QR data to the database
+            with timer.stage("db_write"):
+                order_qr.qr_payload = qrData
+
+            _logger.debug("VNPay payment QR created successfully.")
+
+            return self._get_qr_code(order_qr, vnpayqr, timer)
+        except Exception as e:
+            _logger.error("Error creating VNPay payment QR: %s", e)
+            if data is not None:
+                # Don't commit the new QR code without its payload.
+                order_qr.unlink()
+            return None
+
+    def _start_payment_qr_job(
+        self, orderId, amount, timer, paymentLineUid=None, speculative=False
+    ):
+        """Save a payment QR code and request it to VNPay in background, once it is committed.
+        Args:
+            orderId: The POS order ID
+            amount: The amount of the order
+            timer: The utils.StageTimer of the request
+            paymentLineUid: The identifier of the POS payment line paid by the QR code
+            speculative: Whether the QR code is only requested ahead of the validation of the
+                         order, see `prepare_online_payment`
+        Returns:
+            The job, see `get_payment_url_async`, or None if it failed
+        """
+
+        _logger.debug("Starting the creation of a VNPay payment QR.")
+
+        order_qr = data = None
+        try:
+            vnpayqr, order_qr, data = self._prepare_payment_qr(
+                orderId,
+                amount,
+                timer,
+                paymentLineUid,
+                with_job_token=True,
+                speculative=speculative,
+            )
+            if data is None:
+                _logger.debug("Serving the VNPay payment QR %s again.", order_qr.id)
+                job = {
+                    "status": "pending",
+                    "token": order_qr.job_token,
+                    "bus_channel": order_qr.order_id.config_id._get_vnpay_bus_channel(),
+                }
+                if order_qr.qr_payload:
+                    job.update(
+                        status="done", qr_code=self._get_qr_code(order_qr, vnpayqr, timer)
+                    )
+                return job
+
+            if not self._schedule_payment_qr_job(request.env.cr, order_qr.id, vnpayqr, data):
+                _logger.warning(
+                    "Too many VNPay payment QR pending, not requesting one more for now."
+                )
+                order_qr.unlink()
+                return None
+
+            return {
+                "status": "pending",
+                "token": order_qr.job_token,
+                "bus_channel": order_qr.order_id.config_id._get_vnpay_bus_channel(),
+            }
+        except Exception as e:
+            _logger.error("Error starting the creation of VNPay payment QR: %s", e)
+            if data is not None:
+                # Don't commit the new QR code without its payload.
+                order_qr.unlink()
+            return None
+
+    @classmethod
+    def _schedule_payment_qr_job(cls, cr, qr_id, vnpayqr, data):
+        """Reserve a slot of the executor for the job of a QR code, and start the job once the
+        cursor is committed. The slot is released if the cursor is rolled back instead.
+        Args:
+            cr: The cursor of the request that saved the QR code
+            qr_id: The ID of the payment.qr record
+            vnpayqr: The cached configuration of the VNPay-QR provider
+            data: The data of the request, see `_prepare_payment_qr`
+        Returns:
+            Whether a slot was available
+        """
+        executor = http_client.get_executor(
+            "vnpayqr_create",
+            max_workers=const.QR_JOB_WORKERS,
+            max_pending=const.QR_JOB_MAX_PENDING,
+        )
+        if not executor.reserve():
+            return False
+
+        # The job must only start once the QR code is committed, and never if it is not.
+        cr.postcommit.add(
+            functools.partial(
+                executor.submit, cls._run_payment_qr_job, cr.dbname, qr_id, vnpayqr, data
+            )
+        )
+        cr.postrollback.add(executor.release)
+        return True
+
+    @classmethod
+    def _run_payment_qr_job(cls, dbname, qr_id, vnpayqr, data):
+        """Request a payment QR code to VNPay and save its payload, from a background thread.
+        Args:
+            dbname: The name of the database
+            qr_id: The ID of the payment.qr record
+            vnpayqr: The cached configuration of the VNPay-QR provider
+            data: The data of the request, see `_prepare_payment_qr`
+        """
+        timer = utils.StageTimer("pos_vnpay_payment_qr_job")
+        qrData = cls._request_payment_qr(vnpayqr, data, timer)
+        with timer.stage("db_write"), registry(dbname).cursor() as cr:
+            # The QR code may have been replaced by another one while it was requested.
+            order_qr = (
+                api.Environment(cr, SUPERUSER_ID, {})["payment.qr"].browse(qr_id).exists()
+            )
+            if qrData:
+                order_qr.qr_payload = qrData
+            else:
+                # Let the POS know that the job failed.
+                order_qr.unlink()
+        timer.log(_logger, txn_id=data["txnId"], result="ok" if qrData else "failed")
+
+    def _prepare_payment_qr(
+        self,
+        orderId,
+        amount,
+        timer,
+        paymentLineUid=None,
+        with_job_token=False,
+        speculative=False,
+    ):
+        """Get the QR code to serve again for the payment line, or save a new one and prepare the
+        data of its request to VNPay.
+        Args:
+            orderId: The POS order ID
+            amount: The amount of the order
+            timer: The utils.StageTimer of the request
+            paymentLineUid: The identifier of the POS payment line paid by the QR code
+            with_job_token: Whether to give the new QR code a job token, and to serve the QR codes
+                            still requested in background again
+            speculative: Whether the QR code is only requested ahead of the validation of the
+                         order, in which case it replaces the previous one of the payment line
+        Returns:
+            The VNPay-QR configuration of the POS of the order, the payment.qr record and the data
+            of the request, or None as data if the QR code can be served again
+        """
+        # Get VNPay data, with the terminal of the POS of the order
+        with timer.stage("provider_lookup"):
             vnpayqr = (
-                http.request.env["payment.provider"]
+                http.request.env["pos.order"]
                 .sudo()
-                .search([("code", "=", "vnpayqr")], limit=1)
+                .browse(int(orderId))
+                .config_id._vnpayqr_get_config()
             )
 
-            # Create expire date for the QR code
-            exp_date = datetime.now(pytz.timezone("Etc/GMT-7")) + timedelta(minutes=5)
-
-            # field Datetime in Odoo do not accept timezone-aware datetime
-            exp_date_naive = exp_date.replace(tzinfo=None)
-
-            # Create the data for the QR code
-            data = {
-                "appId": vnpayqr.vnpayqr_app_id,
-                "merchantName": vnpayqr.vnpayqr_merchant_name,
-                "serviceCode": "03",
-                "countryCode": "VN",
-                "payloadFormat": "",
-                "productId": "",
-                "tipAndFee": "",
-                "expDate": exp_date.strftime("%y%m%d%H%M"),
-                "desc": "",
-                "mobile": "",
-                "consumerID": "",
-                "purpose": "",
-                "merchantCode": vnpayqr.vnpayqr_merchant_code,
-                "terminalId": vnpayqr.vnpayqr_tmn_code,
-                "payType": "03",
-                "txnId": str(orderId),
-                "billNumber": str(orderId),
-                "amount": str(amount),
-                "ccy": "704",
-                "masterMerCode": "A000000775",
-                "merchantType": vnpayqr.vnpayqr_merchant_type,
-            }
+        now = datetime.now(pytz.timezone("Etc/GMT-7"))
+
+        # Serve the QR code created for the same order and amount again while it is valid,
+        # e.g. when the cashier closes the popup and validates the order again, or when the POS
+        # requested it ahead of the validation of the order.
+        with timer.stage("cache_lookup"):
+            order_qr = (
+                http.request.env["payment.qr"]
+                .sudo()
+                ._get_reusable_qr(
+                    orderId,
+                    amount,
+                    (now + timedelta(minutes=const.QR_REUSE_MARGIN_MINUTES)).replace(
+                        tzinfo=None
+                    ),
+                    paymentLineUid,
+                    with_pending=with_job_token,
+                )
+            )
+        if order_qr:
+            if with_job_token and not order_qr.job_token:
+                order_qr.job_token = secrets.token_urlsafe(16)
+            if not speculative and order_qr.speculative:
+                # The QR code may be shown to the customer from now on.
+                order_qr.speculative = False
+            return vnpayqr, order_qr, None
+
+        # Create expire date for the QR code
+        exp_date = now + timedelta(minutes=const.QR_VALIDITY_MINUTES)
+
+        # field Datetime in Odoo do not accept timezone-aware datetime
+        exp_date_naive = exp_date.replace(tzinfo=None)
+
+        # Save the QR code first, its ID makes the txnId unique to the payment line
+        with timer.stage("db_write"):
+            if speculative:
+                # The previous QR code requested ahead for the payment line was never served.
+                http.request.env["payment.qr"].sudo()._delete_speculative_qr(
+                    orderId, paymentLineUid
+                )
+            order_qr = (
+                http.request.env["payment.qr"]
+                .sudo()
+                .create(
+                    {
+                        "order_id": int(orderId),
+                        "provider_id": vnpayqr["provider_id"],
+                        "amount": float(amount),
+                        "exp_date": exp_date_naive,
+                        "payment_line_uid": paymentLineUid or False,
+                        "job_token": with_job_token and secrets.token_urlsafe(16),
+                        "speculative": speculative,
+                    }
+                )
+            )
+        txn_id = order_qr._get_txn_id()
+
+        # Create the data for the QR code
+        data = {
+            "appId": vnpayqr["vnpayqr_app_id"],
+            "merchantName": vnpayqr["vnpayqr_merchant_name"],
+            "serviceCode": "03",
+            "countryCode": "VN",
+            "payloadFormat": "",
+            "productId": "",
+            "tipAndFee": "",
+            "expDate": exp_date.strftime("%y%m%d%H%M"),
+            "desc": "",
+            "mobile": "",
+            "consumerID": "",
+            "purpose": "",
+            "merchantCode": vnpayqr["vnpayqr_merchant_code"],
+            "terminalId": vnpayqr["vnpayqr_tmn_code"],
+            "payType": "03",
+            "txnId": txn_id,
+            "billNumber": txn_id,
+            "amount": str(amount),
+            "ccy": "704",
+            "masterMerCode": "A000000775",
+            "merchantType": vnpayqr["vnpayqr_merchant_type"],
+        }
+        return vnpayqr, order_qr, data
+
+    @staticmethod
+    def _request_payment_qr(vnpayqr, data, timer):
+        """Request a payment QR code to VNPay and check the response.
 
+        It does not use the ORM, so that it can be run from a background thread.
+        Args:
+            vnpayqr: The cached configuration of the VNPay-QR provider
+            data: The data of the request, see `_prepare_payment_qr`
+            timer: The utils.StageTimer of the request
+        Returns:
+            The payload of the QR code, or None if it failed
+        """
+        with timer.stage("checksum"):
             # Create a string from the data to create the checksum
             data_string = "|".join(
                 [
@@ -347,116 +770,118 @@ class PaymentVNPayPortal(payment_portal.PaymentPortal):
                     data["tipAndFee"],
                     data["ccy"],
                     data["expDate"],
-                    vnpayqr.vnpayqr_secret_key,
+                    vnpayqr["vnpayqr_secret_key"],
                 ]
             )
 
             # Create the checksum
             checksum = hashlib.md5(data_string.encode()).hexdigest()
 
-            # Add the checksum to the data
-            data["checksum"] = checksum
+        # Add the checksum to the data
+        data = dict(data, checksum=checksum)
 
-            qr_create_url = vnpayqr.vnpayqr_create_url
+        client = http_client.get_client(
+            "vnpayqr_create", **vnpayqr["vnpayqr_client_settings"]
+        )
 
-            data_json = json.dumps(data)
+        # Send a POST request to the VNPay create QR URL
+        with timer.stage("upstream"):
+            try:
+                response_data = client.post_json(
+                    vnpayqr["vnpayqr_create_url"], data, content_type="text/plain"
+                )
+            except http_client.CircuitOpenError:
+                _logger.warning(
+                    "VNPay-QR is unavailable, not requesting a payment QR for now."
+                )
+                return None
+            except (pyreq.exceptions.RequestException, ValueError) as e:
+                _logger.error("Request to create payment QR failed: %s", e)
+                return None
 
-            # Send a POST request to the VNPay create QR URL
-            response = pyreq.post(
-                qr_create_url,
-                data=data_json,
-                headers={"Content-Type": "text/plain"},
+        # Check the error code in the response data
+        error_code = response_data.get("code")
+        if error_code != "00":
+            _logger.error(
+                "Receive data with error code: %s and message: %s",
+                error_code,
+                response_data.get("message"),
             )
+            return None
 
-            # Parse the response body as JSON
-            response_data = response.json()
-
-            # Check the status code of the response
-            if response.status_code == 200:
-
-                # Check the error code in the response data
-                error_code = response_data.get("code")
-                if error_code == "00":
-
-                    # Create a string from the response data to check the checksum
-                    response_data_str = "|".join(
-                        [
-                            str(item) if item is not None else "null"
-                            for item in [
-                                response_data.get("code"),
-                                response_data.get("message"),
-                                response_data.get("data"),
-                                response_data.get("url"),
-                                vnpayqr.vnpayqr_secret_key,
-                            ]
-                        ]
-                    )
-
-                    res_checksum = (
-                        hashlib.md5(response_data_str.encode()).hexdigest().capitalize()
-                    )
-
-                    # Check if the checksums match
-                    if not hmac.compare_digest(
-                        res_checksum, response_data.get("checksum").capitalize()
-                    ):
-                        return None
+        with timer.stage("checksum"):
+            # Create a string from the response data to check the checksum
+            response_data_str = "|".join(
+                [
+                    str(item) if item is not None else "null"
+                    for item in [
+                        response_data.get("code"),
+                        response_data.get("message"),
+                        response_data.get("data"),
+                        response_data.get("url"),
+                        vnpayqr["vnpayqr_secret_key"],
+                    ]
+                ]
+            )
 
-                    qrData = response_data.get("data")
+            res_checksum = (
+                hashlib.md5(response_data_str.encode()).hexdigest().capitalize()
+            )
 
-                    # Generate QR code
-                    qr = qrcode.QRCode(
-                        version=1,
-                        error_correction=qrcode.constants.ERROR_CORRECT_L,
-                        box_size=10,
-                        border=4,
-                    )
-                    qr.add_data(qrData)
-                    qr.make(fit=True)
+            # Check if the checksums match
+            if not hmac.compare_digest(
+                res_checksum, (response_data.get("checksum") or "").capitalize()
+            ):
+                return None
 
-                    # Create an image from the QR Code instance
-                    img = qr.make_image(fill="black", back_color="white")
+        return response_data.get("data")
 
-                    # Save the image to a BytesIO object
-                    buffer = BytesIO()
-                    img.save(buffer, format="PNG")
+    @staticmethod
+    def _render_qr_image(qr_data):
+        """Render the payload of a QR code as a PNG image.
+        Args:
+            qr_data: The payload of the QR code
+        Returns:
+            img_base64: The base64 string of the QR code image
+        """
+        # Generate QR code
+        qr = qrcode.QRCode(
+            version=1,
+            error_correction=qrcode.constants.ERROR_CORRECT_L,
+            box_size=10,
+            border=4,
+        )
+        qr.add_data(qr_data)
+        qr.make(fit=True)
 
-                    # Get the content of the BytesIO object as bytes
-                    img_bytes = buffer.getvalue()
+        # Create an image from the QR Code instance
+        img = qr.make_image(fill="black", back_color="white")
 
-                    # Convert the bytes to a base64 string
-                    img_base64 = (
-                        "data:image/png;base64," + base64.b64encode(img_bytes).decode()
-                    )
+        # Save the image to a BytesIO object
+        buffer = BytesIO()
+        img.save(buffer, format="PNG")
 
-                    # Save QR data to the database
-                    http.request.env["payment.qr"].sudo().create(
-                        {
-                            "order_id": orderId,
-                            "amount": amount,
-                            "exp_date": exp_date_naive,
-                            "qr_data": img_base64,
-                        }
-                    )
+        # Get the content of the BytesIO object as bytes
+        img_bytes = buffer.getvalue()
 
-                    _logger.info("VNPay payment QR created successfully.")
+        # Convert the bytes to a base64 string
+        return "data:image/png;base64," + base64.b64encode(img_bytes).decode()
 
-                    return img_base64
+    def _get_qr_code(self, order_qr, vnpayqr, timer):
+        """Get the response of the get_payment_qr API for a QR code.
+        Args:
+            order_qr: The payment.qr record
+            vnpayqr: The cached configuration of the VNPay-QR provider
+            timer: The utils.StageTimer of the request
+        Returns:
+            The QR code in the format of `_create_payment_qr`
+        """
+        if vnpayqr["vnpayqr_qr_rendering"] == "client":
+            exp_date = pytz.timezone("Etc/GMT-7").localize(order_qr.exp_date)
+            return {"qr_data": order_qr.qr_payload, "exp_date": exp_date.isoformat()}
 
-                else:
-                    message = response_data.get("message")
-                    _logger.error(
-                        f"Receive data with error code: {error_code} and message: {message}"
-                    )
-                    return None
-            else:
-                _logger.error(
-                    f"Request to create payment QR failed with status code {response.status_code}."
-                )
-                return None
-        except Exception as e:
-            _logger.error(f"Error creating VNPay payment QR: {e}")
-            return None
+        with timer.stage("qr_render"):
+            return self._render_qr_image(order_qr.qr_payload)
 
     @http.route(
         _pos_ipn_url,
@@ -476,31 +901,69 @@ class PaymentVNPayPortal(payment_portal.PaymentPortal):
         # Get the data from the request
         data = request.get_json_data()
 
-        _logger.info("Received IPN data. %s", data)
+        timer = utils.StageTimer("pos_vnpay_ipn")
+        res = self._process_ipn(data, timer)
+        response = timer.add_server_timing(request.make_json_response(res))
+        timer.log(_logger, txn_id=data.get("txnId"), result=res["code"])
+        return response
 
-        try:
-            # Get the VNPay data
-            vnpayqr = (
-                request.env["payment.provider"]
-                .sudo()
-                .search([("code", "=", "vnpayqr")], limit=1)
-            )
+    def _process_ipn(self, data, timer):
+        """Process the IPN data and return the response to give to VNPay.
+        Args:
+            data: data received from the VNPay request
+            timer: The utils.StageTimer of the request
+        Returns:
+            res: The response to give to VNPay
+        """
 
-            _logger.info("Processing IPN data.")
+        _logger.debug("Received IPN data. %s", data)
 
-            # Validate the checksum
-            self._validate_checksum(data, vnpayqr.vnpayqr_secret_key)
+        # Answer VNPay's retries from the ledger of the notifications already handled.
+        dedup_key = self._get_ipn_dedup_key(data)
+        if dedup_key:
+            with timer.stage("ledger_lookup"):
+                res = (
+                    request.env["payment.vnpay.ipn"]
+                    .sudo()
+                    ._get_response("vnpayqr", dedup_key)
+                )
+            if res:
+                _logger.info(
+                    "Received already handled IPN %s, replaying the response.",
+                    dedup_key,
+                )
+                return res
 
-            # Get the POS order with the txnId
-            pos_order_sudo = (
-                request.env["pos.order"]
-                .sudo()
-                .search([("id", "=", data.get("txnId"))], limit=1)
-            )
+        vnpayqr = order_amount = None
+        try:
+            # Get the VNPay data of the terminal the IPN was sent for
+            with timer.stage("provider_lookup"):
+                vnpayqr = (
+                    request.env["pos.config"].sudo()._vnpayqr_get_config_for_ipn(data)
+                )
 
-            # Check if the order exists
+            # Validate the checksum
+            with timer.stage("checksum"):
+                self._validate_checksum(data, vnpayqr["vnpayqr_secret_key"])
+
+            # Get the QR code and the POS order with the txnId
+            with timer.stage("tx_lookup"):
+                order_qr = (
+                    request.env["payment.qr"]
+                    .sudo()
+                    ._get_qr_from_txn_id(data.get("txnId"))
+                )
+                pos_order_sudo = order_qr.order_id
+
+            # Check if the order exists, and was paid with the terminal of its POS
             if not pos_order_sudo:
                 raise ValidationError(_("No transaction found matching reference."))
+            order_vnpayqr = pos_order_sudo.config_id._vnpayqr_get_config()
+            if (
+                order_vnpayqr["vnpayqr_merchant_code"],
+                order_vnpayqr["vnpayqr_tmn_code"],
+            ) != (vnpayqr["vnpayqr_merchant_code"], vnpayqr["vnpayqr_tmn_code"]):
+                raise ValidationError(_("No transaction found matching reference."))
 
             # Check if the order has been paid
             if pos_order_sudo.state in ("paid", "done", "invoiced"):
@@ -512,79 +975,94 @@ class PaymentVNPayPortal(payment_portal.PaymentPortal):
                         "txnId": data.get("txnId"),
                     },
                 }
-                return request.make_json_response(res)
+                self._log_ipn_rejection(data, res, "Order already paid", vnpayqr)
+                return self._record_final_ipn_response(res, dedup_key)
 
-            # Create a new transaction
-            _logger.info("Creating new transaction.")
-            order_amount = pos_order_sudo._get_checked_next_online_payment_amount()
-            tx_sudo = self._create_new_transaction(
-                pos_order_sudo, vnpayqr, order_amount
-            )
-
-            # Validate the amount
+            # Validate the amount against the QR code that was paid, then against the amount the
+            # order still expects, before creating any transaction
+            order_amount = order_qr.amount
             receive_amount = data.get("amount")
             self._validate_amount(pos_order_sudo, order_amount, receive_amount)
+            self._validate_amount(
+                pos_order_sudo,
+                pos_order_sudo._get_checked_next_online_payment_amount(),
+                receive_amount,
+            )
 
             # Check if QR code has expired
-            order_qr = (
-                http.request.env["payment.qr"]
-                .sudo()
-                .search([("order_id", "=", data.get("txnId"))], limit=1)
-            )
             # get current time in UTC +7
             current_time = datetime.now(pytz.timezone("Etc/GMT-7"))
 
             # remove the UTC info
             current_time_naive = current_time.replace(tzinfo=None)
-            _logger.info("current_time: %s", current_time_naive)
-            _logger.info("order_qr.exp_date: %s", order_qr.exp_date)
-            _logger.info("is expired: %s", current_time_naive > order_qr.exp_date)
+            _logger.debug(
+                "current_time: %s, order_qr.exp_date: %s",
+                current_time_naive,
+                order_qr.exp_date,
+            )
             if current_time_naive > order_qr.exp_date:
                 _logger.info("QR code has expired. Aborting.")
-                tx_sudo._set_error(
-                    "VNPay-QR: " + _("Received payment for expired QR. Aborting.")
-                )
                 res = {
                     "code": "09",
                     "message": "QR hết hạn thanh toán.",
                 }
-                return request.make_json_response(res)
-
-            # Update the transaction "provider_reference" with the qrTrace data
-            tx_sudo.provider_reference = data.get("qrTrace")
+                self._log_ipn_rejection(data, res, "Expired QR code", vnpayqr)
+                return self._record_final_ipn_response(res, dedup_key)
 
-            # Check the response code and process the payment
+            # Check the response code
             res_code = data.get("code")
-
-            if res_code == "00":
-                _logger.info("Payment processed successfully. Saving.")
-
-                # Set the transaction as done and process the payment
-                tx_sudo._set_done()
-                tx_sudo._process_pos_online_payment()
-                _logger.info("Payment saved successfully.")
-                res = {
-                    "code": "00",
-                    "message": "Đặt hàng thành công.",
-                    "data": {
-                        "txnId": data.get("txnId"),
-                    },
-                }
-                return request.make_json_response(res)
-            else:
+            if res_code != "00":
                 _logger.warning(
                     "Received data with invalid response code: %s. Aborting.",
                     res_code,
                 )
-                tx_sudo._set_error(
-                    "VNPay-QR: "
-                    + _("Received data with invalid response code: %s", res_code)
-                )
                 res = {
                     "code": "04",
                     "message": f"Nhận dữ liệu với mã lỗi là: {res_code}",
                 }
-                return request.make_json_response(res)
+                self._log_ipn_rejection(
+                    data, res, f"Invalid response code: {res_code}", vnpayqr
+                )
+                return self._record_final_ipn_response(res, dedup_key)
+
+            # Create a new transaction, only for a payment that is applied
+            with timer.stage("db_write"):
+                tx_sudo = self._create_new_transaction(
+                    pos_order_sudo,
+                    request.env["payment.provider"]
+                    .sudo()
+                    .browse(vnpayqr["provider_id"]),
+                    order_amount,
+                )
+
+                # Keep the identifiers of the payment at VNPay and at the bank on the transaction
+                tx_sudo.write(
+                    {
+                        "provider_reference": data.get("qrTrace"),
+                        "vnpay_transaction_no": data.get("qrTrace") or False,
+                        "vnpay_bank_code": data.get("bankCode") or False,
+                        "vnpay_pay_date": utils.parse_pay_date(data.get("payDate")) or False,
+                    }
+                )
+
+            # Set the transaction as done and process the payment
+            with timer.stage("state_transition"):
+                tx_sudo._set_done()
+                tx_sudo._process_pos_online_payment()
+
+            # Let the POS close the QR code popup, the notification is sent once committed
+            pos_order_sudo.config_id._notify_vnpay_qr_payment(
+                pos_order_sudo, data.get("txnId")
+            )
+            _logger.debug("Payment saved successfully.")
+            res = {
+                "code": "00",
+                "message": "Đặt hàng thành công.",
+                "data": {
+                    "txnId": data.get("txnId"),
+                },
+            }
+            return self._record_final_ipn_response(res, dedup_key)
 
         except Forbidden:
             _logger.warning(
@@ -595,22 +1073,22 @@ class PaymentVNPayPortal(payment_portal.PaymentPortal):
                 "code": "06",
                 "message": "Sai thông tin xác thực.",
             }
-            return request.make_json_response(res)
+            return res
 
         except AssertionError:
             _logger.warning(
                 "Assertion error during notification handling. Aborting.",
                 exc_info=True,
             )
-            tx_sudo._set_error("VNPay-QR: " + _("Received data with invalid amount."))
             res = {
                 "code": "07",
                 "message": "Số tiền không chính xác.",
                 "data": {
-                    "amount": f"{int(order_amount)}",
+                    "amount": f"{int(order_amount or 0)}",
                 },
             }
-            return request.make_json_response(res)
+            self._log_ipn_rejection(data, res, "Invalid amount", vnpayqr)
+            return self._record_final_ipn_response(res, dedup_key)
 
         except ValidationError:
             _logger.warning(
@@ -621,9 +1099,23 @@ class PaymentVNPayPortal(payment_portal.PaymentPortal):
                 "code": "04",
                 "message": "Không tìm thấy txnId trong hệ thống.",
             }
-            return request.make_json_response(res)
+            return res
 
         except Exception as e:
-            _logger.error(f"Error processing IPN data: {e}")
+            _logger.error("Error processing IPN data: %s", e)
             res = {"code": "04", "message": f"Lỗi hệ thống khi xử lý thông tin: {e}"}
-            return request.make_json_response(res)
+            return res
+
+    @staticmethod
+    def _log_ipn_rejection(data, res, reason, vnpayqr):
+        """Log the rejection of an IPN with a valid checksum, if the provider is configured to.
+        Args:
+            data: data received from the VNPay request
+            res: The response given to VNPay
+            reason: The reason of the rejection
+            vnpayqr: The cached configuration of the VNPay-QR provider
+        """
+        if vnpayqr and vnpayqr["vnpayqr_log_rejections"]:
+            request.env["payment.vnpay.ipn.rejection"].sudo()._record(
+                "vnpayqr", data, res["code"], reason
+            )
@@ -0,0 +1,46 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+
+def migrate(cr, version):
+    """Convert the payment QR codes to the slim schema before the ORM updates the table.
+
+    The order and the amount, stored as strings, become an integer referencing `pos_order` and a
+    float; the rows of the orders that no longer exist are dropped. Only the payloads are kept from
+    `qr_data`: the images can't be converted back, their rows are kept without payload. The table
+    is rewritten once, which also reclaims the space of the images.
+    """
+    cr.execute(
+        """
+        SELECT data_type
+          FROM information_schema.columns
+         WHERE table_name = 'payment_qr' AND column_name = 'order_id'
+        """
+    )
+    row = cr.fetchone()
+    if not row or row[0] != "character varying":
+        return
+
+    cr.execute(
+        """
+        DELETE FROM payment_qr qr
+         WHERE NOT EXISTS (SELECT 1 FROM pos_order o WHERE o.id::varchar = qr.order_id)
+        """
+    )
+    cr.execute("ALTER TABLE payment_qr ADD COLUMN qr_payload varchar")
+    cr.execute(
+        """
+        UPDATE payment_qr
+           SET qr_payload = qr_data
+         WHERE qr_data NOT LIKE 'data:image/%'
+        """
+    )
+    cr.execute(
+        r"""
+        ALTER TABLE payment_qr
+            DROP COLUMN qr_data,
+            ALTER COLUMN order_id TYPE int4 USING order_id::int4,
+            ALTER COLUMN amount TYPE float8 USING (
+                CASE WHEN amount ~ '^-?\d+(\.\d+)?$' THEN amount::float8 ELSE 0 END
+            )
+        """
+    )
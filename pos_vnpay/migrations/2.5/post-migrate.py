@@ -0,0 +1,20 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+
+def migrate(cr, version):
+    """Backfill the VNPay transaction number of the VNPay-QR payments of the POS.
+
+    Their provider reference is the `qrTrace` sent by VNPay, which the IPN now also stores as their
+    transaction number.
+    """
+    cr.execute(
+        """
+        UPDATE payment_transaction AS tx
+           SET vnpay_transaction_no = tx.provider_reference
+          FROM payment_provider AS provider
+         WHERE provider.id = tx.provider_id
+           AND provider.code = 'vnpayqr'
+           AND tx.provider_reference IS NOT NULL
+           AND tx.vnpay_transaction_no IS NULL
+        """
+    )
@@ -1,3 +1,6 @@
 from . import payment_provider
 from . import payment_qr
+from . import pos_config
 from . import pos_payment_method
+from . import res_config_settings
+from . import payment_vnpay_ipn_rejection
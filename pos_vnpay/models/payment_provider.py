@@ -53,6 +53,54 @@ class PaymentPOSVNPay(models.Model):
         string="VNPay-QR create URL", required_if_provider="vnpayqr"
     )
 
+    vnpayqr_qr_rendering = fields.Selection(
+        string="VNPay-QR Code Rendering",
+        help="Where the image of the QR code is drawn. In the POS, only the payload of the QR code "
+        "is sent to the POS, which draws it for the popup and the customer display.",
+        selection=[("client", "In the POS"), ("server", "On the server")],
+        default="client",
+    )
+
+    vnpayqr_qr_retention_days = fields.Integer(
+        string="VNPay-QR Codes Retention",
+        help="The number of days during which the expired QR codes are kept before being deleted.",
+        default=const.QR_RETENTION_DAYS,
+    )
+
+    vnpayqr_log_rejections = fields.Boolean(
+        string="Log the Rejected VNPay-QR IPN",
+        help="Keep a log of the IPN rejected before a transaction was created for them, e.g. for "
+        "a wrong amount or an expired QR code.",
+    )
+
+    # Define the settings of the HTTP client of the VNPay-QR create API
+    vnpayqr_connect_timeout = fields.Float(
+        string="VNPay-QR Connection Timeout",
+        help="The number of seconds to wait for the connection to the VNPay-QR API.",
+        default=3.0,
+    )
+    vnpayqr_read_timeout = fields.Float(
+        string="VNPay-QR Response Timeout",
+        help="The number of seconds to wait for the response of the VNPay-QR API.",
+        default=10.0,
+    )
+    vnpayqr_max_retries = fields.Integer(
+        string="VNPay-QR Retries",
+        help="The number of times a QR code request that did not reach VNPay is sent again.",
+        default=2,
+    )
+    vnpayqr_breaker_threshold = fields.Integer(
+        string="VNPay-QR Failures Before Pause",
+        help="The number of consecutive failed QR code requests after which the next ones fail "
+        "immediately, so that the cashier can switch to another payment method. 0 disables it.",
+        default=5,
+    )
+    vnpayqr_breaker_cooldown = fields.Integer(
+        string="VNPay-QR Pause Duration",
+        help="The number of seconds during which the QR code requests fail immediately.",
+        default=30,
+    )
+
     # get the base url and pass it into defaut value of vnpay_ipn_url
     vnpayqr_ipn_url = fields.Char(
         string="VNPay-QR IPN URL",
@@ -89,3 +137,55 @@ class PaymentPOSVNPay(models.Model):
         if self.code != "vnpayqr":
             return default_codes
         return const.DEFAULT_PAYMENT_METHODS_CODES
+
+    @api.model
+    def _vnpay_get_cached_codes(self):
+        """Override of `payment_vnpay` to cache the configuration of the VNPay-QR providers."""
+        return super()._vnpay_get_cached_codes() | {"vnpayqr"}
+
+    @api.model
+    def _vnpay_get_cached_fields(self):
+        """Override of `payment_vnpay` to add the cached VNPay-QR fields."""
+        return super()._vnpay_get_cached_fields() | {
+            "vnpayqr_tmn_code",
+            "vnpayqr_merchant_code",
+            "vnpayqr_merchant_name",
+            "vnpayqr_merchant_type",
+            "vnpayqr_app_id",
+            "vnpayqr_secret_key",
+            "vnpayqr_create_url",
+            "vnpayqr_qr_rendering",
+            "vnpayqr_log_rejections",
+            "vnpayqr_connect_timeout",
+            "vnpayqr_read_timeout",
+            "vnpayqr_max_retries",
+            "vnpayqr_breaker_threshold",
+            "vnpayqr_breaker_cooldown",
+        }
+
+    def _vnpay_prepare_cached_config(self, provider_code):
+        """Override of `payment_vnpay` to add the VNPay-QR credentials to the cached configuration."""
+        config = super()._vnpay_prepare_cached_config(provider_code)
+        if provider_code != "vnpayqr":
+            return config
+
+        config.update(
+            {
+                "vnpayqr_tmn_code": self.vnpayqr_tmn_code,
+                "vnpayqr_merchant_code": self.vnpayqr_merchant_code,
+                "vnpayqr_merchant_name": self.vnpayqr_merchant_name,
+                "vnpayqr_merchant_type": self.vnpayqr_merchant_type,
+                "vnpayqr_app_id": self.vnpayqr_app_id,
+                "vnpayqr_secret_key": self.vnpayqr_secret_key,
+                "vnpayqr_create_url": self.vnpayqr_create_url,
+                "vnpayqr_qr_rendering": self.vnpayqr_qr_rendering or "client",
+                "vnpayqr_log_rejections": self.vnpayqr_log_rejections,
+                "vnpayqr_client_settings": {
+                    "timeout": (self.vnpayqr_connect_timeout, self.vnpayqr_read_timeout),
+                    "retries": max(self.vnpayqr_max_retries, 0),
+                    "breaker_threshold": max(self.vnpayqr_breaker_threshold, 0),
+                    "breaker_cooldown": self.vnpayqr_breaker_cooldown,
+                },
+            }
+        )
+        return config
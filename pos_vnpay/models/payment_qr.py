@@ -1,11 +1,232 @@
-from odoo import models, fields
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytz
+
+from odoo import api, models, fields, tools
+from odoo.addons.pos_vnpay import const
+
+_logger = logging.getLogger(__name__)
 
 
 class PaymentQR(models.Model):
     _name = "payment.qr"
     _description = "Payment QR Code"
 
-    order_id = fields.Char(string="Order ID", required=True)
-    amount = fields.Char(string="Amount", required=True)
-    exp_date = fields.Datetime(string="Expiration Date", required=True)
-    qr_data = fields.Text(string="QR Data", required=True)
+    order_id = fields.Many2one(
+        string="Order", comodel_name="pos.order", required=True, ondelete="cascade"
+    )
+    provider_id = fields.Many2one(
+        string="Provider", comodel_name="payment.provider", ondelete="cascade"
+    )
+    amount = fields.Float(string="Amount", required=True)
+    exp_date = fields.Datetime(string="Expiration Date", required=True, index=True)
+    # The payload returned by VNPay, from which the QR code image is drawn.
+    qr_payload = fields.Char(string="QR Payload")
+    # The identifier of the POS payment line paid by the QR code, on the POS side.
+    payment_line_uid = fields.Char(string="Payment Line")
+    # The token with which the POS polls the QR code requested in background.
+    job_token = fields.Char(string="Job Token", index="btree_not_null", copy=False)
+    # Whether the QR code was requested ahead of the validation of the order, and never served.
+    speculative = fields.Boolean(string="Speculative")
+
+    def init(self):
+        super().init()
+        # Find the latest QR code of an order, as the IPN and get_payment_qr API do.
+        tools.create_index(
+            self.env.cr,
+            "payment_qr_order_id_id_index",
+            self._table,
+            ["order_id", "id DESC"],
+        )
+
+    @api.model
+    def _get_latest_qr(self, order_id):
+        """Get the latest QR code of the order.
+        Args:
+            order_id: The POS order ID
+        Returns:
+            The payment.qr record, or an empty recordset
+        """
+        return self.search([("order_id", "=", order_id)], order="id desc", limit=1)
+
+    @api.model
+    def _get_reusable_qr(
+        self, order_id, amount, valid_until, payment_line_uid=None, with_pending=False
+    ):
+        """Get the latest QR code of the order for the amount, if it is still valid at a date.
+        Args:
+            order_id: The POS order ID
+            amount: The amount of the QR code
+            valid_until: The naive date, in UTC+7, until which the QR code must be valid
+            payment_line_uid: The identifier of the POS payment line, if known
+            with_pending: Whether to include the QR codes still requested in background, as long as
+                          the POS waits for them
+        Returns:
+            The payment.qr record, or an empty recordset
+        """
+        if with_pending:
+            # The job of an older QR code without payload died, e.g. with its worker.
+            pending_since = self.env.cr.now() - timedelta(seconds=const.QR_JOB_TIMEOUT)
+            payload_domain = [
+                "|",
+                ("qr_payload", "!=", False),
+                "&",
+                ("job_token", "!=", False),
+                ("create_date", ">", pending_since),
+            ]
+        else:
+            payload_domain = [("qr_payload", "!=", False)]
+        return self.search(
+            [
+                ("order_id", "=", int(order_id)),
+                ("payment_line_uid", "=", payment_line_uid or False),
+                ("amount", "=", float(amount)),
+                ("exp_date", ">", valid_until),
+                *payload_domain,
+            ],
+            order="id desc",
+            limit=1,
+        )
+
+    def _is_pending(self):
+        """Check whether the QR code is still requested in background, and the POS waits for it.
+        Returns:
+            True if the job of the QR code may still end, False otherwise
+        """
+        self.ensure_one()
+        pending_since = self.env.cr.now() - timedelta(seconds=const.QR_JOB_TIMEOUT)
+        return not self.qr_payload and self.create_date > pending_since
+
+    @api.model
+    def _delete_speculative_qr(self, order_id, payment_line_uid):
+        """Delete the QR codes requested ahead for a payment line and never served, which are
+        replaced by a new one, e.g. for another amount.
+        Args:
+            order_id: The POS order ID
+            payment_line_uid: The identifier of the POS payment line
+        """
+        self.search(
+            [
+                ("order_id", "=", int(order_id)),
+                ("payment_line_uid", "=", payment_line_uid or False),
+                ("speculative", "=", True),
+            ]
+        ).unlink()
+
+    def _get_txn_id(self):
+        """Get the txnId sent to VNPay for the QR code, made of the IDs of the order and the QR
+        code so that each payment line of an order is paid with its own txnId.
+        Returns:
+            The txnId
+        """
+        self.ensure_one()
+        return f"{self.order_id.id}{const.QR_TXN_ID_SEPARATOR}{self.id}"
+
+    @api.model
+    def _get_qr_from_txn_id(self, txn_id):
+        """Get the QR code paid by an IPN from its txnId, with a lookup on the primary key.
+        Args:
+            txn_id: The txnId received from VNPay, see `_get_txn_id`
+        Returns:
+            The payment.qr record, or an empty recordset
+        """
+        order_id, _sep, qr_id = str(txn_id or "").partition(const.QR_TXN_ID_SEPARATOR)
+        if not order_id.isdigit():
+            return self.browse()
+        if not qr_id:
+            # The txnId of the QR codes created before it identified the payment line was the
+            # bare order ID.
+            return self._get_latest_qr(int(order_id))
+        if not qr_id.isdigit():
+            return self.browse()
+        return self.search([("id", "=", int(qr_id)), ("order_id", "=", int(order_id))], limit=1)
+
+    @api.model
+    def _get_qr_from_job_token(self, token):
+        """Get the QR code requested in background with a job token.
+        Args:
+            token: The job token
+        Returns:
+            The payment.qr record, or an empty recordset
+        """
+        if not token or not isinstance(token, str):
+            return self.browse()
+        return self.search([("job_token", "=", token)], limit=1)
+
+    @api.model
+    def _cron_gc_expired_qr(self, batch_size=1000, time_limit=50):
+        """Delete the QR codes expired for longer than the retention period of their provider. The
+        QR codes of the orders still waiting for their payment are kept, as the payment may still
+        be notified.
+
+        The rows are deleted in small batches, each committed on its own, so that the table is
+        never locked for long. The number of rows and bytes reclaimed is logged; the space is
+        actually reused once the table is vacuumed.
+        Args:
+            batch_size: The maximum number of rows deleted per transaction
+            time_limit: The number of seconds after which the remaining rows are left to the next
+                        run
+        Returns:
+            The number of rows and bytes reclaimed, as a dict
+        """
+        auto_commit = not getattr(threading.current_thread(), "testing", False)
+        start_time = time.monotonic()
+        # The expiry dates are naive and in UTC+7.
+        now = datetime.now(pytz.timezone("Etc/GMT-7")).replace(tzinfo=None)
+        report = {"rows": 0, "bytes": 0}
+
+        providers = (
+            self.env["payment.provider"]
+            .sudo()
+            .with_context(active_test=False)
+            .search([("code", "=", "vnpayqr")])
+        )
+        # The QR codes created before their provider was recorded keep the default retention.
+        retentions = [(provider.id, provider.vnpayqr_qr_retention_days) for provider in providers]
+        retentions.append((None, const.QR_RETENTION_DAYS))
+
+        for provider_id, retention_days in retentions:
+            limit_date = now - timedelta(days=max(retention_days, 0))
+            while True:
+                self.env.cr.execute(
+                    """
+                    DELETE FROM payment_qr
+                     WHERE id IN (
+                         SELECT id
+                           FROM payment_qr
+                          WHERE provider_id IS NOT DISTINCT FROM %s
+                            AND exp_date < %s
+                            AND NOT EXISTS (
+                                SELECT 1
+                                  FROM pos_order
+                                 WHERE pos_order.id = payment_qr.order_id
+                                   AND pos_order.state = 'draft'
+                            )
+                          LIMIT %s
+                            FOR UPDATE SKIP LOCKED
+                     )
+                 RETURNING pg_column_size(payment_qr.*)
+                    """,
+                    [provider_id, limit_date, batch_size],
+                )
+                sizes = [row[0] for row in self.env.cr.fetchall()]
+                report["rows"] += len(sizes)
+                report["bytes"] += sum(sizes)
+                if auto_commit:
+                    self.env.cr.commit()
+
+                if len(sizes) < batch_size:
+                    break
+                if time.monotonic() - start_time > time_limit:
+                    # Leave the remaining rows to the next run, as soon as possible.
+                    self.env.ref("pos_vnpay.cron_gc_expired_payment_qr")._trigger()
+                    _logger.info(
+                        "Reclaimed %(rows)s expired payment QR codes (%(bytes)s bytes).", report
+                    )
+                    return report
+
+        _logger.info("Reclaimed %(rows)s expired payment QR codes (%(bytes)s bytes).", report)
+        return report
@@ -0,0 +1,47 @@
+import json
+
+from odoo import api, fields, models
+
+
+class PaymentVNPayIPNRejection(models.Model):
+    """Log of the IPN rejected before any transaction was created for them.
+
+    The rejections are only logged if the provider is configured to, with a single insert and
+    without any chatter message, so that they stay cheap on the IPN endpoint.
+    """
+
+    _name = "payment.vnpay.ipn.rejection"
+    _description = "VNPay IPN Rejection"
+    _order = "id desc"
+
+    provider_code = fields.Char(string="Provider Code", required=True, readonly=True)
+    txn_id = fields.Char(string="Transaction ID", readonly=True, index=True)
+    code = fields.Char(string="Response Code", readonly=True)
+    reason = fields.Char(string="Reason", readonly=True)
+    payload = fields.Json(string="IPN Data", readonly=True)
+
+    @api.model
+    def _record(self, provider_code, data, code, reason):
+        """Log the rejection of an IPN.
+        Args:
+            provider_code: The code of the provider that sent the IPN
+            data: data received from the VNPay request
+            code: The response code given to VNPay
+            reason: The reason of the rejection
+        """
+        self.env.cr.execute(
+            """
+            INSERT INTO payment_vnpay_ipn_rejection (
+                provider_code, txn_id, code, reason, payload, create_uid, create_date
+            )
+            VALUES (%s, %s, %s, %s, %s, %s, NOW() AT TIME ZONE 'UTC')
+            """,
+            [
+                provider_code,
+                data.get("txnId"),
+                code,
+                reason,
+                json.dumps(data),
+                self.env.uid,
+            ],
+        )
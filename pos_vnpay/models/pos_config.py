@@ -0,0 +1,152 @@
+from odoo import _, api, fields, models, tools
+from odoo.exceptions import ValidationError
+from odoo.tools.misc import hmac
+
+# The fields of the POS overriding the VNPay-QR provider, which are cached.
+VNPAYQR_TERMINAL_FIELDS = ("vnpayqr_tmn_code", "vnpayqr_merchant_code", "vnpayqr_secret_key")
+
+
+class POSVNPayConfig(models.Model):
+    _inherit = "pos.config"
+
+    # Define the VNPay-QR terminal of the POS, to settle the payments of each store separately
+    vnpayqr_tmn_code = fields.Char(
+        string="VNPay-QR Terminal ID",
+        help="The terminal ID of the POS at VNPay. The one of the VNPay-QR provider is used if "
+        "it is not set.",
+        copy=False,
+    )
+    vnpayqr_merchant_code = fields.Char(
+        string="VNPay-QR Merchant Code",
+        help="The merchant code of the terminal, if it is not the one of the VNPay-QR provider.",
+    )
+    vnpayqr_secret_key = fields.Char(
+        string="VNPay-QR Secret Key",
+        help="The secret key of the merchant, if it is not the one of the VNPay-QR provider.",
+        groups="base.group_system",
+    )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        configs = super().create(vals_list)
+        if any(field in vals for vals in vals_list for field in VNPAYQR_TERMINAL_FIELDS):
+            # Invalidate the cached terminals, in all the workers.
+            self.env.registry.clear_cache()
+        return configs
+
+    def write(self, vals):
+        res = super().write(vals)
+        if any(field in vals for field in VNPAYQR_TERMINAL_FIELDS):
+            # Invalidate the cached terminals, in all the workers.
+            self.env.registry.clear_cache()
+        return res
+
+    def unlink(self):
+        has_terminal = any(config.vnpayqr_tmn_code for config in self)
+        res = super().unlink()
+        if has_terminal:
+            # Invalidate the cached terminals, in all the workers.
+            self.env.registry.clear_cache()
+        return res
+
+    @api.constrains(*VNPAYQR_TERMINAL_FIELDS)
+    def _check_vnpayqr_terminal(self):
+        for config in self.sudo():
+            if not config.vnpayqr_tmn_code and (
+                config.vnpayqr_merchant_code or config.vnpayqr_secret_key
+            ):
+                raise ValidationError(
+                    _(
+                        "The VNPay-QR merchant code and secret key of the POS %s only apply to "
+                        "its own terminal: set its VNPay-QR terminal ID as well.",
+                        config.name,
+                    )
+                )
+
+    @api.model
+    @tools.ormcache()
+    def _vnpayqr_get_cached_terminals(self):
+        """Return the VNPay-QR terminals of the POS, resolved once per worker.
+
+        The terminals are indexed by POS ID, for the QR codes, and by merchant code and terminal
+        ID, for the IPN. The merchant code and the secret key default to the ones of the
+        provider. If several POS share a terminal, the settings of the oldest one are used.
+
+        Note: the result is shared between requests and must not be modified.
+        Returns:
+            The terminals by POS ID, and the terminals by (merchant code, terminal ID)
+        """
+        vnpayqr = self.env["payment.provider"].sudo()._vnpay_get_cached_config("vnpayqr")
+        configs = (
+            self.sudo()
+            .with_context(active_test=False)
+            .search([("vnpayqr_tmn_code", "!=", False)], order="id")
+        )
+        terminals_by_config = {}
+        terminals_by_code = {}
+        for config in configs:
+            key = (
+                config.vnpayqr_merchant_code or vnpayqr["vnpayqr_merchant_code"],
+                config.vnpayqr_tmn_code,
+            )
+            terminals_by_config[config.id] = terminals_by_code.setdefault(
+                key,
+                {
+                    "vnpayqr_merchant_code": key[0],
+                    "vnpayqr_tmn_code": key[1],
+                    "vnpayqr_secret_key": config.vnpayqr_secret_key
+                    or vnpayqr["vnpayqr_secret_key"],
+                },
+            )
+        return terminals_by_config, terminals_by_code
+
+    def _vnpayqr_get_config(self):
+        """Get the VNPay-QR configuration of the POS: the cached configuration of the provider,
+        with the terminal of the POS if it has one.
+        Returns:
+            The configuration values, see `payment.provider._vnpay_get_cached_config`
+        """
+        vnpayqr = self.env["payment.provider"].sudo()._vnpay_get_cached_config("vnpayqr")
+        terminals_by_config = self._vnpayqr_get_cached_terminals()[0]
+        terminal = terminals_by_config.get(self.id) if len(self) == 1 else None
+        return dict(vnpayqr, **terminal) if terminal else vnpayqr
+
+    @api.model
+    def _vnpayqr_get_config_for_ipn(self, data):
+        """Get the VNPay-QR configuration of the terminal an IPN was sent for.
+        Args:
+            data: data received from the VNPay request
+        Returns:
+            The configuration values, see `_vnpayqr_get_config`; the ones of the provider if no
+            POS has the terminal
+        """
+        vnpayqr = self.env["payment.provider"].sudo()._vnpay_get_cached_config("vnpayqr")
+        terminals_by_code = self._vnpayqr_get_cached_terminals()[1]
+        terminal = terminals_by_code.get((data.get("merchantCode"), data.get("terminalId")))
+        return dict(vnpayqr, **terminal) if terminal else vnpayqr
+
+    def _get_vnpay_bus_channel(self):
+        """Get the bus channel on which the VNPay-QR payments of the POS are notified.
+
+        The channel is only protected by its name, which is derived from the database secret so
+        that it cannot be guessed from the ID of the POS.
+        Returns:
+            The name of the channel
+        """
+        self.ensure_one()
+        return f"pos_vnpay-{self.id}-{hmac(self.env, 'pos_vnpay_bus', self.id)[:32]}"
+
+    def _notify_vnpay_qr_payment(self, pos_order, txn_id):
+        """Notify the POS that a VNPay-QR payment of an order was processed.
+
+        Only the IDs are sent: the POS reads the state of the order with a safe RPC.
+        Args:
+            pos_order: The POS order
+            txn_id: The txnId of the payment
+        """
+        self.ensure_one()
+        self.env["bus.bus"]._sendone(
+            self._get_vnpay_bus_channel(),
+            "VNPAY_QR_PAYMENT",
+            {"order_id": pos_order.id, "txn_id": txn_id},
+        )
@@ -0,0 +1,17 @@
+from odoo import fields, models
+
+
+class ResConfigSettings(models.TransientModel):
+    _inherit = "res.config.settings"
+
+    pos_vnpayqr_tmn_code = fields.Char(
+        related="pos_config_id.vnpayqr_tmn_code", readonly=False
+    )
+    pos_vnpayqr_merchant_code = fields.Char(
+        related="pos_config_id.vnpayqr_merchant_code", readonly=False
+    )
+    pos_vnpayqr_secret_key = fields.Char(
+        related="pos_config_id.vnpayqr_secret_key",
+        readonly=False,
+        groups="base.group_system",
+    )
@@ -0,0 +1,53 @@
+/** @odoo-module **/
+
+import { onWillUnmount } from "@odoo/owl";
+import { patch } from "@web/core/utils/patch";
+import { OnlinePaymentPopup } from "@pos_online_payment/app/utils/online_payment_popup/online_payment_popup";
+import { VNPayPaymentWatcher } from "@pos_vnpay/js/pos_online_payment/vnpay_payment_watcher";
+
+// Close the popup as soon as the server notifies the payment of the order over the bus, and only
+// check the payment by polling the server while the bus is not connected.
+patch(OnlinePaymentPopup.prototype, {
+  setup() {
+    super.setup(...arguments);
+    const watcher = new VNPayPaymentWatcher(this.env.services.bus_service, {
+      orderId: this.props.order.server_id,
+      onNotified: async () => {
+        // Sync the payment lines with the server payments, so that the paid lines are done
+        // before the payment screen handles the result.
+        const orderServerOPData =
+          await this.props.order.update_online_payments_data_with_server(
+            this.env.services.orm,
+            0
+          );
+        this.confirmVNPayPayment(orderServerOPData);
+      },
+      onPoll: async () => {
+        // Send the amount of the QR code again, the server expects it for the payment.
+        const orderServerOPData =
+          await this.props.order.update_online_payments_data_with_server(
+            this.env.services.orm,
+            this.props.amount
+          );
+        const waitingLines = this.props.order.paymentlines.filter(
+          (line) => line.get_payment_status() === "waiting"
+        );
+        if (orderServerOPData && (orderServerOPData.is_paid || !waitingLines.length)) {
+          this.confirmVNPayPayment(orderServerOPData);
+        }
+      },
+    });
+    watcher.start();
+    onWillUnmount(() => watcher.stop());
+  },
+  /**
+   * Close the popup with the online payments data of the order, already synced with the payment
+   * lines, as the payment screen expects it.
+   */
+  confirmVNPayPayment(orderServerOPData) {
+    if (!orderServerOPData) {
+      return;
+    }
+    this.props.close({ confirmed: true, payload: orderServerOPData });
+  },
+});
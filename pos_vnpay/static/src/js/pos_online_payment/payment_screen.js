@@ -7,9 +7,39 @@ import { OnlinePaymentPopup } from "@pos_online_payment/app/utils/online_payment
 import { ConfirmPopup } from "@point_of_sale/app/utils/confirm_popup/confirm_popup";
 import { ErrorPopup } from "@point_of_sale/app/errors/popups/error_popup";
 import { floatIsZero } from "@web/core/utils/numbers";
+import { debounce } from "@web/core/utils/timing";
+import { qrCodeToSvgDataUrl } from "@pos_vnpay/js/qr_code/qr_code";
+
+// The delay between two polls of a QR code requested in background, in milliseconds.
+const VNPAY_QR_JOB_POLL_INTERVAL = 500;
+// The delay after which a QR code requested in background is given up, in milliseconds.
+const VNPAY_QR_JOB_TIMEOUT = 30000;
+// The delay after the last change of the payment lines before the QR code is created ahead of the
+// validation of the order, in milliseconds.
+const VNPAY_QR_AHEAD_DELAY = 1000;
 
 // Overide to show QR code using qrCodeData created by get_payment_qr API
 patch(PaymentScreen.prototype, {
+  setup() {
+    super.setup(...arguments);
+    this.debouncedPrepareVNPayQrCodeAhead = debounce(
+      () => this.prepareVNPayQrCodeAhead(),
+      VNPAY_QR_AHEAD_DELAY
+    );
+  },
+
+  addNewPaymentLine(paymentMethod) {
+    const result = super.addNewPaymentLine(...arguments);
+    this.debouncedPrepareVNPayQrCodeAhead();
+    return result;
+  },
+
+  updateSelectedPaymentline(amount = false) {
+    const result = super.updateSelectedPaymentline(...arguments);
+    this.debouncedPrepareVNPayQrCodeAhead();
+    return result;
+  },
+
   async _isOrderValid(isForceValidate) {
     if (!(await super._isOrderValid(...arguments))) {
       return false;
@@ -68,29 +98,20 @@ patch(PaymentScreen.prototype, {
         return false;
       }
 
-      let prevOnlinePaymentLine = null;
+      let prevOnlinePaymentLines = [];
       let lastOrderServerOPData = null;
-      for (const onlinePaymentLine of onlinePaymentLines) {
-        const onlinePaymentLineAmount = onlinePaymentLine.get_amount();
+      let remainingOnlinePaymentLines = onlinePaymentLines;
+      while (remainingOnlinePaymentLines.length > 0) {
         // The local state is not aware if the online payment has already been done.
 
-        lastOrderServerOPData =
-          await this.currentOrder.update_online_payments_data_with_server(
-            this.pos.orm,
-            onlinePaymentLineAmount
-          );
-
-        /* Overide to create QR code by calling get_payment_qr API */
-        const qrCodeData = await this.env.services.rpc(
-          "/pos/vnpay/get_payment_qr",
-          {
-            orderId: lastOrderServerOPData.id,
-            amount: onlinePaymentLineAmount,
-          }
+        /* Overide to update the online payments data and create the QR code in a single call */
+        const onlinePayment = await this.prepareVNPayOnlinePayment(
+          remainingOnlinePaymentLines
         );
+        lastOrderServerOPData = onlinePayment && onlinePayment.online_payments_data;
 
-        // Check if the order is already paid by another online payment or not receive the QR code
-        if (!lastOrderServerOPData || !qrCodeData) {
+        // Check if the online payment status of the order could be retrieved
+        if (!lastOrderServerOPData) {
           this.popup.add(ErrorPopup, {
             title: _t("Online payment unavailable"),
             body: _t(
@@ -99,37 +120,65 @@ patch(PaymentScreen.prototype, {
           });
           return false;
         }
+        if (lastOrderServerOPData.is_paid) {
+          // The order is already paid by other online payments.
+          break;
+        }
 
-        if (!lastOrderServerOPData.is_paid) {
-          if (lastOrderServerOPData.modified_payment_lines) {
-            this.cancelOnlinePayment(this.currentOrder);
-            this.showModifiedOnlinePaymentsPopup();
-            return false;
-          }
-          if (
-            (prevOnlinePaymentLine &&
-              prevOnlinePaymentLine.get_payment_status() !== "done") ||
-            !this.checkRemainingOnlinePaymentLines(
-              lastOrderServerOPData.amount_unpaid
-            )
-          ) {
-            this.cancelOnlinePayment(this.currentOrder);
-            return false;
-          }
+        // The QR code pays the next payment line
+        const qrPaymentLines = remainingOnlinePaymentLines.filter((line) =>
+          onlinePayment.payment_line_uids.includes(line.cid)
+        );
+        remainingOnlinePaymentLines = remainingOnlinePaymentLines.filter(
+          (line) => !qrPaymentLines.includes(line)
+        );
 
-          onlinePaymentLine.set_payment_status("waiting");
-          this.currentOrder.select_paymentline(onlinePaymentLine);
+        if (lastOrderServerOPData.modified_payment_lines) {
+          this.cancelOnlinePayment(this.currentOrder);
+          this.showModifiedOnlinePaymentsPopup();
+          return false;
+        }
+        if (
+          prevOnlinePaymentLines.some(
+            (line) => line.get_payment_status() !== "done"
+          ) ||
+          !this.checkRemainingOnlinePaymentLines(
+            lastOrderServerOPData.amount_unpaid
+          )
+        ) {
+          this.cancelOnlinePayment(this.currentOrder);
+          return false;
+        }
 
-          /* Overide to show QR code uing qrCodeData created by get_payment_qr API */
-          lastOrderServerOPData = await this.showOnlinePaymentQrCode(
-            qrCodeData,
-            onlinePaymentLineAmount
-          );
-          if (onlinePaymentLine.get_payment_status() === "waiting") {
-            onlinePaymentLine.set_payment_status(undefined);
+        // Check if the QR code could be created
+        const qrCodeResult =
+          onlinePayment.job && (await this.waitVNPayQrCodeJob(onlinePayment.job));
+        if (!qrCodeResult) {
+          this.popup.add(ErrorPopup, {
+            title: _t("Online payment unavailable"),
+            body: _t("The QR Code for paying could not be generated."),
+          });
+          return false;
+        }
+
+        const qrCodeData = await this.getVNPayQrCodeImage(qrCodeResult);
+
+        for (const line of qrPaymentLines) {
+          line.set_payment_status("waiting");
+        }
+        this.currentOrder.select_paymentline(qrPaymentLines[0]);
+
+        /* Overide to show QR code uing qrCodeData created by get_payment_qr API */
+        lastOrderServerOPData = await this.showOnlinePaymentQrCode(
+          qrCodeData,
+          onlinePayment.amount
+        );
+        for (const line of qrPaymentLines) {
+          if (line.get_payment_status() === "waiting") {
+            line.set_payment_status(undefined);
           }
-          prevOnlinePaymentLine = onlinePaymentLine;
         }
+        prevOnlinePaymentLines = qrPaymentLines;
       }
 
       if (!lastOrderServerOPData || !lastOrderServerOPData.is_paid) {
@@ -174,4 +223,94 @@ patch(PaymentScreen.prototype, {
 
     return true;
   },
+
+  /**
+   * Sync the draft order and start the creation of its QR code as soon as its online payment lines
+   * cover the amount due, so that the QR code is likely ready when the order is validated. The QR
+   * code is only served again if the order is validated with the same online payment lines and
+   * amounts, otherwise it is never shown and expires.
+   */
+  async prepareVNPayQrCodeAhead() {
+    const order = this.currentOrder;
+    const onlinePaymentLines = this.getRemainingOnlinePaymentLines();
+    if (
+      order.finalized ||
+      onlinePaymentLines.length === 0 ||
+      !floatIsZero(order.get_due(), this.pos.currency.decimal_places)
+    ) {
+      return;
+    }
+    try {
+      order.save_to_db();
+      this.pos.addOrderToUpdateSet();
+      await this.pos.sendDraftToServer();
+    } catch (error) {
+      // The order is sent again when it is validated.
+      console.warn("Order could not be sent ahead of its validation:", error);
+      return;
+    }
+    if (order.server_id && !order.finalized && order === this.currentOrder) {
+      await this.prepareVNPayOnlinePayment(onlinePaymentLines, true);
+    }
+  },
+
+  /**
+   * Update the online payments data of the order and start the creation of the QR code of the next
+   * online payment lines in a single call, see the prepare_online_payment API.
+   */
+  async prepareVNPayOnlinePayment(onlinePaymentLines, speculative = false) {
+    try {
+      const onlinePayment = await this.env.services.rpc(
+        "/pos/vnpay/prepare_online_payment",
+        {
+          orderId: this.currentOrder.server_id,
+          paymentLines: onlinePaymentLines.map((line) => ({
+            uid: line.cid,
+            amount: line.get_amount(),
+          })),
+          speculative,
+        },
+        { silent: speculative }
+      );
+      // Sync the payment lines with the server payments, as update_online_payments_data_with_server
+      // does with the same data.
+      onlinePayment.online_payments_data =
+        await this.currentOrder.process_online_payments_data_from_server(
+          onlinePayment.online_payments_data
+        );
+      return onlinePayment;
+    } catch (error) {
+      console.warn("Online payment could not be prepared:", error);
+      return null;
+    }
+  },
+
+  /**
+   * Wait for the QR code requested in background by a job, see the get_payment_qr_async API: no
+   * worker of the server is kept busy while VNPay answers, the QR code is polled with the token of
+   * the job.
+   */
+  async waitVNPayQrCodeJob(job) {
+    // Listen to the payment notifications of the POS, to close the popup once the QR code is paid.
+    if (job.bus_channel) {
+      this.env.services.bus_service.addChannel(job.bus_channel);
+    }
+    let result = job;
+    const deadline = Date.now() + VNPAY_QR_JOB_TIMEOUT;
+    while (result.status === "pending" && Date.now() < deadline) {
+      await new Promise((resolve) => setTimeout(resolve, VNPAY_QR_JOB_POLL_INTERVAL));
+      result = await this.env.services.rpc("/pos/vnpay/get_payment_qr_result", {
+        token: job.token,
+      });
+    }
+    return result.status === "done" ? result.qr_code : null;
+  },
+
+  /**
+   * Return the image of the QR code returned by get_payment_qr API: the QR code is drawn locally
+   * when the server only returns its payload.
+   */
+  async getVNPayQrCodeImage(qrCode) {
+    return typeof qrCode === "string" ? qrCode : qrCodeToSvgDataUrl(qrCode.qr_data);
+  },
 });
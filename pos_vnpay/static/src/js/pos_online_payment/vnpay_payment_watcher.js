@@ -0,0 +1,72 @@
+/** @odoo-module **/
+
+import { browser } from "@web/core/browser/browser";
+
+// The delay between two checks of the payment while the bus is disconnected, in milliseconds.
+export const VNPAY_SLOW_POLL_INTERVAL = 5000;
+
+/**
+ * Watch the VNPay-QR payment of an order: the server notifies the payment over the bus, and the
+ * payment is only checked by polling the server while the bus is not connected.
+ */
+export class VNPayPaymentWatcher {
+  /**
+   * @param {Object} busService
+   * @param {Object} params
+   * @param {number} params.orderId the server ID of the order
+   * @param {Function} params.onNotified called when the server notifies the payment of the order
+   * @param {Function} params.onPoll called to check the payment while the bus is not connected
+   */
+  constructor(busService, { orderId, onNotified, onPoll }) {
+    this.busService = busService;
+    this.orderId = orderId;
+    this.onNotified = onNotified;
+    this.onPoll = onPoll;
+    this.pollInterval = null;
+    this.onNotification = this.onNotification.bind(this);
+    this.startPolling = this.startPolling.bind(this);
+    this.stopPolling = this.stopPolling.bind(this);
+  }
+
+  start() {
+    this.busService.addEventListener("notification", this.onNotification);
+    this.busService.addEventListener("disconnect", this.startPolling);
+    this.busService.addEventListener("reconnect", this.stopPolling);
+    // The bus may already be disconnected, and then never notifies it again.
+    if (!this.isBusConnected()) {
+      this.startPolling();
+    }
+  }
+
+  stop() {
+    this.busService.removeEventListener("notification", this.onNotification);
+    this.busService.removeEventListener("disconnect", this.startPolling);
+    this.busService.removeEventListener("reconnect", this.stopPolling);
+    this.stopPolling();
+  }
+
+  isBusConnected() {
+    return this.busService.isActive && browser.navigator.onLine;
+  }
+
+  onNotification({ detail: notifications }) {
+    for (const { type, payload } of notifications) {
+      if (type === "VNPAY_QR_PAYMENT" && payload.order_id === this.orderId) {
+        this.onNotified();
+        return;
+      }
+    }
+  }
+
+  startPolling() {
+    if (this.pollInterval) {
+      return;
+    }
+    this.pollInterval = browser.setInterval(() => this.onPoll(), VNPAY_SLOW_POLL_INTERVAL);
+  }
+
+  stopPolling() {
+    browser.clearInterval(this.pollInterval);
+    this.pollInterval = null;
+  }
+}
@@ -0,0 +1,64 @@
+/** @odoo-module **/
+
+import { loadJS } from "@web/core/assets";
+
+/**
+ * Render the VNPay-QR payloads in the browser instead of downloading a PNG rendered by the server,
+ * with the ZXing library shipped by the web module.
+ *
+ * The text is encoded with the low error correction level, as the server rendering does
+ * (qrcode.constants.ERROR_CORRECT_L).
+ */
+
+const ZXING_LIBRARY_URL = "/web/static/lib/zxing-library/zxing-library.js";
+
+/**
+ * Encode the text in a QR code.
+ *
+ * @param {string} text
+ * @returns {Promise<boolean[][]>} the modules of the QR code by row, `true` being dark
+ */
+export async function encodeQrCode(text) {
+  await loadJS(ZXING_LIBRARY_URL);
+  const { QRCodeDecoderErrorCorrectionLevel, QRCodeEncoder } = window.ZXing;
+  const matrix = QRCodeEncoder.encode(text, QRCodeDecoderErrorCorrectionLevel.L).getMatrix();
+  const modules = [];
+  for (let y = 0; y < matrix.getHeight(); y++) {
+    const row = [];
+    for (let x = 0; x < matrix.getWidth(); x++) {
+      row.push(matrix.get(x, y) === 1);
+    }
+    modules.push(row);
+  }
+  return modules;
+}
+
+/**
+ * Render the text as a QR code, in a SVG data URL usable as an image source.
+ *
+ * @param {string} text
+ * @param {number} [border] the width of the quiet zone, in modules
+ * @returns {Promise<string>}
+ */
+export async function qrCodeToSvgDataUrl(text, border = 4) {
+  const modules = await encodeQrCode(text);
+  const size = modules.length + border * 2;
+  const path = [];
+  modules.forEach((row, y) => {
+    // Draw the runs of dark modules of the row as single rectangles.
+    for (let x = 0; x < row.length; x++) {
+      if (row[x]) {
+        const start = x;
+        while (x + 1 < row.length && row[x + 1]) {
+          x++;
+        }
+        path.push(`M${start + border} ${y + border}h${x - start + 1}v1H${start + border}z`);
+      }
+    }
+  });
+  const svg =
+    `<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 ${size} ${size}" ` +
+    `shape-rendering="crispEdges"><rect width="100%" height="100%" fill="white"/>` +
+    `<path d="${path.join("")}" fill="black"/></svg>`;
+  return "data:image/svg+xml," + encodeURIComponent(svg);
+}
@@ -0,0 +1,64 @@
+/** @odoo-module **/
+
+import { encodeQrCode, qrCodeToSvgDataUrl } from "@pos_vnpay/js/qr_code/qr_code";
+
+// Typical VNPay-QR payloads (EMVCo merchant presented mode), in alphanumeric and byte modes.
+const VNPAY_QR_PAYLOADS = [
+  "00020101021226280010A0000007750110010612345602080123456752045999530370454061500005802VN" +
+    "5910VNPAY TEST6005HANOI62440108ORDER0010311CASHIER0010708POS000016304A1B2",
+  "00020101021226280010A000000775011001234567895204581253037045409125000.005802VN5911Cua hang" +
+    " 16010Ho Chi Minh6260010612345603101234567890070800000001082100000000000000000000006304FFFF",
+];
+
+// The number of pixels per module of the images decoded by the tests.
+const SCALE = 4;
+
+/**
+ * Decode the QR code drawn by the modules, with a quiet zone of 4 modules, as a scanner would.
+ */
+function decodeModules(modules) {
+  const { BinaryBitmap, DecodeHintType, HybridBinarizer, QRCodeReader, RGBLuminanceSource } =
+    window.ZXing;
+  const border = 4;
+  const size = (modules.length + border * 2) * SCALE;
+  const luminances = new Uint8ClampedArray(size * size).fill(255);
+  modules.forEach((row, y) => {
+    row.forEach((isDark, x) => {
+      if (!isDark) {
+        return;
+      }
+      for (let dy = 0; dy < SCALE; dy++) {
+        const offset = ((y + border) * SCALE + dy) * size + (x + border) * SCALE;
+        luminances.fill(0, offset, offset + SCALE);
+      }
+    });
+  });
+  const bitmap = new BinaryBitmap(
+    new HybridBinarizer(new RGBLuminanceSource(luminances, size, size))
+  );
+  const hints = new Map([[DecodeHintType.PURE_BARCODE, true]]);
+  return new QRCodeReader().decode(bitmap, hints).getText();
+}
+
+QUnit.module("pos_vnpay qr_code");
+
+QUnit.test("the QR codes of VNPay payloads decode to the payload", async (assert) => {
+  for (const payload of VNPAY_QR_PAYLOADS) {
+    const modules = await encodeQrCode(payload);
+    // Versions 1 to 40, from 21 to 177 modules per side.
+    assert.strictEqual((modules.length - 17) % 4, 0);
+    assert.ok(modules.every((row) => row.length === modules.length));
+    assert.strictEqual(decodeModules(modules), payload);
+  }
+});
+
+QUnit.test("the QR codes are rendered as SVG data URLs with a quiet zone", async (assert) => {
+  const modules = await encodeQrCode(VNPAY_QR_PAYLOADS[0]);
+  const dataUrl = await qrCodeToSvgDataUrl(VNPAY_QR_PAYLOADS[0]);
+  assert.ok(dataUrl.startsWith("data:image/svg+xml,"));
+  const svg = decodeURIComponent(dataUrl.slice("data:image/svg+xml,".length));
+  const size = modules.length + 8;
+  assert.ok(svg.includes(`viewBox="0 0 ${size} ${size}"`));
+  // The top left finder pattern starts after the quiet zone.
+  assert.ok(svg.includes("M4 4h7v1H4z"));
+});
@@ -0,0 +1,111 @@
+/** @odoo-module **/
+
+import { EventBus } from "@odoo/owl";
+import { browser } from "@web/core/browser/browser";
+import { patchWithCleanup } from "@web/../tests/helpers/utils";
+import {
+  VNPAY_SLOW_POLL_INTERVAL,
+  VNPayPaymentWatcher,
+} from "@pos_vnpay/js/pos_online_payment/vnpay_payment_watcher";
+
+let intervals;
+
+function makeBusService(isActive = true) {
+  const bus = new EventBus();
+  return {
+    isActive,
+    addEventListener: bus.addEventListener.bind(bus),
+    removeEventListener: bus.removeEventListener.bind(bus),
+    trigger: bus.trigger.bind(bus),
+  };
+}
+
+function makeWatcher(busService, assert) {
+  return new VNPayPaymentWatcher(busService, {
+    orderId: 7,
+    onNotified: () => assert.step("notified"),
+    onPoll: () => assert.step("poll"),
+  });
+}
+
+function runIntervals() {
+  for (const { callback } of Object.values(intervals)) {
+    callback();
+  }
+}
+
+QUnit.module("pos_vnpay VNPayPaymentWatcher", {
+  beforeEach() {
+    intervals = {};
+    let nextId = 1;
+    patchWithCleanup(browser, {
+      navigator: { onLine: true },
+      setInterval: (callback, delay) => {
+        intervals[nextId] = { callback, delay };
+        return nextId++;
+      },
+      clearInterval: (id) => delete intervals[id],
+    });
+  },
+});
+
+QUnit.test("the payment is notified over the connected bus", async (assert) => {
+  const busService = makeBusService();
+  const watcher = makeWatcher(busService, assert);
+  watcher.start();
+  assert.deepEqual(intervals, {}, "the payment should not be polled");
+
+  busService.trigger("notification", [
+    { type: "VNPAY_QR_PAYMENT", payload: { order_id: 8 } },
+    { type: "OTHER", payload: { order_id: 7 } },
+  ]);
+  assert.verifySteps([]);
+  busService.trigger("notification", [{ type: "VNPAY_QR_PAYMENT", payload: { order_id: 7 } }]);
+  assert.verifySteps(["notified"]);
+
+  watcher.stop();
+  busService.trigger("notification", [{ type: "VNPAY_QR_PAYMENT", payload: { order_id: 7 } }]);
+  assert.verifySteps([]);
+});
+
+QUnit.test("the payment is polled while the bus is disconnected", async (assert) => {
+  const busService = makeBusService();
+  const watcher = makeWatcher(busService, assert);
+  watcher.start();
+
+  busService.trigger("disconnect");
+  assert.deepEqual(Object.values(intervals).map(({ delay }) => delay), [VNPAY_SLOW_POLL_INTERVAL]);
+  busService.trigger("disconnect");
+  assert.strictEqual(Object.keys(intervals).length, 1, "the payment should be polled once");
+  runIntervals();
+  assert.verifySteps(["poll"]);
+
+  busService.trigger("reconnect");
+  assert.deepEqual(intervals, {});
+  busService.trigger("disconnect");
+  watcher.stop();
+  assert.deepEqual(intervals, {});
+});
+
+QUnit.test("the payment is polled at once when the browser is offline", async (assert) => {
+  patchWithCleanup(browser.navigator, { onLine: false });
+  const watcher = makeWatcher(makeBusService(), assert);
+  watcher.start();
+
+  runIntervals();
+  assert.verifySteps(["poll"]);
+  watcher.stop();
+  assert.deepEqual(intervals, {});
+});
+
+QUnit.test("the payment is polled at once when the bus is not started", async (assert) => {
+  const busService = makeBusService(false);
+  const watcher = makeWatcher(busService, assert);
+  watcher.start();
+
+  runIntervals();
+  assert.verifySteps(["poll"]);
+  busService.trigger("reconnect");
+  assert.deepEqual(intervals, {});
+  watcher.stop();
+});
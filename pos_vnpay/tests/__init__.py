@@ -0,0 +1,7 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from . import test_pos_vnpay_benchmark
+from . import test_pos_vnpay_config
+from . import test_pos_vnpay_ipn
+from . import test_pos_vnpay_qr_gc
+from . import test_pos_vnpay_qr_job
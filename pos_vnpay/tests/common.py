@@ -0,0 +1,119 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from datetime import datetime
+
+from odoo import Command
+
+from odoo.addons.payment_vnpay.tests.vnpay_stub import (
+    QR_CREATE_PATH,
+    VNPayStubServer,
+    md5_checksum,
+)
+from odoo.addons.point_of_sale.tests.test_frontend import TestPointOfSaleHttpCommon
+
+QR_SECRET = "vnpayqrsecret"
+
+
+class POSVNPayCommon(TestPointOfSaleHttpCommon):
+    """Open a POS session paying with VNPay-QR, against a local stand-in of the VNPay-QR API."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.stub = VNPayStubServer(qr_secret=QR_SECRET).start()
+        cls.addClassCleanup(cls.stub.stop)
+
+        cls.vnpayqr = cls.env["payment.provider"].search([("code", "=", "vnpayqr")], limit=1)
+        cls.vnpayqr.write(
+            {
+                "state": "test",
+                "vnpayqr_tmn_code": "VNPAYQR1",
+                "vnpayqr_merchant_code": "0105314513",
+                "vnpayqr_merchant_name": "VNPAY TEST",
+                "vnpayqr_merchant_type": "5411",
+                "vnpayqr_app_id": "MERCHANT",
+                "vnpayqr_secret_key": QR_SECRET,
+                "vnpayqr_create_url": cls.stub.url + QR_CREATE_PATH,
+            }
+        )
+        cls.vnpayqr_pos_method = cls.env["pos.payment.method"].search(
+            [("code", "=", "vnpayqr")], limit=1
+        )
+        cls.main_pos_config.write(
+            {"payment_method_ids": [Command.link(cls.vnpayqr_pos_method.id)]}
+        )
+        cls.main_pos_config.open_ui()
+        cls.pos_session = cls.main_pos_config.current_session_id
+        cls.vnpay_product = cls.env["product.product"].create(
+            {
+                "name": "VNPay Test Product",
+                "available_in_pos": True,
+                "list_price": 100000,
+                "taxes_id": False,
+            }
+        )
+
+    def _create_order(self, amount=100000):
+        return self.env["pos.order"].create(
+            {
+                "session_id": self.pos_session.id,
+                "lines": [
+                    Command.create(
+                        {
+                            "product_id": self.vnpay_product.id,
+                            "qty": 1,
+                            "price_unit": amount,
+                            "price_subtotal": amount,
+                            "price_subtotal_incl": amount,
+                        }
+                    )
+                ],
+                "amount_tax": 0,
+                "amount_total": amount,
+                "amount_paid": 0,
+                "amount_return": 0,
+                "next_online_payment_amount": amount,
+            }
+        )
+
+    def _make_ipn_data(
+        self, txn_id, amount, qr_trace, code="00", terminal=None, secret_key=QR_SECRET
+    ):
+        """Return the IPN data of a VNPay-QR payment, signed as VNPay does.
+
+        The payment is made on the terminal of the provider, unless another one is given as its
+        (merchant code, terminal ID).
+        """
+        merchant_code, terminal_id = terminal or (
+            self.vnpayqr.vnpayqr_merchant_code,
+            self.vnpayqr.vnpayqr_tmn_code,
+        )
+        data = {
+            "code": code,
+            "message": "Tru tien thanh cong",
+            "msgType": "1",
+            "txnId": str(txn_id),
+            "qrTrace": str(qr_trace),
+            "bankCode": "NCB",
+            "mobile": "0912345678",
+            "accountNo": "",
+            "amount": str(int(amount)),
+            "payDate": datetime.now().strftime("%Y%m%d%H%M%S"),
+            "merchantCode": merchant_code,
+            "terminalId": terminal_id,
+        }
+        data["checksum"] = md5_checksum(
+            data["code"],
+            data["msgType"],
+            data["txnId"],
+            data["qrTrace"],
+            data["bankCode"],
+            data["mobile"],
+            data["accountNo"],
+            data["amount"],
+            data["payDate"],
+            data["merchantCode"],
+            secret_key,
+        )
+        return data
@@ -0,0 +1,75 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import json
+import os
+from datetime import datetime, timedelta
+
+import pytz
+
+from odoo.tests import tagged
+
+from odoo.addons.payment_vnpay.tests.common import VNPayBenchmarkMixin
+from odoo.addons.pos_vnpay.controllers.main import PaymentVNPayPortal
+from odoo.addons.pos_vnpay.tests.common import POSVNPayCommon
+
+ITERATIONS = int(os.environ.get("VNPAY_BENCH_ITERATIONS", 200))
+
+
+@tagged("-standard", "vnpay_bench", "post_install", "-at_install")
+class TestPOSVNPayBenchmark(VNPayBenchmarkMixin, POSVNPayCommon):
+    """Benchmarks of the VNPay-QR hot paths, against a local stand-in of the VNPay-QR API.
+
+    Run them against a local test database with:
+    `odoo-bin -d <db> -i pos_vnpay --test-tags vnpay_bench --stop-after-init`
+    and set `VNPAY_BENCH_OUTPUT` to collect the results as JSON lines.
+    """
+
+    def test_bench_get_payment_qr(self):
+        for qr_rendering in ("client", "server"):
+            self.vnpayqr.vnpayqr_qr_rendering = qr_rendering
+            orders = [self._create_order() for _i in range(ITERATIONS)]
+            self.bench(
+                "pos_vnpay/get_payment_qr",
+                lambda i: self.make_jsonrpc_request(
+                    PaymentVNPayPortal._create_qr_url,
+                    {"orderId": orders[i].id, "amount": 100000},
+                ),
+                ITERATIONS,
+                qr_rendering=qr_rendering,
+            )
+            # The cashier validates the same orders again, the QR codes are still valid.
+            self.bench(
+                "pos_vnpay/get_payment_qr_again",
+                lambda i: self.make_jsonrpc_request(
+                    PaymentVNPayPortal._create_qr_url,
+                    {"orderId": orders[i].id, "amount": 100000},
+                ),
+                ITERATIONS,
+                qr_rendering=qr_rendering,
+            )
+
+    def test_bench_handle_ipn_cycle(self):
+        exp_date = datetime.now(pytz.timezone("Etc/GMT-7")) + timedelta(minutes=5)
+        ipn_data = []
+        for i in range(ITERATIONS):
+            order = self._create_order()
+            order_qr = self.env["payment.qr"].create(
+                {
+                    "order_id": order.id,
+                    "amount": 100000,
+                    "exp_date": exp_date.replace(tzinfo=None),
+                    "qr_payload": "000201",
+                }
+            )
+            ipn_data.append(self._make_ipn_data(order_qr._get_txn_id(), 100000, 880000 + i))
+
+        def send_ipn(i):
+            return self.url_open(
+                PaymentVNPayPortal._pos_ipn_url,
+                data=json.dumps(ipn_data[i]),
+                headers={"Content-Type": "application/json"},
+            )
+
+        self.bench("pos_vnpay/handle_ipn", send_ipn, ITERATIONS)
+        # VNPay's retries of the same IPNs, answered from the ledger.
+        self.bench("pos_vnpay/handle_ipn_retry", send_ipn, ITERATIONS)
@@ -0,0 +1,35 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from odoo.exceptions import ValidationError
+from odoo.tests import tagged
+
+from odoo.addons.pos_vnpay.tests.common import POSVNPayCommon
+
+
+@tagged("post_install", "-at_install")
+class TestPOSVNPayConfig(POSVNPayCommon):
+    """The VNPay-QR terminals of the POS, overriding the one of the provider."""
+
+    def test_terminal_overrides_require_a_terminal(self):
+        for field in ("vnpayqr_merchant_code", "vnpayqr_secret_key"):
+            with self.subTest(field=field), self.assertRaises(ValidationError):
+                self.main_pos_config.write({field: "override"})
+
+        self.main_pos_config.write(
+            {"vnpayqr_tmn_code": "VNPAYQR2", "vnpayqr_merchant_code": "0105314599"}
+        )
+        with self.assertRaises(ValidationError):
+            self.main_pos_config.vnpayqr_tmn_code = False
+
+    def test_unlinked_terminal_is_forgotten(self):
+        config = self.env["pos.config"].create(
+            {"name": "VNPay Store 2", "vnpayqr_tmn_code": "VNPAYQR2"}
+        )
+        merchant_code = self.vnpayqr.vnpayqr_merchant_code
+        terminals_by_code = self.env["pos.config"]._vnpayqr_get_cached_terminals()[1]
+        self.assertIn((merchant_code, "VNPAYQR2"), terminals_by_code)
+
+        config.unlink()
+
+        terminals_by_code = self.env["pos.config"]._vnpayqr_get_cached_terminals()[1]
+        self.assertNotIn((merchant_code, "VNPAYQR2"), terminals_by_code)
@@ -0,0 +1,142 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import json
+from datetime import datetime, timedelta
+
+import pytz
+
+from odoo.tests import tagged
+
+from odoo.addons.pos_vnpay.controllers.main import PaymentVNPayPortal
+from odoo.addons.pos_vnpay.tests.common import POSVNPayCommon
+
+
+@tagged("post_install", "-at_install")
+class TestPOSVNPayIpn(POSVNPayCommon):
+
+    def _send_ipn(
+        self, order, amount=100000, qr_amount=None, expires_in=5, code="00", **ipn_kwargs
+    ):
+        exp_date = datetime.now(pytz.timezone("Etc/GMT-7")) + timedelta(minutes=expires_in)
+        order_qr = self.env["payment.qr"].create(
+            {
+                "order_id": order.id,
+                "amount": amount if qr_amount is None else qr_amount,
+                "exp_date": exp_date.replace(tzinfo=None),
+                "qr_payload": "000201",
+            }
+        )
+        self.env.flush_all()
+        response = self.url_open(
+            PaymentVNPayPortal._pos_ipn_url,
+            data=json.dumps(
+                self._make_ipn_data(
+                    order_qr._get_txn_id(), amount, 770001, code=code, **ipn_kwargs
+                )
+            ),
+            headers={"Content-Type": "application/json"},
+        )
+        return order_qr, response.json()
+
+    def _assert_ipn_rejected(self, order, send_ipn, code):
+        """Send the IPN and check that it is rejected without any trace of a payment."""
+        tx_count = self.env["payment.transaction"].search_count([])
+        message_count = self.env["mail.message"].search_count([])
+
+        _order_qr, res = send_ipn()
+
+        self.assertEqual(res["code"], code)
+        self.assertEqual(self.env["payment.transaction"].search_count([]), tx_count)
+        self.assertEqual(self.env["mail.message"].search_count([]), message_count)
+        self.assertFalse(self._get_bus_notifications())
+        self.assertFalse(order.payment_ids)
+
+    def _get_bus_notifications(self):
+        channel = self.main_pos_config._get_vnpay_bus_channel()
+        return [
+            json.loads(bus.message)
+            for bus in self.env["bus.bus"].sudo().search([("channel", "like", channel)])
+        ]
+
+    def test_ipn_notifies_the_pos_over_the_bus(self):
+        order = self._create_order()
+
+        order_qr, res = self._send_ipn(order)
+
+        self.assertEqual(res["code"], "00")
+        self.assertEqual(
+            self._get_bus_notifications(),
+            [
+                {
+                    "type": "VNPAY_QR_PAYMENT",
+                    "payload": {"order_id": order.id, "txn_id": order_qr._get_txn_id()},
+                }
+            ],
+        )
+        # The POS syncs its payment lines with the server payments when notified.
+        self.assertEqual(order.payment_ids.mapped("amount"), [100000])
+        self.assertEqual(order.payment_ids.payment_method_id, self.vnpayqr_pos_method)
+
+    def test_rejected_ipn_does_not_notify_the_pos(self):
+        order = self._create_order()
+
+        _order_qr, res = self._send_ipn(order, amount=90000)
+
+        self.assertNotEqual(res["code"], "00")
+        self.assertFalse(self._get_bus_notifications())
+        self.assertFalse(order.payment_ids)
+
+    def test_ipn_amount_must_match_the_qr_code(self):
+        # The order expects the amount paid, but the QR code was shown for another amount.
+        order = self._create_order()
+
+        self._assert_ipn_rejected(
+            order, lambda: self._send_ipn(order, amount=100000, qr_amount=90000), "07"
+        )
+
+    def test_ipn_amount_must_match_the_order(self):
+        order = self._create_order()
+
+        self._assert_ipn_rejected(order, lambda: self._send_ipn(order, amount=90000), "07")
+
+    def test_ipn_of_expired_qr_is_rejected(self):
+        order = self._create_order()
+
+        self._assert_ipn_rejected(order, lambda: self._send_ipn(order, expires_in=-1), "09")
+
+    def test_ipn_of_failed_payment_is_rejected(self):
+        order = self._create_order()
+
+        self._assert_ipn_rejected(order, lambda: self._send_ipn(order, code="01"), "04")
+
+    def _set_pos_terminal(self):
+        self.main_pos_config.write(
+            {
+                "vnpayqr_tmn_code": "VNPAYQR2",
+                "vnpayqr_merchant_code": "0105314599",
+                "vnpayqr_secret_key": "posqrsecret",
+            }
+        )
+        return ("0105314599", "VNPAYQR2")
+
+    def test_ipn_of_pos_terminal(self):
+        terminal = self._set_pos_terminal()
+        order = self._create_order()
+
+        _order_qr, res = self._send_ipn(order, terminal=terminal, secret_key="posqrsecret")
+
+        self.assertEqual(res["code"], "00")
+        self.assertEqual(order.payment_ids.mapped("amount"), [100000])
+
+    def test_ipn_of_another_terminal_is_rejected(self):
+        self._set_pos_terminal()
+        order = self._create_order()
+
+        # The payment is signed for the terminal of the provider, not the one of the POS.
+        self._assert_ipn_rejected(order, lambda: self._send_ipn(order), "04")
+
+    def test_ipn_of_pos_terminal_signed_by_the_provider_is_rejected(self):
+        terminal = self._set_pos_terminal()
+        order = self._create_order()
+
+        self._assert_ipn_rejected(order, lambda: self._send_ipn(order, terminal=terminal), "06")
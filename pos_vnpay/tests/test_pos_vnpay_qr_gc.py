@@ -0,0 +1,79 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import pytz
+
+from odoo.tests import tagged
+
+from odoo.addons.pos_vnpay import const
+from odoo.addons.pos_vnpay.tests.common import POSVNPayCommon
+
+
+@tagged("post_install", "-at_install")
+class TestPOSVNPayQrGc(POSVNPayCommon):
+    """The deletion of the expired payment QR codes, see `_cron_gc_expired_qr`."""
+
+    def setUp(self):
+        super().setUp()
+        self.vnpayqr.vnpayqr_qr_retention_days = 2
+        self.paid_order = self._create_order()
+        self.paid_order.state = "paid"
+        self.now = datetime.now(pytz.timezone("Etc/GMT-7")).replace(tzinfo=None)
+
+    def _create_qr(self, expired_days, order=None, provider=None):
+        return self.env["payment.qr"].create(
+            {
+                "order_id": (order or self.paid_order).id,
+                "provider_id": (self.vnpayqr if provider is None else provider).id,
+                "amount": 100000,
+                "exp_date": self.now - timedelta(days=expired_days),
+            }
+        )
+
+    def test_gc_follows_the_retention_of_the_provider(self):
+        expired_qr = self._create_qr(3)
+        recent_qr = self._create_qr(1)
+        # Without provider, the QR code keeps the default retention.
+        default_qr = self._create_qr(3, provider=self.env["payment.provider"])
+        expired_default_qr = self._create_qr(
+            const.QR_RETENTION_DAYS + 1, provider=self.env["payment.provider"]
+        )
+
+        report = self.env["payment.qr"]._cron_gc_expired_qr()
+
+        self.assertEqual(report["rows"], 2)
+        self.assertGreater(report["bytes"], 0)
+        self.assertFalse(expired_qr.exists())
+        self.assertFalse(expired_default_qr.exists())
+        self.assertEqual(recent_qr.exists(), recent_qr)
+        self.assertEqual(default_qr.exists(), default_qr)
+
+    def test_gc_keeps_the_qr_of_orders_waiting_for_their_payment(self):
+        pending_qr = self._create_qr(3, order=self._create_order())
+
+        report = self.env["payment.qr"]._cron_gc_expired_qr()
+
+        self.assertEqual(report["rows"], 0)
+        self.assertEqual(pending_qr.exists(), pending_qr)
+
+    def test_gc_deletes_in_batches(self):
+        expired_qrs = self.env["payment.qr"]
+        for _i in range(5):
+            expired_qrs |= self._create_qr(3)
+
+        cr = self.env.cr
+        with patch.object(cr, "execute", wraps=cr.execute) as execute:
+            report = self.env["payment.qr"]._cron_gc_expired_qr(batch_size=2)
+
+        self.assertEqual(report["rows"], 5)
+        self.assertFalse(expired_qrs.exists())
+        delete_params = [
+            call.args[1]
+            for call in execute.call_args_list
+            if "DELETE FROM payment_qr" in str(call.args[0])
+        ]
+        # 2 + 2 + 1 rows for the provider.
+        self.assertEqual([params[0] for params in delete_params].count(self.vnpayqr.id), 3)
+        self.assertTrue(all(params[2] == 2 for params in delete_params))
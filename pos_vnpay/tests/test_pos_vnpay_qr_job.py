@@ -0,0 +1,171 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import json
+from datetime import timedelta
+from unittest.mock import patch
+
+from odoo import fields
+from odoo.tests import tagged
+from odoo.tests.common import new_test_user
+
+from odoo.addons.payment_vnpay import http_client
+from odoo.addons.pos_vnpay.controllers.main import PaymentVNPayPortal
+from odoo.addons.pos_vnpay.tests.common import POSVNPayCommon
+
+
+@tagged("post_install", "-at_install")
+class TestPOSVNPayQrJob(POSVNPayCommon):
+    """The payment QR codes requested to VNPay in background, see `get_payment_url_async`."""
+
+    def setUp(self):
+        super().setUp()
+        self.executor = http_client.BoundedExecutor(max_workers=1, max_pending=1)
+        self.addCleanup(self.executor.close)
+        patcher = patch.object(http_client, "get_executor", return_value=self.executor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.authenticate("admin", "admin")
+
+    def _start_job(self, order):
+        """Start the job of the QR code of the order, without running it."""
+        with patch.object(PaymentVNPayPortal, "_run_payment_qr_job"):
+            return self.make_jsonrpc_request(
+                PaymentVNPayPortal._create_qr_async_url,
+                {"orderId": order.id, "amount": 100000},
+            )
+
+    def _prepare_speculative_job(self, order, amount):
+        """Start the job of the QR code requested ahead for a payment line, without running it."""
+        with patch.object(PaymentVNPayPortal, "_run_payment_qr_job"):
+            return self.make_jsonrpc_request(
+                PaymentVNPayPortal._prepare_online_payment_url,
+                {
+                    "orderId": order.id,
+                    "paymentLines": [{"uid": "line-1", "amount": amount}],
+                    "speculative": True,
+                },
+            )["job"]
+
+    def _get_job_result(self, job):
+        self.env.flush_all()
+        return self.make_jsonrpc_request(
+            PaymentVNPayPortal._qr_job_result_url, {"token": job["token"]}
+        )
+
+    def test_job_result(self):
+        job = self._start_job(self._create_order())
+        self.assertEqual(job["status"], "pending")
+        order_qr = self.env["payment.qr"].search([("job_token", "=", job["token"])])
+        self.assertTrue(order_qr)
+        self.assertEqual(self._get_job_result(job)["status"], "pending")
+
+        order_qr.qr_payload = "000201"
+        result = self._get_job_result(job)
+        self.assertEqual(result["status"], "done")
+        self.assertTrue(result["qr_code"])
+
+    def test_full_executor_drops_the_qr_code(self):
+        self.assertTrue(self.executor.reserve())
+        order = self._create_order()
+
+        self.assertIsNone(self._start_job(order))
+        self.assertFalse(self.env["payment.qr"].search([("order_id", "=", order.id)]))
+
+    def test_rolled_back_request_releases_its_slot(self):
+        cr = self.env.cr
+        self.assertTrue(PaymentVNPayPortal._schedule_payment_qr_job(cr, 0, {}, {}))
+        self.assertFalse(self.executor.reserve(), "The job must hold the slot.")
+
+        cr.postcommit.clear()
+        cr.postrollback.run()
+        self.assertTrue(self.executor.reserve(), "The rolled back job must release the slot.")
+
+    def test_failed_job_deletes_the_qr_code(self):
+        job = self._start_job(self._create_order())
+        order_qr = self.env["payment.qr"].search([("job_token", "=", job["token"])])
+        self.env.flush_all()
+
+        with patch.object(PaymentVNPayPortal, "_request_payment_qr", return_value=None):
+            PaymentVNPayPortal._run_payment_qr_job(
+                self.env.cr.dbname, order_qr.id, {}, {"txnId": order_qr._get_txn_id()}
+            )
+
+        self.assertFalse(order_qr.exists())
+        self.assertEqual(self._get_job_result(job)["status"], "failed")
+
+    def test_dead_job_is_not_served_again(self):
+        order = self._create_order()
+        job = self._start_job(order)
+        # The worker running the job died before the POS stopped waiting for it.
+        self.env.cr.execute(
+            """
+            UPDATE payment_qr
+               SET create_date = create_date - INTERVAL '1 minute'
+             WHERE job_token = %s
+            """,
+            [job["token"]],
+        )
+        self.env.invalidate_all()
+
+        self.assertEqual(self._get_job_result(job)["status"], "failed")
+        new_job = self._start_job(order)
+        self.assertNotEqual(new_job["token"], job["token"])
+
+    def test_speculative_qr_is_replaced(self):
+        order = self._create_order()
+        job = self._prepare_speculative_job(order, 100000)
+        # The cashier changes the amount of the payment line before validating the order.
+        new_job = self._prepare_speculative_job(order, 90000)
+
+        self.assertNotEqual(new_job["token"], job["token"])
+        self.assertEqual(
+            self.env["payment.qr"].search([("order_id", "=", order.id)]).mapped("amount"),
+            [90000],
+        )
+
+    def _send_jsonrpc(self, route, params):
+        """Send a JSON-RPC request and return its decoded response, errors included."""
+        response = self.url_open(
+            route,
+            data=json.dumps({"jsonrpc": "2.0", "method": "call", "id": 0, "params": params}),
+            headers={"Content-Type": "application/json"},
+        )
+        return response.json()
+
+    def test_job_requires_a_user(self):
+        order = self._create_order()
+        self.logout()
+
+        res = self._send_jsonrpc(
+            PaymentVNPayPortal._create_qr_async_url, {"orderId": order.id, "amount": 100000}
+        )
+
+        self.assertEqual(res["error"]["data"]["name"], "odoo.http.SessionExpiredException")
+        self.assertFalse(self.env["payment.qr"].search([("order_id", "=", order.id)]))
+
+    def test_job_requires_the_access_to_the_pos_session(self):
+        order = self._create_order()
+        order_qr = self.env["payment.qr"].create(
+            {
+                "order_id": order.id,
+                "amount": 100000,
+                "exp_date": fields.Datetime.now() + timedelta(days=1),
+                "job_token": "job-token",
+            }
+        )
+        new_test_user(self.env, login="no_pos", groups="base.group_user")
+        self.authenticate("no_pos", "no_pos")
+
+        with patch.object(PaymentVNPayPortal, "_schedule_payment_qr_job") as schedule:
+            res = self._send_jsonrpc(
+                PaymentVNPayPortal._create_qr_async_url,
+                {"orderId": order.id, "amount": 90000},
+            )
+        self.assertEqual(res["error"]["data"]["name"], "odoo.exceptions.AccessError")
+        schedule.assert_not_called()
+        self.assertEqual(self.env["payment.qr"].search([("order_id", "=", order.id)]), order_qr)
+
+        res = self._send_jsonrpc(
+            PaymentVNPayPortal._qr_job_result_url, {"token": order_qr.job_token}
+        )
+        self.assertEqual(res["error"]["data"]["name"], "odoo.exceptions.AccessError")